@@ -0,0 +1,174 @@
+from datetime import datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+from db import Database
+from config import logger
+
+# Таблицы, строки которых переносятся в архив; в архивной базе к ним добавляется archived_at
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.answers (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER,
+        task_id INTEGER,
+        answer_text TEXT,
+        answer_file_path TEXT,
+        sent_date TIMESTAMP,
+        first_name TEXT,
+        last_name TEXT,
+        class_number INTEGER,
+        archived_at TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_answers_task ON answers (task_id);
+
+    CREATE TABLE IF NOT EXISTS archive.user_answers (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        test_id INTEGER,
+        question_id INTEGER,
+        answer_id INTEGER,
+        text_answer TEXT,
+        attempt_number INTEGER,
+        answer_time TIMESTAMP,
+        archived_at TIMESTAMP,
+        is_correct INTEGER
+    );
+
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_user_answers_test ON user_answers (test_id, user_id);
+"""
+
+
+class ArchiveReport(NamedTuple):
+    tasks: int
+    answers: int
+    tests: int
+    user_answers: int
+    freed_pages: int
+
+
+class Archiver:
+    """
+    Переносит ответы по закрытым заданиям и тестам в отдельный файл SQLite.
+
+    Задание считается закрытым, если всем классам оно было отправлено раньше cutoff,
+    тест — если последний ответ на него дан раньше cutoff. В рабочей базе остаются
+    сводки (task_answer_summaries, test_question_summaries, user_results), а освободившиеся
+    страницы возвращаются системе через incremental vacuum (режим auto_vacuum=INCREMENTAL
+    включается при обновлении схемы, см. Database._migrate).
+    Архивная база подключается (ATTACH) только на время операции.
+    """
+
+    def __init__(self, db: Database, archive_path: Path):
+        self.db = db
+        self.archive_path = archive_path
+
+    def archive_before(self, cutoff: datetime, teacher_id: Optional[int] = None) -> ArchiveReport:
+        """Архивирует задания и тесты (все или только учителя teacher_id), закрытые до cutoff."""
+        now = datetime.now()
+
+        with self.db.get_connection() as conn:
+            conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive_path),))
+            try:
+                conn.executescript(ARCHIVE_SCHEMA)
+                # В архивах, созданных раньше, оценки ответов не было (для старых строк она неизвестна — NULL)
+                if "is_correct" not in [row[1] for row in conn.execute("PRAGMA archive.table_info(user_answers)")]:
+                    conn.execute("ALTER TABLE archive.user_answers ADD COLUMN is_correct INTEGER")
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+
+                cursor.execute("DROP TABLE IF EXISTS temp.archive_tasks")
+                cursor.execute("""
+                    CREATE TEMP TABLE archive_tasks AS
+                    SELECT t.id
+                    FROM tasks t
+                    JOIN task_assignments ta ON ta.task_id = t.id
+                    WHERE t.archived_at IS NULL AND (? IS NULL OR t.teacher_id = ?)
+                    GROUP BY t.id
+                    HAVING MAX(ta.send_date) < ?
+                """, (teacher_id, teacher_id, cutoff))
+                cursor.execute("DROP TABLE IF EXISTS temp.archive_tests")
+                cursor.execute("""
+                    CREATE TEMP TABLE archive_tests AS
+                    SELECT t.id
+                    FROM tests t
+                    JOIN user_answers ua ON ua.test_id = t.id
+                    WHERE t.archived_at IS NULL AND (? IS NULL OR t.teacher_id = ?)
+                    GROUP BY t.id
+                    HAVING MAX(ua.answer_time) < ?
+                """, (teacher_id, teacher_id, cutoff))
+
+                # Задания: сводка по классам в рабочей базе, ответы с именами учеников — в архив
+                cursor.execute("""
+                    INSERT OR REPLACE INTO task_answer_summaries (task_id, class_number, answers_count, archived_at)
+                    SELECT a.task_id, s.class_number, COUNT(*), ?
+                    FROM answers a
+                    JOIN students s ON s.id = a.student_id
+                    WHERE a.task_id IN (SELECT id FROM temp.archive_tasks)
+                    GROUP BY a.task_id, s.class_number
+                """, (now,))
+                cursor.execute("""
+                    INSERT OR REPLACE INTO archive.answers
+                    SELECT a.id, a.student_id, a.task_id, a.answer_text, a.answer_file_path, a.sent_date,
+                           s.first_name, s.last_name, s.class_number, ?
+                    FROM answers a
+                    LEFT JOIN students s ON s.id = a.student_id
+                    WHERE a.task_id IN (SELECT id FROM temp.archive_tasks)
+                """, (now,))
+                cursor.execute("DELETE FROM answers WHERE task_id IN (SELECT id FROM temp.archive_tasks)")
+                answers = cursor.rowcount
+                cursor.execute("UPDATE tasks SET archived_at = ? WHERE id IN (SELECT id FROM temp.archive_tasks)", (now,))
+                tasks = cursor.rowcount
+
+                # Тесты: статистика по вопросам в рабочей базе, ответы на вопросы — в архив
+                cursor.execute("""
+                    INSERT OR REPLACE INTO test_question_summaries
+                        (test_id, question_id, answers_count, correct_count, archived_at)
+                    SELECT ua.test_id, ua.question_id, COUNT(*),
+                           SUM(ua.is_correct), ?
+                    FROM user_answers ua
+                    WHERE ua.test_id IN (SELECT id FROM temp.archive_tests)
+                    GROUP BY ua.test_id, ua.question_id
+                """, (now,))
+                cursor.execute("""
+                    INSERT OR REPLACE INTO archive.user_answers (id, user_id, test_id, question_id, answer_id,
+                                                                 text_answer, attempt_number, answer_time,
+                                                                 archived_at, is_correct)
+                    SELECT id, user_id, test_id, question_id, answer_id, text_answer, attempt_number, answer_time, ?,
+                           is_correct
+                    FROM user_answers
+                    WHERE test_id IN (SELECT id FROM temp.archive_tests)
+                """, (now,))
+                cursor.execute("DELETE FROM user_answers WHERE test_id IN (SELECT id FROM temp.archive_tests)")
+                user_answers = cursor.rowcount
+                cursor.execute("UPDATE tests SET archived_at = ? WHERE id IN (SELECT id FROM temp.archive_tests)", (now,))
+                tests = cursor.rowcount
+
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+            freed_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("PRAGMA incremental_vacuum")
+
+        report = ArchiveReport(tasks, answers, tests, user_answers, freed_pages)
+        logger.info("Архивация до %s: %s", cutoff, report)
+        return report
+
+    def get_archived_answers(self, task_id: int) -> List[Tuple[str, str, str, str]]:
+        """Возвращает архивные ответы на задание в том же виде, что Database.get_answers_by_task."""
+        if not self.archive_path.exists():
+            return []
+        with self.db.get_connection() as conn:
+            conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive_path),))
+            try:
+                cursor = conn.execute("""
+                    SELECT answer_text, answer_file_path, first_name, last_name
+                    FROM archive.answers
+                    WHERE task_id = ?
+                """, (task_id,))
+                return cursor.fetchall()
+            finally:
+                conn.execute("DETACH DATABASE archive")
@@ -0,0 +1,93 @@
+"""
+Замер памяти, которую занимают в MemoryStorage ученики, проходящие тест.
+
+Сравниваются два формата данных FSM:
+- прежний: в каждой сессии копия списка вопросов (id, текст) и служебные поля;
+- компактный: запись TestSession, вопросы — одна общая копия TestSnapshot на процесс.
+
+Запуск: python bench_session.py [число сессий] [число вопросов]
+"""
+import asyncio
+import os
+import sys
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("ADMIN_ID", "1")
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from session_state import CachedOption, CachedQuestion, TestSession, TestSnapshot, snapshot_version
+
+QUESTION_TEXT = "Найдите значение выражения и запишите ответ в виде десятичной дроби. " * 3
+
+
+def make_snapshot(question_count: int) -> TestSnapshot:
+    questions = tuple(
+        CachedQuestion(100 + i, f"{i}. {QUESTION_TEXT}", None, "choice",
+                       tuple(CachedOption(1000 + i * 4 + j, f"Вариант {j}", None, j == 0) for j in range(4)))
+        for i in range(question_count)
+    )
+    return TestSnapshot(1, snapshot_version(questions), questions)
+
+
+def legacy_data(snapshot: TestSnapshot, user_id: int) -> dict:
+    """Данные FSM в прежнем формате — как их сохранял process_test_selection."""
+    return {
+        "test_id": snapshot.test_id,
+        # Раньше вопросы читались из базы заново для каждой сессии, и у каждой была своя копия строк.
+        # q.text[:] вернул бы тот же объект, поэтому строку собираем заново из байтов, как sqlite3.
+        "questions": [(q.id, q.text.encode("utf-8").decode("utf-8")) for q in snapshot.questions],
+        "current_index": 5,
+        "correct_answers": 3,
+        "user_id": user_id,
+        "first_name": f"Имя{user_id}",
+        "last_name": f"Фамилия{user_id}",
+        "attempt_number": 1,
+        "current_question_id": snapshot.questions[5].id,
+        "current_question_type": "choice",
+    }
+
+
+def compact_data(snapshot: TestSnapshot, user_id: int) -> dict:
+    session = TestSession(snapshot.test_id, snapshot.version, 1)
+    for i in range(5):
+        session.record_answer(i % 2 == 0)
+    return session.to_data()
+
+
+async def measure(build, snapshot: TestSnapshot, sessions: int) -> int:
+    """Возвращает прирост памяти (байт) после записи sessions сессий в MemoryStorage."""
+    storage = MemoryStorage()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(sessions):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        await storage.set_data(key, build(snapshot, user_id))
+        # Каждый ответ на вопрос — ещё один update_data
+        await storage.update_data(key, {})
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+def main(sessions: int, question_count: int) -> None:
+    snapshot = make_snapshot(question_count)
+    legacy = asyncio.run(measure(legacy_data, snapshot, sessions))
+    compact = asyncio.run(measure(compact_data, snapshot, sessions))
+
+    tracemalloc.start()
+    shared = make_snapshot(question_count)
+    snapshot_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del shared
+
+    print(f"Сессий: {sessions}, вопросов в тесте: {question_count}")
+    print(f"прежний формат     {legacy / sessions:10.0f} байт на сессию   всего {legacy / 1024:10.1f} КБ")
+    print(f"компактный формат  {compact / sessions:10.0f} байт на сессию   всего {compact / 1024:10.1f} КБ")
+    print(f"общий кэш вопросов {snapshot_size / 1024:10.1f} КБ на тест (один раз на процесс)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
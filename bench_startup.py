@@ -0,0 +1,73 @@
+"""
+Замер холодного старта вебхук-воркера.
+
+Каждый замер выполняется в отдельном процессе, чтобы кэш импортов не искажал результат:
+- время импорта основных модулей (config, db, aiogram, хендлеры, main_web);
+- время Database() на новой базе (полный DDL) и на базе с актуальной схемой.
+
+Запуск: python bench_startup.py [число прогонов]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+IMPORT_TARGETS = ["config", "db", "aiogram", "handlers.tasks", "main_web"]
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+DB_INIT_SNIPPET = """
+import time
+from db import Database
+start = time.perf_counter()
+Database()
+print(time.perf_counter() - start)
+"""
+
+
+def run_snippet(code: str, env: dict) -> float:
+    """Выполняет код в новом интерпретаторе и возвращает напечатанное им время (сек)."""
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def report(name: str, samples: list) -> None:
+    print(f"{name:<28} медиана {statistics.median(samples) * 1000:8.1f} мс   "
+          f"мин {min(samples) * 1000:8.1f} мс")
+
+
+def main(runs: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        env = dict(os.environ)
+        env.setdefault("BOT_TOKEN", "0:bench")
+        env.setdefault("ADMIN_ID", "1")
+        env["DB_NAME"] = str(db_path)
+        env["PYTHONPATH"] = str(Path(__file__).resolve().parent)
+
+        # Прогрев: компиляция .pyc и создание базы не должны попадать в замеры
+        run_snippet(IMPORT_SNIPPET.format(module="main_web"), env)
+
+        print(f"Импорт модулей ({runs} прогонов):")
+        for module in IMPORT_TARGETS:
+            report(module, [run_snippet(IMPORT_SNIPPET.format(module=module), env) for _ in range(runs)])
+
+        print("\nИнициализация Database:")
+        cold = []
+        for _ in range(runs):
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+            cold.append(run_snippet(DB_INIT_SNIPPET, env))
+        report("новая база (DDL)", cold)
+        report("схема актуальна", [run_snippet(DB_INIT_SNIPPET, env) for _ in range(runs)])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -1,6 +1,7 @@
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
+from logs import setup_logging
 import os
 
 # Загружаем переменные из .env
@@ -13,6 +14,63 @@ DB_NAME = Path(os.getenv("DB_NAME", "students.db"))
 HOMEWORKS_DIR: Path = Path(os.getenv("HOMEWORKS_DIR", "homeworks/"))
 QUESTIONS_DIR: Path = Path(os.getenv("QUESTIONS_DIR", "questions/"))
 TESTS_DIR: Path = Path(os.getenv("TESTS_DIR", "tests/"))
+# Архив ответов по закрытым заданиям и тестам прошлых лет
+ARCHIVE_DB_NAME: Path = Path(os.getenv("ARCHIVE_DB_NAME", str(DB_NAME.with_name(f"{DB_NAME.stem}_archive.db"))))
+# Снимок базы для отчётов учителя: файл, период обновления (сек) и размер порции копирования (страниц)
+REPORT_SNAPSHOT_NAME: Path = Path(os.getenv("REPORT_SNAPSHOT_NAME", str(DB_NAME.with_name(f"{DB_NAME.stem}_reports.db"))))
+REPORT_SNAPSHOT_INTERVAL: float = float(os.getenv("REPORT_SNAPSHOT_INTERVAL", "300"))
+REPORT_SNAPSHOT_PAGES: int = int(os.getenv("REPORT_SNAPSHOT_PAGES", "256"))
+
+# Многопроцессный режим: файл блокировки лидера и период попыток захватить лидерство (сек)
+SCHEDULER_LOCK_FILE: Path = Path(os.getenv("SCHEDULER_LOCK_FILE", f"{DB_NAME}.scheduler.lock"))
+LEADER_POLL_INTERVAL: float = float(os.getenv("LEADER_POLL_INTERVAL", "15"))
+# Как часто планировщик отправок перечитывает таблицу, даже если его не будили (сек)
+DELIVERY_POLL_INTERVAL: float = float(os.getenv("DELIVERY_POLL_INTERVAL", "30"))
+# За сколько часов до срока сдачи напоминать ученикам, которые ещё не сдали задание
+REMINDER_LEAD_HOURS: float = float(os.getenv("REMINDER_LEAD_HOURS", "24"))
+# Outbox: число параллельных отправителей, период опроса очереди (сек),
+# максимум попыток доставки и лимит сообщений в секунду
+OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RATE_LIMIT: float = float(os.getenv("OUTBOX_RATE_LIMIT", "25"))
+# Сколько ждать снятия блокировки записи SQLite другим процессом (сек)
+DB_BUSY_TIMEOUT: float = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+# Кэш зарегистрированных студентов: максимум записей и время жизни записи (сек)
+STUDENT_CACHE_SIZE: int = int(os.getenv("STUDENT_CACHE_SIZE", "10000"))
+STUDENT_CACHE_TTL: float = float(os.getenv("STUDENT_CACHE_TTL", "300"))
+# Кэш скомпилированных проверок текстовых ответов по ID вопроса
+MATCHER_CACHE_SIZE: int = int(os.getenv("MATCHER_CACHE_SIZE", "5000"))
+MATCHER_CACHE_TTL: float = float(os.getenv("MATCHER_CACHE_TTL", "300"))
+# Кэш вопросов тестов (общий для всех проходящих тест): максимум тестов и время жизни записи (сек)
+TEST_CACHE_SIZE: int = int(os.getenv("TEST_CACHE_SIZE", "200"))
+TEST_CACHE_TTL: float = float(os.getenv("TEST_CACHE_TTL", "600"))
+# Пул файловых операций: число потоков, размер порции чтения/записи (байт)
+# и длина очереди, при которой в лог пишется предупреждение
+FILE_IO_WORKERS: int = int(os.getenv("FILE_IO_WORKERS", "4"))
+FILE_IO_CHUNK_SIZE: int = int(os.getenv("FILE_IO_CHUNK_SIZE", "65536"))
+FILE_IO_QUEUE_WARNING: int = int(os.getenv("FILE_IO_QUEUE_WARNING", "32"))
+# Через сколько секунд рейтинг класса по тесту заново собирается из базы
+LEADERBOARD_TTL: float = float(os.getenv("LEADERBOARD_TTL", "600"))
+# API панели учителя: токен владельца бота (данные учителя 1; необязателен), адрес и порт
+# (для main.py) и число готовых ответов в кэше. Учителя получают свои токены командой
+# /dashboard_token — API работает и без DASHBOARD_TOKEN
+DASHBOARD_TOKEN: str = os.getenv("DASHBOARD_TOKEN", "")
+DASHBOARD_HOST: str = os.getenv("DASHBOARD_HOST", "127.0.0.1")
+DASHBOARD_PORT: int = int(os.getenv("DASHBOARD_PORT", "8080"))
+DASHBOARD_CACHE_SIZE: int = int(os.getenv("DASHBOARD_CACHE_SIZE", "256"))
+# Сколько ждать следующего сообщения альбома, прежде чем обработать альбом целиком (сек)
+MEDIA_GROUP_LATENCY: float = float(os.getenv("MEDIA_GROUP_LATENCY", "0.5"))
+# Логи: уровень, формат (json или text) и сколько записей в секунду пропускать с одного места
+# вызова (выборка для частых событий; предупреждения и ошибки не отбрасываются, 0 — без выборки)
+LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE: int = int(os.getenv("LOG_SAMPLE_RATE", "20"))
+# Защита от повторной доставки обновлений: сколько секунд помнить update_id и сколько ключей
+# держать в памяти процесса
+UPDATE_DEDUP_WINDOW: float = float(os.getenv("UPDATE_DEDUP_WINDOW", "600"))
+UPDATE_DEDUP_SIZE: int = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))
 
 # Проверяем, что обязательные переменные заданы
 if not BOT_TOKEN:
@@ -20,14 +78,6 @@ if not BOT_TOKEN:
 if not ADMIN_ID:
     raise ValueError("ADMIN_ID не указан в .env")
 
-# Создаём директории, если их нет
-HOMEWORKS_DIR.mkdir(exist_ok=True)
-QUESTIONS_DIR.mkdir(exist_ok=True)
-TESTS_DIR.mkdir(exist_ok=True)
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# Настройка логирования: запись в stderr через очередь отдельным потоком
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
 logger: logging.Logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import asyncio
+import hmac
+import json
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from aiohttp import web
+from cache import TTLCache
+from db import Database
+from config import logger
+
+
+class DashboardResponse(NamedTuple):
+    status: int
+    etag: Optional[str]
+    body: bytes
+
+
+class DashboardView(NamedTuple):
+    domains: Tuple[str, ...]            # области данных, от версий которых зависит ответ
+    load: Callable[..., Any]            # строит JSON-совместимый ответ: load(teacher_id, *параметры пути)
+
+
+class Dashboard:
+    """
+    Read-only JSON API для панели учителя: классы, задания со сдачей, тесты, результаты
+    и статистика по вопросам.
+
+    ETag ответа составлен из версий областей данных (таблица data_versions, её ведут триггеры),
+    поэтому на условный запрос с неизменившимися данными отвечаем 304, не выполняя отчётных
+    запросов. Готовые ответы кэшируются по (путь, ETag): каждый отчёт строится один раз на версию
+    данных, сколько бы раз ни обновляли страницу.
+    Данные относятся к одному учителю, которого определяет токен: у каждого учителя свой
+    (команда /dashboard_token), DASHBOARD_TOKEN из настроек — необязательный токен владельца
+    бота (учитель 1).
+    Сам класс не зависит от веб-фреймворка: его обслуживают aiohttp (main.py) и Flask (main_web.py).
+    """
+
+    def __init__(self, db: Database, token: str, cache_size: int = 256, cache_ttl: float = 3600.0):
+        self.db = db
+        self.token = token
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.routes: List[Tuple[re.Pattern, DashboardView]] = [
+            (re.compile(r"/api/classes"), DashboardView(("students",), self._classes)),
+            (re.compile(r"/api/tasks"), DashboardView(("students", "tasks"), self._tasks)),
+            (re.compile(r"/api/tests"), DashboardView(("tests",), self._tests)),
+            (re.compile(r"/api/tests/(\d+)/results"), DashboardView(("students", "tests"), self._test_results)),
+            (re.compile(r"/api/tests/(\d+)/questions"), DashboardView(("tests",), self._question_stats)),
+        ]
+
+    def authenticate(self, authorization: Optional[str]) -> Optional[int]:
+        """По заголовку Authorization: Bearer <токен> возвращает ID учителя (None — доступа нет)."""
+        if not authorization or not authorization.startswith("Bearer "):
+            return None
+        token = authorization[len("Bearer "):]
+        if not token:
+            return None
+        if self.token and hmac.compare_digest(token.encode(), self.token.encode()):
+            return 1
+        return self.db.get_teacher_id_by_dashboard_token(token)
+
+    def respond(self, path: str, authorization: Optional[str], if_none_match: Optional[str]) -> DashboardResponse:
+        """Обрабатывает GET-запрос к API (блокирующий вызов: выполняет запросы к базе)."""
+        teacher_id = self.authenticate(authorization)
+        if teacher_id is None:
+            return self._error(401, "unauthorized")
+        for pattern, view in self.routes:
+            match = pattern.fullmatch(path.rstrip("/"))
+            if match:
+                break
+        else:
+            return self._error(404, "not found")
+
+        versions = self.db.get_data_versions()
+        etag = '"' + "-".join(f"{domain}{versions.get(domain, 0)}" for domain in view.domains) + '"'
+        if if_none_match and (if_none_match.strip() == "*" or etag in
+                              [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+            return DashboardResponse(304, etag, b"")
+
+        key = (teacher_id, path, etag)
+        body = self.cache.get(key)
+        if body is None:
+            payload = view.load(teacher_id, *(int(arg) for arg in match.groups()))
+            if payload is None:
+                return self._error(404, "not found")
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.cache.put(key, body)
+        return DashboardResponse(200, etag, body)
+
+    @staticmethod
+    def _error(status: int, message: str) -> DashboardResponse:
+        return DashboardResponse(status, None, json.dumps({"error": message}).encode("utf-8"))
+
+    def _classes(self, teacher_id: int) -> List[Dict[str, Any]]:
+        return [{"class_number": class_number, "students": students}
+                for class_number, students in self.db.get_class_stats(teacher_id)]
+
+    def _tasks(self, teacher_id: int) -> List[Dict[str, Any]]:
+        tasks: Dict[int, Dict[str, Any]] = {}
+        for task_id, title, class_number, deadline, missing, students in \
+                self.db.get_missing_submission_counts(teacher_id):
+            task = tasks.setdefault(task_id, {"id": task_id, "title": title, "classes": []})
+            task["classes"].append({
+                "class_number": class_number,
+                "deadline": deadline,
+                "students": students,
+                "submitted": students - missing,
+                "missing": missing,
+            })
+        return list(tasks.values())
+
+    def _tests(self, teacher_id: int) -> List[Dict[str, Any]]:
+        return [
+            {"id": test_id, "title": title, "max_attempts": max_attempts, "questions": questions,
+             "participants": participants, "average_best_score": round(average, 2) if average is not None else None}
+            for test_id, title, max_attempts, participants, average, questions in self.db.get_test_stats(teacher_id)
+        ]
+
+    def _test_results(self, teacher_id: int, test_id: int) -> Optional[List[Dict[str, Any]]]:
+        if self.db.get_test(test_id, teacher_id) is None:
+            return None
+        return [
+            {"telegram_id": user_id, "first_name": first_name, "last_name": last_name,
+             "class_number": class_number, "best_score": best_score, "total": total,
+             "attempts_left": attempts_left, "completed_at": completed_at}
+            for user_id, first_name, last_name, class_number, best_score, total, attempts_left, completed_at
+            in self.db.get_test_result_rows(test_id)
+        ]
+
+    def _question_stats(self, teacher_id: int, test_id: int) -> Optional[List[Dict[str, Any]]]:
+        if self.db.get_test(test_id, teacher_id) is None:
+            return None
+        return [
+            {"id": question_id, "text": text, "type": q_type, "answers": answers, "correct": correct,
+             "correct_rate": round(correct / answers, 3) if answers else None}
+            for question_id, text, q_type, answers, correct in self.db.get_question_stats(test_id)
+        ]
+
+
+def create_dashboard_app(dashboard: Dashboard) -> web.Application:
+    """Приложение aiohttp с API панели учителя (для запуска в одном процессе с polling)."""
+
+    async def handle(request: web.Request) -> web.Response:
+        # Запросы к SQLite блокирующие — выполняем их вне цикла событий бота
+        response = await asyncio.to_thread(dashboard.respond, request.path, request.headers.get("Authorization"),
+                                           request.headers.get("If-None-Match"))
+        headers = {"Cache-Control": "private, no-cache"}
+        if response.etag:
+            headers["ETag"] = response.etag
+        if response.status == 304:
+            return web.Response(status=304, headers=headers)
+        return web.Response(status=response.status, body=response.body, headers=headers,
+                            content_type="application/json", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/api/{tail:.*}", handle)
+    return app
+
+
+async def start_dashboard(dashboard: Dashboard, host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP API панели учителя в текущем цикле событий."""
+    runner = web.AppRunner(create_dashboard_app(dashboard), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("API панели учителя запущено на http://%s:%s/api/", host, port)
+    return runner
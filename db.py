@@ -1,8 +1,32 @@
+import hashlib
+import secrets
 import sqlite3
-from typing import List, Tuple, Optional, Any
-from datetime import datetime
+from typing import List, Tuple, Optional, Any, Dict, Iterable
+from datetime import datetime, timedelta
 from pathlib import Path
-from config import DB_NAME, logger
+from cache import TTLCache
+from roster import RosterRow, generate_join_code
+from similarity import KIND_IMAGE, Fingerprint, fingerprint_answer, image_buckets
+from matcher import AnswerMatcher, normalize
+from leaderboard import LeaderboardCache
+from session_state import CachedOption, CachedQuestion, TestSnapshot, snapshot_version
+from config import ADMIN_ID, DB_NAME, DB_BUSY_TIMEOUT, STUDENT_CACHE_SIZE, STUDENT_CACHE_TTL, MATCHER_CACHE_SIZE, \
+    MATCHER_CACHE_TTL, LEADERBOARD_TTL, TEST_CACHE_SIZE, TEST_CACHE_TTL, logger
+
+# Версия схемы хранится в PRAGMA user_version. Её нужно увеличивать при любом изменении схемы
+# (новая таблица, индекс или шаг в Database._migrate) — иначе существующие базы его не увидят.
+SCHEMA_VERSION = 19
+
+# Базы, схема которых уже проверена в этом процессе
+_checked_databases = set()
+
+# Версии данных для ETag панели учителя: любое изменение этих таблиц увеличивает
+# версию своей области (триггеры создаются в Database._create_version_triggers)
+DATA_VERSION_TABLES = {
+    "students": ("students",),
+    "tasks": ("tasks", "task_assignments", "answers"),
+    "tests": ("tests", "questions", "options", "question_accepted_answers", "user_results", "user_answers"),
+}
 
 class Database:
     """Класс для работы с базой данных SQLite."""
@@ -10,36 +34,94 @@ class Database:
     def __init__(self, db_path: Path = DB_NAME):
         """Инициализация базы данных."""
         self.db_path = db_path
+        # Зарегистрированные студенты по telegram_id; незарегистрированных не кэшируем,
+        # чтобы регистрация через другой воркер была видна сразу
+        self.student_cache = TTLCache(STUDENT_CACHE_SIZE, STUDENT_CACHE_TTL)
+        # Все учителя {telegram_id: id} одной записью: таблица маленькая, а проверка нужна на каждом обновлении
+        self.teacher_cache = TTLCache(1, STUDENT_CACHE_TTL)
+        # Скомпилированные проверки ответов по question_id: строятся один раз на все попытки
+        self.matcher_cache = TTLCache(MATCHER_CACHE_SIZE, MATCHER_CACHE_TTL)
+        # Рейтинги по (класс, тест): строятся лениво и обновляются при записи результатов
+        self.leaderboards = LeaderboardCache(self.get_class_test_scores, LEADERBOARD_TTL)
+        # Вопросы тестов с вариантами: одна копия на процесс вместо копии в FSM каждого ученика
+        self.test_cache = TTLCache(TEST_CACHE_SIZE, TEST_CACHE_TTL)
         self.init_db()
 
     def get_connection(self) -> sqlite3.Connection:
         """Создаёт и возвращает соединение с базой данных."""
-        return sqlite3.connect(self.db_path)
+        return sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT)
 
     def init_db(self) -> None:
-        """Создаёт все необходимые таблицы в базе данных."""
+        """
+        Создаёт все необходимые таблицы в базе данных. Если схема уже актуальна
+        (PRAGMA user_version), DDL не выполняется — это ускоряет холодный старт воркера.
+        """
+        db_key = str(Path(self.db_path).resolve())
+        if db_key in _checked_databases:
+            return
+
         with self.get_connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == SCHEMA_VERSION:
+                _checked_databases.add(db_key)
+                return
+
+            # WAL позволяет нескольким воркерам читать параллельно с записью;
+            # режим сохраняется в самом файле базы.
+            conn.execute("PRAGMA journal_mode=WAL")
             cursor = conn.cursor()
             cursor.executescript("""
+                -- Учителя: у каждого свои классы, ученики, задания и тесты (teacher_id)
+                CREATE TABLE IF NOT EXISTS teachers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_id INTEGER UNIQUE NOT NULL,
+                    name TEXT NOT NULL,
+                    join_code TEXT UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    dashboard_token_hash TEXT
+                );
+
                 CREATE TABLE IF NOT EXISTS students (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     first_name TEXT NOT NULL,
                     last_name TEXT NOT NULL,
                     class_number INTEGER NOT NULL,
-                    telegram_id INTEGER UNIQUE NOT NULL
+                    telegram_id INTEGER UNIQUE NOT NULL,
+                    teacher_id INTEGER NOT NULL DEFAULT 1
+                );
+
+                CREATE TABLE IF NOT EXISTS student_invites (
+                    code TEXT PRIMARY KEY,
+                    first_name TEXT NOT NULL,
+                    last_name TEXT NOT NULL,
+                    class_number INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    teacher_id INTEGER NOT NULL DEFAULT 1
+                );
+
+                CREATE TABLE IF NOT EXISTS classes (
+                    teacher_id INTEGER NOT NULL,
+                    class_number INTEGER NOT NULL,
+                    student_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (teacher_id, class_number)
                 );
 
                 CREATE TABLE IF NOT EXISTS tasks (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     title TEXT NOT NULL,
                     description TEXT NOT NULL,
-                    file_path TEXT DEFAULT NULL
+                    file_path TEXT DEFAULT NULL,
+                    sent_class_count INTEGER NOT NULL DEFAULT 0,
+                    archived_at TIMESTAMP DEFAULT NULL,
+                    teacher_id INTEGER NOT NULL DEFAULT 1
                 );
                 
                 CREATE TABLE IF NOT EXISTS task_assignments (
                     task_id INTEGER,
                     class_number INTEGER,
                     send_date DATETIME,
+                    deadline TIMESTAMP DEFAULT NULL,
+                    reminded_at TIMESTAMP DEFAULT NULL,
                     PRIMARY KEY (task_id, class_number),
                     FOREIGN KEY (task_id) REFERENCES tasks(id)
                 );
@@ -53,10 +135,75 @@ class Database:
                     sent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
 
+                -- Поиск ответа ученика на задание (в том числе «кто не сдал»)
+                CREATE INDEX IF NOT EXISTS idx_answers_task_student ON answers (task_id, student_id);
+
+                -- Полнотекстовый индекс по ответам на задания (rowid = answers.id)
+                CREATE VIRTUAL TABLE IF NOT EXISTS answers_fts USING fts5(
+                    answer_text, file_names, tokenize = 'unicode61 remove_diacritics 2'
+                );
+
+                CREATE TRIGGER IF NOT EXISTS answers_fts_insert AFTER INSERT ON answers BEGIN
+                    INSERT INTO answers_fts (rowid, answer_text, file_names)
+                    VALUES (new.id, new.answer_text, REPLACE(new.answer_file_path, ';', ' '));
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS answers_fts_delete AFTER DELETE ON answers BEGIN
+                    DELETE FROM answers_fts WHERE rowid = old.id;
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS answers_fts_update AFTER UPDATE OF answer_text, answer_file_path ON answers BEGIN
+                    DELETE FROM answers_fts WHERE rowid = old.id;
+                    INSERT INTO answers_fts (rowid, answer_text, file_names)
+                    VALUES (new.id, new.answer_text, REPLACE(new.answer_file_path, ';', ' '));
+                END;
+
+                -- Отпечатки ответов (MinHash текста, dHash изображений) для поиска списанных работ
+                CREATE TABLE IF NOT EXISTS answer_fingerprints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    answer_id INTEGER REFERENCES answers(id),
+                    task_id INTEGER REFERENCES tasks(id),
+                    kind TEXT NOT NULL,
+                    signature BLOB NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_answer_fingerprints_answer ON answer_fingerprints (answer_id);
+
+                -- Корзины LSH: отпечатки из одной корзины — кандидаты в похожие
+                CREATE TABLE IF NOT EXISTS answer_lsh_buckets (
+                    task_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    fingerprint_id INTEGER NOT NULL REFERENCES answer_fingerprints(id)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_answer_lsh_buckets ON answer_lsh_buckets (task_id, kind, band, bucket);
+                CREATE INDEX IF NOT EXISTS idx_answer_lsh_buckets_fingerprint ON answer_lsh_buckets (fingerprint_id);
+
+                CREATE TRIGGER IF NOT EXISTS answer_fingerprints_delete AFTER DELETE ON answers BEGIN
+                    DELETE FROM answer_lsh_buckets WHERE fingerprint_id IN (
+                        SELECT id FROM answer_fingerprints WHERE answer_id = old.id
+                    );
+                    DELETE FROM answer_fingerprints WHERE answer_id = old.id;
+                END;
+
+                CREATE TABLE IF NOT EXISTS question_accepted_answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question_id INTEGER NOT NULL REFERENCES questions(id),
+                    answer TEXT NOT NULL,
+                    tolerance REAL NOT NULL DEFAULT 0
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_question_accepted_answers_question
+                    ON question_accepted_answers (question_id);
+
                 CREATE TABLE IF NOT EXISTS tests (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     title TEXT NOT NULL,
-                    max_attempts INTEGER DEFAULT 1
+                    max_attempts INTEGER DEFAULT 1,
+                    archived_at TIMESTAMP DEFAULT NULL,
+                    teacher_id INTEGER NOT NULL DEFAULT 1
                 );
 
                 CREATE TABLE IF NOT EXISTS questions (
@@ -96,77 +243,775 @@ class Database:
                     answer_id INTEGER DEFAULT NULL, 
                     text_answer TEXT DEFAULT NULL,   
                     attempt_number INTEGER NOT NULL,
+                    is_correct INTEGER NOT NULL DEFAULT 0,
                     answer_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY(user_id) REFERENCES students(telegram_id),
                     FOREIGN KEY(test_id) REFERENCES tests(id),
                     FOREIGN KEY(question_id) REFERENCES questions(id),
                     FOREIGN KEY(answer_id) REFERENCES options(id)
                 );
+
+                -- Ответы на тест по ученикам и попыткам (перепроверка, результаты)
+                CREATE INDEX IF NOT EXISTS idx_user_answers_test_user
+                    ON user_answers (test_id, user_id, attempt_number);
+
+                CREATE TABLE IF NOT EXISTS scheduled_deliveries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER NOT NULL REFERENCES tasks(id),
+                    class_number INTEGER NOT NULL,
+                    run_at TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_scheduled_deliveries_run_at
+                    ON scheduled_deliveries (run_at);
+
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL DEFAULT 'task',
+                    task_id INTEGER REFERENCES tasks(id),
+                    chat_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    file_path TEXT DEFAULT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_error TEXT DEFAULT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP DEFAULT NULL,
+                    UNIQUE (kind, task_id, chat_id)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt
+                    ON outbox (status, next_attempt_at);
+
+                -- Сводки по архивированным заданиям и тестам (подробности — в архивной базе)
+                CREATE TABLE IF NOT EXISTS task_answer_summaries (
+                    task_id INTEGER REFERENCES tasks(id),
+                    class_number INTEGER,
+                    answers_count INTEGER NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (task_id, class_number)
+                );
+
+                CREATE TABLE IF NOT EXISTS test_question_summaries (
+                    test_id INTEGER REFERENCES tests(id),
+                    question_id INTEGER REFERENCES questions(id),
+                    answers_count INTEGER NOT NULL,
+                    correct_count INTEGER NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (test_id, question_id)
+                );
+
+                -- Счётчики изменений по областям данных (для ETag панели учителя)
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+
+                -- Уже принятые обновления Telegram (защита от повторной доставки вебхука
+                -- при нескольких воркерах): ключ u<update_id> или c<callback_query.id>
+                CREATE TABLE IF NOT EXISTS processed_updates (
+                    key TEXT PRIMARY KEY,
+                    processed_at REAL NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_processed_updates_time ON processed_updates (processed_at);
+
+                -- Состояние FSM, общее для всех воркеров вебхука (fsm_storage.SQLiteStorage)
+                CREATE TABLE IF NOT EXISTS fsm_state (
+                    key TEXT PRIMARY KEY,
+                    state TEXT DEFAULT NULL,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID;
+
+                -- Сообщения альбомов, собираемые в вебхуке из разных воркеров (MediaGroupMiddleware)
+                CREATE TABLE IF NOT EXISTS media_group_messages (
+                    chat_id INTEGER NOT NULL,
+                    media_group_id TEXT NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    received_at REAL NOT NULL,
+                    PRIMARY KEY (chat_id, media_group_id, message_id)
+                ) WITHOUT ROWID;
             """)
+            self._create_version_triggers(conn)
+            self._migrate(conn, version)
             conn.commit()
+            _checked_databases.add(db_key)
             logger.info("База данных инициализирована")
 
-    def insert_student(self, first_name: str, last_name: str, class_number: int, telegram_id: int) -> None:
-        """Добавляет нового студента в базу данных."""
+    def _migrate(self, conn: sqlite3.Connection, version: int) -> None:
+        """Доводит схему существующей базы до SCHEMA_VERSION (ALTER TABLE и заполнение новых данных)."""
+        if version < 1:
+            # Реестр классов и счётчик классов, получивших задание
+            self._add_column(conn, "tasks", "sent_class_count", "INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_sent_class_count ON tasks (sent_class_count)")
+            conn.execute("""
+                UPDATE tasks
+                SET sent_class_count = (SELECT COUNT(*) FROM task_assignments ta WHERE ta.task_id = tasks.id)
+            """)
+            # Реестр классов заполняется на шаге 11, когда у учеников уже есть teacher_id
+
+        if version < 3:
+            # Отметки об архивации закрытых заданий и тестов
+            self._add_column(conn, "tasks", "archived_at", "TIMESTAMP DEFAULT NULL")
+            self._add_column(conn, "tests", "archived_at", "TIMESTAMP DEFAULT NULL")
+
+        if version < 4:
+            # Индексируем ответы, сохранённые до появления полнотекстового поиска
+            conn.execute("DELETE FROM answers_fts")
+            conn.execute("""
+                INSERT INTO answers_fts (rowid, answer_text, file_names)
+                SELECT id, answer_text, REPLACE(answer_file_path, ';', ' ') FROM answers
+            """)
+
+        if version < 5:
+            # Считаем отпечатки ответов, сданных до появления поиска похожих работ
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM answer_lsh_buckets")
+            cursor.execute("DELETE FROM answer_fingerprints")
+            answers = cursor.execute("SELECT id, task_id, answer_text, answer_file_path FROM answers").fetchall()
+            for answer_id, task_id, answer_text, answer_file_path in answers:
+                self._store_fingerprints(cursor, answer_id, task_id, fingerprint_answer(answer_text, answer_file_path))
+
+        if version < 6:
+            # Несколько принятых ответов на текстовый вопрос и оценка, сохранённая при ответе
+            self._add_column(conn, "user_answers", "is_correct", "INTEGER NOT NULL DEFAULT 0")
+            conn.execute("""
+                INSERT INTO question_accepted_answers (question_id, answer)
+                SELECT id, correct_text FROM questions
+                WHERE type = 'text' AND correct_text IS NOT NULL
+                  AND id NOT IN (SELECT question_id FROM question_accepted_answers)
+            """)
+            conn.execute("""
+                UPDATE user_answers SET is_correct = COALESCE((
+                    SELECT CASE WHEN o.is_correct = 1 OR LOWER(user_answers.text_answer) = LOWER(q.correct_text)
+                                THEN 1 ELSE 0 END
+                    FROM questions q
+                    LEFT JOIN options o ON o.id = user_answers.answer_id
+                    WHERE q.id = user_answers.question_id
+                ), 0)
+            """)
+
+        if version < 8:
+            # Одна строка результата на ученика и тест: сливаем дубли, оставляя лучший балл
+            # и наименьший остаток попыток, и закрепляем это уникальным индексом
+            conn.execute("""
+                UPDATE user_results
+                SET best_score = d.best_score, total = d.total, attempts_left = d.attempts_left,
+                    completed_at = d.completed_at
+                FROM (
+                    SELECT MIN(id) AS id, MAX(best_score) AS best_score, MAX(total) AS total,
+                           MIN(attempts_left) AS attempts_left, MAX(completed_at) AS completed_at
+                    FROM user_results
+                    GROUP BY user_id, test_id
+                    HAVING COUNT(*) > 1
+                ) AS d
+                WHERE user_results.id = d.id
+            """)
+            conn.execute("""
+                DELETE FROM user_results
+                WHERE id NOT IN (SELECT MIN(id) FROM user_results GROUP BY user_id, test_id)
+            """)
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_user_results_user_test ON user_results (user_id, test_id)
+            """)
+
+        if version < 9:
+            # Сроки сдачи заданий и отметка о разосланных напоминаниях
+            self._add_column(conn, "task_assignments", "deadline", "TIMESTAMP DEFAULT NULL")
+            self._add_column(conn, "task_assignments", "reminded_at", "TIMESTAMP DEFAULT NULL")
+            # Частичный индекс: только назначения, по которым ещё предстоит напомнить
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_task_assignments_deadline ON task_assignments (deadline)
+                WHERE deadline IS NOT NULL AND reminded_at IS NULL
+            """)
+
+        if version < 11:
+            # Несколько учителей в одной базе: всё, что было до этого, принадлежит владельцу бота (id 1)
+            conn.execute(
+                "INSERT OR IGNORE INTO teachers (id, telegram_id, name, join_code) VALUES (1, ?, ?, ?)",
+                (ADMIN_ID, "Учитель", generate_join_code())
+            )
+            for table in ("students", "student_invites", "tasks", "tests"):
+                self._add_column(conn, table, "teacher_id", "INTEGER NOT NULL DEFAULT 1")
+            if "teacher_id" not in [row[1] for row in conn.execute("PRAGMA table_info(classes)")]:
+                # Номер класса уникален только в пределах учителя — меняем первичный ключ
+                conn.execute("ALTER TABLE classes RENAME TO classes_old")
+                conn.execute("""
+                    CREATE TABLE classes (
+                        teacher_id INTEGER NOT NULL,
+                        class_number INTEGER NOT NULL,
+                        student_count INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (teacher_id, class_number)
+                    )
+                """)
+                conn.execute("DROP TABLE classes_old")
+            self._refresh_classes(conn.cursor())
+            # Все запросы учителя начинаются с teacher_id — он идёт первым в индексах
+            conn.execute("DROP INDEX IF EXISTS idx_students_class_number")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_students_teacher_class ON students (teacher_id, class_number)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_teacher ON tasks (teacher_id, archived_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tests_teacher ON tests (teacher_id, archived_at)")
+
+        if version < 13:
+            # Изображения раскладываются по 8 полосам вместо 4 — пересчитываем корзины по сохранённым хешам
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM answer_lsh_buckets WHERE kind = ?", (KIND_IMAGE,))
+            fingerprints = cursor.execute(
+                "SELECT id, task_id, signature FROM answer_fingerprints WHERE kind = ?", (KIND_IMAGE,)
+            ).fetchall()
+            cursor.executemany("""
+                INSERT INTO answer_lsh_buckets (task_id, kind, band, bucket, fingerprint_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(task_id, KIND_IMAGE, band, bucket, fingerprint_id)
+                  for fingerprint_id, task_id, signature in fingerprints
+                  for band, bucket in enumerate(image_buckets(signature))])
+
+        if version < 14:
+            # Свой токен API панели у каждого учителя (хранится только SHA-256 токена)
+            self._add_column(conn, "teachers", "dashboard_token_hash", "TEXT")
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_teachers_dashboard_token ON teachers (dashboard_token_hash)"
+            )
+
+        if version < 15:
+            # Один ответ на вопрос в попытке: повторное нажатие не должно записать и засчитать его дважды
+            conn.execute("""
+                DELETE FROM user_answers WHERE id NOT IN (
+                    SELECT MIN(id) FROM user_answers GROUP BY user_id, test_id, attempt_number, question_id
+                )
+            """)
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_user_answers_attempt_question
+                ON user_answers (user_id, test_id, attempt_number, question_id)
+            """)
+
+        if version < 17:
+            # Счётчик неудачных попыток отложенной отправки (повтор с растущей паузой)
+            self._add_column(conn, "scheduled_deliveries", "attempts", "INTEGER NOT NULL DEFAULT 0")
+
+        if version < 19:
+            # Место, освобождённое архивацией (archive.py), возвращается через incremental vacuum.
+            # Переключение режима требует полного VACUUM — он выполняется один раз здесь, при
+            # обновлении схемы, а не в хендлере бота. Новая база получает режим сразу.
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.commit()  # VACUUM нельзя выполнить внутри транзакции
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        logger.info("Схема базы данных обновлена с версии %s до %s", version, SCHEMA_VERSION)
+
+    def _create_version_triggers(self, conn: sqlite3.Connection) -> None:
+        """Создаёт триггеры, увеличивающие версию области данных при любом изменении её таблиц."""
+        for name, tables in DATA_VERSION_TABLES.items():
+            conn.execute("INSERT OR IGNORE INTO data_versions (name) VALUES (?)", (name,))
+            for table in tables:
+                for operation in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_version_{operation.lower()}
+                        AFTER {operation} ON {table} BEGIN
+                            UPDATE data_versions SET version = version + 1 WHERE name = '{name}';
+                        END
+                    """)
+
+    def _add_column(self, conn: sqlite3.Connection, table: str, column: str, definition: str) -> None:
+        """Добавляет столбец в таблицу, если его ещё нет (в новой базе он уже создан в init_db)."""
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def add_teacher(self, telegram_id: int, name: str) -> Tuple[int, str]:
+        """Добавляет учителя (или возвращает существующего): (id, код ссылки для учеников)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR IGNORE INTO teachers (telegram_id, name, join_code) VALUES (?, ?, ?)",
+                (telegram_id, name, generate_join_code())
+            )
+            cursor.execute("SELECT id, join_code FROM teachers WHERE telegram_id = ?", (telegram_id,))
+            teacher = cursor.fetchone()
+            conn.commit()
+        self.teacher_cache.clear()
+        logger.info("Учитель %s (%s) добавлен с ID %s", name, telegram_id, teacher[0])
+        return teacher
+
+    def get_teacher(self, teacher_id: int) -> Optional[Tuple[int, int, str, str]]:
+        """Возвращает учителя (id, telegram_id, name, join_code)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, telegram_id, name, join_code FROM teachers WHERE id = ?", (teacher_id,))
+            return cursor.fetchone()
+
+    def get_teacher_id_cached(self, telegram_id: int) -> Optional[int]:
+        """
+        Возвращает ID учителя по telegram_id (None — не учитель). Вызывается на каждом обновлении,
+        поэтому из базы раз в TTL читается вся (небольшая) таблица учителей.
+        """
+        teachers = self.teacher_cache.get("all")
+        if teachers is None:
+            with self.get_connection() as conn:
+                teachers = dict(conn.execute("SELECT telegram_id, id FROM teachers").fetchall())
+            self.teacher_cache.put("all", teachers)
+        return teachers.get(telegram_id)
+
+    def reset_dashboard_token(self, teacher_id: int) -> str:
+        """Выпускает учителю новый токен API панели (прежний перестаёт действовать) и возвращает его."""
+        token = secrets.token_urlsafe(32)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE teachers SET dashboard_token_hash = ? WHERE id = ?",
+                (hashlib.sha256(token.encode()).hexdigest(), teacher_id)
+            )
+            conn.commit()
+        logger.info("Учителю %s выпущен новый токен API панели", teacher_id)
+        return token
+
+    def get_teacher_id_by_dashboard_token(self, token: str) -> Optional[int]:
+        """Возвращает ID учителя, которому принадлежит токен API панели."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM teachers WHERE dashboard_token_hash = ?", (hashlib.sha256(token.encode()).hexdigest(),)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def get_teacher_by_join_code(self, join_code: str) -> Optional[Tuple[int, str]]:
+        """Возвращает учителя (id, name) по коду ссылки для регистрации учеников."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name FROM teachers WHERE join_code = ?", (join_code,))
+            return cursor.fetchone()
+
+    def get_default_teacher_id(self) -> Optional[int]:
+        """Возвращает ID учителя, если он единственный (тогда ученики регистрируются без ссылки)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(id), COUNT(*) FROM teachers")
+            teacher_id, count = cursor.fetchone()
+            return teacher_id if count == 1 else None
+
+    def insert_student(self, teacher_id: int, first_name: str, last_name: str, class_number: int,
+                       telegram_id: int) -> None:
+        """Добавляет нового студента учителя в базу данных."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO students (first_name, last_name, class_number, telegram_id)
-                VALUES (?, ?, ?, ?)
-            """, (first_name, last_name, class_number, telegram_id))
+                INSERT INTO students (first_name, last_name, class_number, telegram_id, teacher_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, (first_name, last_name, class_number, telegram_id, teacher_id))
+            self._add_to_class(cursor, teacher_id, class_number)
+            conn.commit()
+            self.student_cache.invalidate(telegram_id)
+            logger.info("Добавлен студент: %s %s", first_name, last_name)
+
+    def _add_to_class(self, cursor: sqlite3.Cursor, teacher_id: int, class_number: int) -> None:
+        """Учитывает нового студента в реестре классов."""
+        cursor.execute("""
+            INSERT INTO classes (teacher_id, class_number, student_count) VALUES (?, ?, 1)
+            ON CONFLICT (teacher_id, class_number) DO UPDATE SET student_count = student_count + 1
+        """, (teacher_id, class_number))
+
+    def _refresh_classes(self, cursor: sqlite3.Cursor) -> None:
+        """Пересчитывает реестр классов по таблице students (после массовых изменений)."""
+        cursor.execute("""
+            INSERT OR REPLACE INTO classes (teacher_id, class_number, student_count)
+            SELECT teacher_id, class_number, COUNT(*) FROM students GROUP BY teacher_id, class_number
+        """)
+
+    def import_students(self, teacher_id: int, rows: List[RosterRow]) -> Tuple[int, int, List[str]]:
+        """
+        Загружает список учеников учителя одной транзакцией: строки с telegram_id сразу становятся
+        студентами (уже зарегистрированные пропускаются), остальные — приглашениями.
+        Коды приглашений общие для всех учителей: если код уже занят приглашением другого учителя,
+        ничего не загружается. Возвращает (добавлено студентов, создано приглашений, занятые коды).
+        """
+        students = [(r.first_name, r.last_name, r.class_number, r.telegram_id, teacher_id)
+                    for r in rows if r.telegram_id]
+        invites = [(r.invite_code, r.first_name, r.last_name, r.class_number, teacher_id)
+                   for r in rows if not r.telegram_id]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            taken = []
+            for code, *_ in invites:
+                cursor.execute("SELECT 1 FROM student_invites WHERE code = ? AND teacher_id != ?", (code, teacher_id))
+                if cursor.fetchone():
+                    taken.append(code)
+            if taken:
+                conn.rollback()
+                return 0, 0, taken
+
+            cursor.executemany("""
+                INSERT OR IGNORE INTO students (first_name, last_name, class_number, telegram_id, teacher_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, students)
+            added = cursor.rowcount
+            # Повторная загрузка того же списка обновляет собственные приглашения учителя
+            cursor.executemany("""
+                INSERT INTO student_invites (code, first_name, last_name, class_number, teacher_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (code) DO UPDATE SET
+                    first_name = excluded.first_name, last_name = excluded.last_name,
+                    class_number = excluded.class_number, created_at = CURRENT_TIMESTAMP
+                WHERE student_invites.teacher_id = excluded.teacher_id
+            """, invites)
+            self._refresh_classes(cursor)
+            conn.commit()
+            logger.info("Импорт учеников учителя %s: добавлено %s, приглашений %s", teacher_id, added, len(invites))
+            return added, len(invites), []
+
+    def redeem_invite(self, code: str, telegram_id: int) -> Optional[Tuple[int, str, str, int, int, int]]:
+        """
+        Регистрирует пользователя по коду приглашения и удаляет приглашение.
+        Возвращает запись студента или None, если код не найден.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "SELECT first_name, last_name, class_number, teacher_id FROM student_invites WHERE code = ?", (code,)
+            )
+            invite = cursor.fetchone()
+            if not invite:
+                conn.rollback()
+                return None
+
+            first_name, last_name, class_number, teacher_id = invite
+            cursor.execute("DELETE FROM student_invites WHERE code = ?", (code,))
+            cursor.execute("""
+                INSERT INTO students (first_name, last_name, class_number, telegram_id, teacher_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, (first_name, last_name, class_number, telegram_id, teacher_id))
+            student_id = cursor.lastrowid
+            self._add_to_class(cursor, teacher_id, class_number)
             conn.commit()
-            logger.info(f"Добавлен студент: {first_name} {last_name}")
+            self.student_cache.invalidate(telegram_id)
+            logger.info("Студент %s %s зарегистрирован по приглашению", first_name, last_name)
+            return student_id, first_name, last_name, class_number, telegram_id, teacher_id
 
-    def get_student(self, telegram_id: int) -> Optional[Tuple[int, str, str, int, int]]:
-        """Возвращает данные студента по telegram_id."""
+    def get_student(self, telegram_id: int) -> Optional[Tuple[int, str, str, int, int, int]]:
+        """Возвращает данные студента по telegram_id: (id, имя, фамилия, класс, telegram_id, teacher_id)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM students WHERE telegram_id = ?", (telegram_id,))
+            cursor.execute("""
+                SELECT id, first_name, last_name, class_number, telegram_id, teacher_id
+                FROM students WHERE telegram_id = ?
+            """, (telegram_id,))
             return cursor.fetchone()
 
-    def insert_task(self, title: str, description: str, file_path: Optional[str] = None) -> int:
-        """Добавляет новое задание и возвращает его ID."""
+    def get_student_cached(self, telegram_id: int) -> Optional[Tuple[int, str, str, int, int, int]]:
+        """Возвращает данные студента по telegram_id, обращаясь к базе только при промахе кэша."""
+        student = self.student_cache.get(telegram_id)
+        if student is None:
+            student = self.get_student(telegram_id)
+            if student is not None:
+                self.student_cache.put(telegram_id, student)
+        return student
+
+    def insert_task(self, teacher_id: int, title: str, description: str, file_path: Optional[str] = None) -> int:
+        """Добавляет новое задание учителя и возвращает его ID."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO tasks (title, description, file_path) VALUES (?, ?, ?)",
-                (title, description, file_path)
+                "INSERT INTO tasks (title, description, file_path, teacher_id) VALUES (?, ?, ?, ?)",
+                (title, description, file_path, teacher_id)
             )
             conn.commit()
             task_id = cursor.lastrowid
-            logger.info(f"Создано задание: {title}, ID: {task_id}")
+            logger.info("Создано задание: %s, ID: %s", title, task_id)
             return task_id
 
     def assign_task_to_class(self, task_id: int, class_number: int) -> None:
         """Отмечает, что задание было отправлено определенному классу."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO task_assignments (task_id, class_number, send_date) VALUES (?, ?, ?)",
-                (task_id, class_number, datetime.now())
-            )
+            self._assign_task(cursor, task_id, class_number)
             conn.commit()
-            logger.info(f"Задание {task_id} назначено классу {class_number}")
+            logger.info("Задание %s назначено классу %s", task_id, class_number)
+
+    def _assign_task(self, cursor: sqlite3.Cursor, task_id: int, class_number: int) -> bool:
+        """Записывает назначение задания классу. Возвращает False, если оно уже было."""
+        cursor.execute(
+            "INSERT OR IGNORE INTO task_assignments (task_id, class_number, send_date) VALUES (?, ?, ?)",
+            (task_id, class_number, datetime.now())
+        )
+        if cursor.rowcount == 0:
+            return False
+        cursor.execute("UPDATE tasks SET sent_class_count = sent_class_count + 1 WHERE id = ?", (task_id,))
+        return True
 
-    def get_tasks_not_sent_to_all(self) -> List[Tuple[int, str]]:
+    def enqueue_task_delivery(self, task_id: int, class_number: int, text: str, file_path: Optional[str]) -> int:
         """
-        Возвращает список заданий (id, title), которые не были отправлены
-        всем существующим классам.
+        Назначает задание классу и ставит сообщения всем его ученикам в outbox одной транзакцией.
+        Повторный вызов не создаёт дублей. Возвращает число новых сообщений в очереди.
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            self._assign_task(cursor, task_id, class_number)
             cursor.execute("""
-                SELECT t.id, t.title
+                INSERT OR IGNORE INTO outbox (kind, task_id, chat_id, text, file_path)
+                SELECT 'task', t.id, s.telegram_id, ?, ?
                 FROM tasks t
-                WHERE (
-                    SELECT COUNT(DISTINCT class_number)
-                    FROM students
-                ) > (
-                    SELECT COUNT(class_number)
+                JOIN students s ON s.teacher_id = t.teacher_id AND s.class_number = ?
+                WHERE t.id = ?
+            """, (text, file_path, class_number, task_id))
+            conn.commit()
+            logger.info("Задание %s для класса %s поставлено в очередь: %s сообщений", task_id, class_number, cursor.rowcount)
+            return cursor.rowcount
+
+    def set_task_deadline(self, task_id: int, deadline: Optional[datetime],
+                          class_number: Optional[int] = None) -> int:
+        """
+        Устанавливает (или снимает, если deadline=None) срок сдачи задания для классов, которым
+        оно уже отправлено. Прежние напоминания этих классов удаляются из outbox (ещё не отправленные
+        указывали старый срок), поэтому напоминание о новом сроке будет разослано заново.
+        Напоминания, которые отправитель уже взял в работу ('sending'), не трогаем: их строку он
+        отметит после отправки.
+        Возвращает число изменённых назначений.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE task_assignments SET deadline = ?, reminded_at = NULL
+                WHERE task_id = ? AND (? IS NULL OR class_number = ?)
+            """, (deadline, task_id, class_number, class_number))
+            changed = cursor.rowcount
+            # В outbox ключ (kind, task_id, chat_id): без удаления новое напоминание не встанет в очередь
+            cursor.execute("""
+                DELETE FROM outbox
+                WHERE kind = 'reminder' AND task_id = ? AND status IN ('pending', 'failed', 'sent') AND chat_id IN (
+                    SELECT s.telegram_id
                     FROM task_assignments ta
-                    WHERE ta.task_id = t.id
+                    JOIN tasks t ON t.id = ta.task_id
+                    JOIN students s ON s.teacher_id = t.teacher_id AND s.class_number = ta.class_number
+                    WHERE ta.task_id = ? AND (? IS NULL OR ta.class_number = ?)
                 )
-            """)
+            """, (task_id, task_id, class_number, class_number))
+            conn.commit()
+            logger.info("Срок сдачи задания %s (%s): %s", task_id, class_number or 'все классы', deadline)
+            return changed
+
+    def get_missing_submission_counts(self, teacher_id: int) -> List[Tuple[int, str, int, Optional[str], int, int]]:
+        """
+        Сводка по всем открытым заданиям учителя за один запрос:
+        (task_id, title, class_number, срок сдачи, не сдали, учеников в классе).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT t.id, t.title, ta.class_number, ta.deadline,
+                       SUM(NOT EXISTS (
+                           SELECT 1 FROM answers a WHERE a.task_id = ta.task_id AND a.student_id = s.id
+                       )),
+                       COUNT(s.id)
+                FROM task_assignments ta
+                JOIN tasks t ON t.id = ta.task_id
+                JOIN students s ON s.teacher_id = t.teacher_id AND s.class_number = ta.class_number
+                WHERE t.teacher_id = ? AND t.archived_at IS NULL
+                GROUP BY ta.task_id, ta.class_number
+                ORDER BY ta.deadline IS NULL, ta.deadline, t.id, ta.class_number
+            """, (teacher_id,))
+            return cursor.fetchall()
+
+    def get_missing_submissions(self, task_id: int) -> List[Tuple[int, str, str]]:
+        """Возвращает учеников, не сдавших задание: (class_number, first_name, last_name)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT s.class_number, s.first_name, s.last_name
+                FROM task_assignments ta
+                JOIN tasks t ON t.id = ta.task_id
+                JOIN students s ON s.teacher_id = t.teacher_id AND s.class_number = ta.class_number
+                WHERE ta.task_id = ?
+                  AND NOT EXISTS (SELECT 1 FROM answers a WHERE a.task_id = ta.task_id AND a.student_id = s.id)
+                ORDER BY s.class_number, s.last_name, s.first_name
+            """, (task_id,))
+            return cursor.fetchall()
+
+    def enqueue_deadline_reminders(self, now: datetime, lead: timedelta) -> int:
+        """
+        Ставит в outbox напоминания всем, кто не сдал задания со сроком в ближайшие lead,
+        сразу по всем заданиям и классам. Каждое назначение обрабатывается один раз.
+        Возвращает число новых сообщений в очереди.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO outbox (kind, task_id, chat_id, text)
+                SELECT 'reminder', ta.task_id, s.telegram_id,
+                       'Напоминание: задание «' || t.title || '» нужно сдать до '
+                           || strftime('%d.%m.%Y %H:%M', ta.deadline) || '.'
+                FROM task_assignments ta
+                JOIN tasks t ON t.id = ta.task_id
+                JOIN students s ON s.teacher_id = t.teacher_id AND s.class_number = ta.class_number
+                WHERE ta.deadline IS NOT NULL AND ta.reminded_at IS NULL
+                  AND ta.deadline <= ? AND ta.deadline > ? AND t.archived_at IS NULL
+                  AND NOT EXISTS (SELECT 1 FROM answers a WHERE a.task_id = ta.task_id AND a.student_id = s.id)
+            """, (now + lead, now))
+            queued = cursor.rowcount
+            # Просроченные назначения тоже отмечаем, чтобы не перебирать их при каждом проходе
+            cursor.execute("""
+                UPDATE task_assignments SET reminded_at = ?
+                WHERE deadline IS NOT NULL AND reminded_at IS NULL AND deadline <= ?
+            """, (now, now + lead))
+            conn.commit()
+            if queued:
+                logger.info("Поставлено в очередь напоминаний о сроке сдачи: %s", queued)
+            return queued
+
+    def claim_outbox_batch(self, limit: int) -> List[Tuple[int, int, str, Optional[str], int]]:
+        """
+        Забирает в работу пачку готовых к отправке сообщений (id, chat_id, text, file_path, attempts),
+        помечая их статусом 'sending'.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT id, chat_id, text, file_path, attempts
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            """, (limit,))
+            batch = cursor.fetchall()
+            cursor.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?", [(row[0],) for row in batch])
+            conn.commit()
+            return batch
+
+    def mark_outbox_sent(self, message_id: int) -> None:
+        """Отмечает сообщение из outbox как доставленное."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+                (message_id,)
+            )
+            conn.commit()
+
+    def mark_outbox_retry(self, message_id: int, delay: float, error: str, count_attempt: bool = True) -> None:
+        """Возвращает сообщение в очередь с повтором не раньше чем через delay секунд."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE outbox
+                SET status = 'pending',
+                    attempts = attempts + ?,
+                    next_attempt_at = DATETIME('now', ?),
+                    last_error = ?
+                WHERE id = ?
+            """, (int(count_attempt), f"+{int(delay)} seconds", error, message_id))
+            conn.commit()
+
+    def mark_outbox_failed(self, message_id: int, error: str) -> None:
+        """Отмечает сообщение из outbox как окончательно недоставленное."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error, message_id)
+            )
+            conn.commit()
+
+    def reset_stale_outbox(self) -> int:
+        """Возвращает в очередь сообщения, застрявшие в статусе 'sending' после падения процесса."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+            conn.commit()
+            return cursor.rowcount
+
+    def insert_scheduled_deliveries(self, task_id: int, class_numbers: Iterable[int], run_at: datetime) -> List[int]:
+        """Планирует отправку задания нескольким классам одной транзакцией и возвращает ID отправок."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            delivery_ids = []
+            for class_number in class_numbers:
+                cursor.execute(
+                    "INSERT INTO scheduled_deliveries (task_id, class_number, run_at) VALUES (?, ?, ?)",
+                    (task_id, class_number, run_at)
+                )
+                delivery_ids.append(cursor.lastrowid)
+            conn.commit()
+            logger.info("Задание %s запланировано на %s, ID отправок: %s", task_id, run_at, delivery_ids)
+            return delivery_ids
+
+    def get_due_deliveries(self, now: datetime) -> List[Tuple[int, int, int, int]]:
+        """Возвращает наступившие отправки (id, task_id, class_number, неудачных попыток) в порядке времени."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, task_id, class_number, attempts
+                FROM scheduled_deliveries
+                WHERE run_at <= ?
+                ORDER BY run_at, id
+            """, (now,))
+            return cursor.fetchall()
+
+    def retry_scheduled_delivery(self, delivery_id: int, run_at: datetime) -> None:
+        """Переносит не удавшуюся отправку на run_at и увеличивает счётчик попыток."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE scheduled_deliveries SET run_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (run_at, delivery_id)
+            )
+            conn.commit()
+
+    def get_next_delivery_time(self) -> Optional[datetime]:
+        """Возвращает время ближайшей запланированной отправки."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(run_at) FROM scheduled_deliveries")
+            result = cursor.fetchone()[0]
+            return datetime.fromisoformat(result) if result else None
+
+    def get_pending_deliveries(self, teacher_id: int) -> List[Tuple[int, int, str, int, datetime]]:
+        """Возвращает ожидающие отправки заданий учителя (id, task_id, title, class_number, run_at)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT sd.id, sd.task_id, t.title, sd.class_number, sd.run_at
+                FROM scheduled_deliveries sd
+                JOIN tasks t ON t.id = sd.task_id
+                WHERE t.teacher_id = ?
+                ORDER BY sd.run_at, sd.id
+            """, (teacher_id,))
+            return [(*row[:4], datetime.fromisoformat(row[4])) for row in cursor.fetchall()]
+
+    def delete_scheduled_delivery(self, delivery_id: int, teacher_id: Optional[int] = None) -> bool:
+        """
+        Удаляет запланированную отправку (если указан teacher_id — только отправку задания этого учителя).
+        Возвращает False, если её не было.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM scheduled_deliveries
+                WHERE id = ? AND (? IS NULL OR task_id IN (SELECT id FROM tasks WHERE teacher_id = ?))
+            """, (delivery_id, teacher_id, teacher_id))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def get_tasks_not_sent_to_all(self, teacher_id: int) -> List[Tuple[int, str]]:
+        """
+        Возвращает список заданий учителя (id, title), которые не были отправлены
+        всем его классам.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, title
+                FROM tasks
+                WHERE teacher_id = ? AND archived_at IS NULL
+                  AND sent_class_count < (SELECT COUNT(*) FROM classes WHERE teacher_id = ?)
+            """, (teacher_id, teacher_id))
             return cursor.fetchall()
 
     def get_classes_for_task(self, task_id: int) -> List[int]:
@@ -177,22 +1022,26 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT DISTINCT s.class_number
-                FROM students s
-                WHERE s.class_number NOT IN (
-                    SELECT ta.class_number
+                SELECT c.class_number
+                FROM tasks t
+                JOIN classes c ON c.teacher_id = t.teacher_id
+                WHERE t.id = ? AND NOT EXISTS (
+                    SELECT 1
                     FROM task_assignments ta
-                    WHERE ta.task_id = ?
+                    WHERE ta.task_id = t.id AND ta.class_number = c.class_number
                 )
-                ORDER BY s.class_number
+                ORDER BY c.class_number
             """, (task_id,))
             return [row[0] for row in cursor.fetchall()]
 
-    def get_task(self, task_id: int) -> Optional[Tuple[int, str, str, str]]:
-        """Возвращает данные задания по ID."""
+    def get_task(self, task_id: int, teacher_id: Optional[int] = None) -> Optional[Tuple[int, str, str, str]]:
+        """Возвращает данные задания по ID (если указан teacher_id — только задания этого учителя)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
+            cursor.execute("""
+                SELECT id, title, description, file_path FROM tasks
+                WHERE id = ? AND (? IS NULL OR teacher_id = ?)
+            """, (task_id, teacher_id, teacher_id))
             return cursor.fetchone()
 
     def get_students_by_class(self, class_number: int) -> List[Tuple[int]]:
@@ -202,27 +1051,95 @@ class Database:
             cursor.execute("SELECT telegram_id FROM students WHERE class_number = ?", (class_number,))
             return cursor.fetchall()
 
-    def get_student_names_by_class(self, class_number: int) -> List[Tuple[str, str]]:
-        """Возвращает список студентов (имя, фамилия) по номеру класса."""
+    def get_student_names_by_class(self, teacher_id: int, class_number: int) -> List[Tuple[str, str]]:
+        """Возвращает список студентов учителя (имя, фамилия) по номеру класса."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT first_name, last_name
                 FROM students
-                WHERE class_number = ?
-            """, (class_number,))
+                WHERE teacher_id = ? AND class_number = ?
+            """, (teacher_id, class_number))
             return cursor.fetchall()
 
-    def insert_answer(self, student_id: int, task_id: int, answer_text: Optional[str], answer_file_path: Optional[str]) -> None:
-        """Добавляет ответ студента на задание."""
+    def insert_answer(self, student_id: int, task_id: int, answer_text: Optional[str], answer_file_path: Optional[str]) -> bool:
+        """
+        Добавляет ответ студента на задание вместе с отпечатками для поиска похожих работ.
+        Возвращает False, если студент уже сдавал это задание (проверка и вставка — один запрос).
+        """
+        # Хеши считаем до открытия транзакции, чтобы не держать блокировку на чтении картинок
+        fingerprints = fingerprint_answer(answer_text, answer_file_path)
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO answers (student_id, task_id, answer_text, answer_file_path)
-                VALUES (?, ?, ?, ?)
-            """, (student_id, task_id, answer_text, answer_file_path))
+                SELECT ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM answers WHERE task_id = ? AND student_id = ?)
+            """, (student_id, task_id, answer_text, answer_file_path, task_id, student_id))
+            if cursor.rowcount == 0:
+                return False
+            self._store_fingerprints(cursor, cursor.lastrowid, task_id, fingerprints)
             conn.commit()
-            logger.info(f"Добавлен ответ на задание {task_id} от студента {student_id}")
+            logger.info("Добавлен ответ на задание %s от студента %s", task_id, student_id,
+                        extra={"task_id": task_id, "student_id": student_id})
+            return True
+
+    def _store_fingerprints(self, cursor: sqlite3.Cursor, answer_id: int, task_id: int,
+                            fingerprints: List[Fingerprint]) -> None:
+        """Сохраняет отпечатки ответа и раскладывает их по корзинам LSH."""
+        for fingerprint in fingerprints:
+            cursor.execute("""
+                INSERT INTO answer_fingerprints (answer_id, task_id, kind, signature)
+                VALUES (?, ?, ?, ?)
+            """, (answer_id, task_id, fingerprint.kind, fingerprint.signature))
+            fingerprint_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO answer_lsh_buckets (task_id, kind, band, bucket, fingerprint_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(task_id, fingerprint.kind, band, bucket, fingerprint_id)
+                  for band, bucket in enumerate(fingerprint.buckets)])
+
+    def get_similar_answer_candidates(self, task_id: int) -> List[Tuple[int, int, str, bytes, bytes]]:
+        """
+        Возвращает пары отпечатков разных учеников, попавшие хотя бы в одну общую корзину LSH:
+        (answer_id, answer_id, вид, подпись, подпись). Сравниваются только такие пары, а не все со всеми.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                WITH pairs AS (
+                    SELECT DISTINCT b1.fingerprint_id AS first_id, b2.fingerprint_id AS second_id
+                    FROM answer_lsh_buckets b1
+                    JOIN answer_lsh_buckets b2
+                      ON b2.task_id = b1.task_id AND b2.kind = b1.kind
+                     AND b2.band = b1.band AND b2.bucket = b1.bucket
+                     AND b2.fingerprint_id > b1.fingerprint_id
+                    WHERE b1.task_id = ?
+                )
+                SELECT f1.answer_id, f2.answer_id, f1.kind, f1.signature, f2.signature
+                FROM pairs
+                JOIN answer_fingerprints f1 ON f1.id = pairs.first_id
+                JOIN answer_fingerprints f2 ON f2.id = pairs.second_id
+                JOIN answers a1 ON a1.id = f1.answer_id
+                JOIN answers a2 ON a2.id = f2.answer_id
+                WHERE a1.student_id != a2.student_id
+            """, (task_id,))
+            return cursor.fetchall()
+
+    def get_answer_authors(self, answer_ids: List[int]) -> dict:
+        """Возвращает {answer_id: (имя, фамилия, класс)} для указанных ответов."""
+        if not answer_ids:
+            return {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(answer_ids))
+            cursor.execute(f"""
+                SELECT a.id, s.first_name, s.last_name, s.class_number
+                FROM answers a
+                JOIN students s ON a.student_id = s.id
+                WHERE a.id IN ({placeholders})
+            """, answer_ids)
+            return {row[0]: row[1:] for row in cursor.fetchall()}
 
     def get_answers_by_task(self, task_id: int) -> List[Tuple[str, str, str, str]]:
         """Возвращает ответы на задание с именами студентов."""
@@ -248,58 +1165,151 @@ class Database:
             """, (task_id, student_id))
             return cursor.fetchall()
 
-    def get_unique_classes(self) -> List[int]:
-        """Возвращает список уникальных номеров классов из таблицы students."""
+    def search_answers(self, teacher_id: int, query: str, task_id: Optional[int] = None,
+                       class_number: Optional[int] = None, limit: int = 5,
+                       offset: int = 0) -> Tuple[int, List[Tuple[int, str, str, str, int, str]]]:
+        """
+        Ищет ответы учеников учителя по тексту и именам файлов через FTS5, лучшие совпадения первыми (bm25).
+        query — выражение FTS5. Возвращает (всего найдено,
+        [(answer_id, название задания, имя, фамилия, класс, фрагмент с подсветкой)]).
+        """
+        conditions = ["answers_fts MATCH ?", "s.teacher_id = ?"]
+        params: List[Any] = [query, teacher_id]
+        if task_id is not None:
+            conditions.append("a.task_id = ?")
+            params.append(task_id)
+        if class_number is not None:
+            conditions.append("s.class_number = ?")
+            params.append(class_number)
+        where = " AND ".join(conditions)
+
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT class_number FROM students ORDER BY class_number")
+            cursor.execute(f"""
+                SELECT COUNT(*)
+                FROM answers_fts
+                JOIN answers a ON a.id = answers_fts.rowid
+                JOIN students s ON s.id = a.student_id
+                WHERE {where}
+            """, params)
+            total = cursor.fetchone()[0]
+            cursor.execute(f"""
+                SELECT a.id, t.title, s.first_name, s.last_name, s.class_number,
+                       snippet(answers_fts, -1, '«', '»', '…', 12)
+                FROM answers_fts
+                JOIN answers a ON a.id = answers_fts.rowid
+                JOIN students s ON s.id = a.student_id
+                JOIN tasks t ON t.id = a.task_id
+                WHERE {where}
+                ORDER BY bm25(answers_fts)
+                LIMIT ? OFFSET ?
+            """, params + [limit, offset])
+            return total, cursor.fetchall()
+
+    def get_unique_classes(self, teacher_id: int) -> List[int]:
+        """Возвращает список номеров классов учителя, в которых есть студенты."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT class_number FROM classes WHERE teacher_id = ? ORDER BY class_number", (teacher_id,))
             return [row[0] for row in cursor.fetchall()]
 
-    def get_tasks_for_student_class(self, telegram_id: int) -> List[Tuple[int, str]]:
+    def get_student_tasks(self, teacher_id: int, student_id: int,
+                          class_number: int) -> List[Tuple[int, str, Optional[str], int]]:
         """
-        Возвращает список заданий (id, title), назначенных классу, в котором учится студент.
+        Возвращает задания учителя, назначенные классу ученика, со статусом сдачи одним запросом:
+        (id, title, срок сдачи, сдано ли). Сначала несданные.
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT t.id, t.title
-                FROM tasks t
-                JOIN task_assignments ta ON t.id = ta.task_id
-                JOIN students s ON ta.class_number = s.class_number
-                WHERE s.telegram_id = ?
-                ORDER BY t.id DESC
-            """, (telegram_id,))
+                SELECT t.id, t.title, ta.deadline,
+                       EXISTS (SELECT 1 FROM answers a WHERE a.task_id = t.id AND a.student_id = ?) AS submitted
+                FROM task_assignments ta
+                JOIN tasks t ON t.id = ta.task_id
+                WHERE ta.class_number = ? AND t.teacher_id = ? AND t.archived_at IS NULL
+                ORDER BY submitted, ta.deadline IS NULL, ta.deadline, t.id DESC
+            """, (student_id, class_number, teacher_id))
             return cursor.fetchall()
 
-    def get_all_tasks(self) -> List[Tuple[int, str]]:
-        """Возвращает список всех созданных заданий (id, title)."""
+    def get_all_tasks(self, teacher_id: int) -> List[Tuple[int, str]]:
+        """Возвращает список всех заданий учителя (id, title)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, title FROM tasks ORDER BY id DESC")
+            cursor.execute("SELECT id, title FROM tasks WHERE teacher_id = ? ORDER BY id DESC", (teacher_id,))
             return cursor.fetchall()
 
-    def insert_test(self, title: str, max_attempts: int) -> int:
-        """Добавляет новый тест и возвращает его ID."""
+    def insert_test(self, teacher_id: int, title: str, max_attempts: int) -> int:
+        """Добавляет новый тест учителя и возвращает его ID."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("INSERT INTO tests (title, max_attempts) VALUES (?, ?)", (title, max_attempts))
+            cursor.execute(
+                "INSERT INTO tests (title, max_attempts, teacher_id) VALUES (?, ?, ?)", (title, max_attempts, teacher_id)
+            )
             conn.commit()
             test_id = cursor.lastrowid
-            logger.info(f"Создан тест: {title}, ID: {test_id}")
+            logger.info("Создан тест: %s, ID: %s", title, test_id)
+            return test_id
+
+    def import_test(self, teacher_id: int, title: str, max_attempts: int, questions: List[dict]) -> int:
+        """
+        Создаёт тест учителя со всеми вопросами и вариантами ответов одной транзакцией.
+        Вопросы — словари с ключами text, type, file, answers [(ответ, погрешность)]
+        и options (text, image, is_correct).
+        Возвращает ID теста.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO tests (title, max_attempts, teacher_id) VALUES (?, ?, ?)", (title, max_attempts, teacher_id)
+            )
+            test_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO questions (test_id, text, file_path, type, correct_text)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (test_id, q["text"], q["file"], q["type"], normalize(q["answers"][0][0]) if q["answers"] else None)
+                for q in questions
+            ])
+            # В рамках одной транзакции id вопросов идут в порядке вставки
+            cursor.execute("SELECT id FROM questions WHERE test_id = ? ORDER BY id", (test_id,))
+            question_ids = [row[0] for row in cursor.fetchall()]
+            cursor.executemany("""
+                INSERT INTO options (question_id, text, image_path, is_correct)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (question_id, opt["text"], opt["image"], opt["is_correct"])
+                for question_id, q in zip(question_ids, questions)
+                for opt in q["options"]
+            ])
+            cursor.executemany("""
+                INSERT INTO question_accepted_answers (question_id, answer, tolerance)
+                VALUES (?, ?, ?)
+            """, [
+                (question_id, answer, tolerance)
+                for question_id, q in zip(question_ids, questions)
+                for answer, tolerance in q["answers"]
+            ])
+            conn.commit()
+            logger.info("Импортирован тест: %s, ID: %s, вопросов: %s", title, test_id, len(questions))
             return test_id
 
-    def get_test(self, test_id: int) -> Optional[Tuple[int, str, int]]:
-        """Возвращает данные теста по ID."""
+    def get_test(self, test_id: int, teacher_id: Optional[int] = None) -> Optional[Tuple[int, str, int]]:
+        """Возвращает данные теста по ID (если указан teacher_id — только тесты этого учителя)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, title, max_attempts FROM tests WHERE id = ?", (test_id,))
+            cursor.execute("""
+                SELECT id, title, max_attempts FROM tests
+                WHERE id = ? AND (? IS NULL OR teacher_id = ?)
+            """, (test_id, teacher_id, teacher_id))
             return cursor.fetchone()
 
-    def get_tests(self) -> List[Tuple[int, str, int]]:
-        """Возвращает список тестов (id, title, max_attempts)."""
+    def get_tests(self, teacher_id: int) -> List[Tuple[int, str, int]]:
+        """Возвращает список тестов учителя (id, title, max_attempts)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, title, max_attempts FROM tests")
+            cursor.execute(
+                "SELECT id, title, max_attempts FROM tests WHERE teacher_id = ? AND archived_at IS NULL", (teacher_id,)
+            )
             return cursor.fetchall()
 
     def insert_question(self, test_id: int, text: str, file_path: Optional[str], q_type: str) -> int:
@@ -312,16 +1322,26 @@ class Database:
             """, (test_id, text, file_path, q_type))
             conn.commit()
             question_id = cursor.lastrowid
-            logger.info(f"Добавлен вопрос к тесту {test_id}, ID: {question_id}")
+            self.test_cache.invalidate(test_id)
+            logger.info("Добавлен вопрос к тесту %s, ID: %s", test_id, question_id)
             return question_id
 
-    def update_question_correct_text(self, question_id: int, correct_text: str) -> None:
-        """Обновляет правильный текстовый ответ для вопроса."""
+    def set_question_answers(self, question_id: int, accepted: List[Tuple[str, float]]) -> None:
+        """
+        Заменяет принятые ответы на текстовый вопрос списком (ответ, погрешность).
+        В correct_text остаётся первый ответ — для отображения.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("UPDATE questions SET correct_text = ? WHERE id = ?", (correct_text.lower().strip(), question_id))
+            cursor.execute("DELETE FROM question_accepted_answers WHERE question_id = ?", (question_id,))
+            cursor.executemany("""
+                INSERT INTO question_accepted_answers (question_id, answer, tolerance)
+                VALUES (?, ?, ?)
+            """, [(question_id, answer, tolerance) for answer, tolerance in accepted])
+            cursor.execute("UPDATE questions SET correct_text = ? WHERE id = ?", (normalize(accepted[0][0]), question_id))
             conn.commit()
-            logger.info(f"Обновлён правильный ответ для вопроса {question_id}")
+            self.matcher_cache.invalidate(question_id)
+            logger.info("Обновлены правильные ответы для вопроса %s: %s", question_id, len(accepted))
 
     def insert_option(self, question_id: int, text: Optional[str], image_path: Optional[str], is_correct: bool) -> None:
         """Добавляет вариант ответа для вопроса."""
@@ -332,7 +1352,10 @@ class Database:
                 VALUES (?, ?, ?, ?)
             """, (question_id, text, image_path, is_correct))
             conn.commit()
-            logger.info(f"Добавлен вариант ответа для вопроса {question_id}")
+            test_id = cursor.execute("SELECT test_id FROM questions WHERE id = ?", (question_id,)).fetchone()
+            if test_id:
+                self.test_cache.invalidate(test_id[0])
+            logger.info("Добавлен вариант ответа для вопроса %s", question_id)
 
     def get_questions_by_test(self, test_id: int) -> List[Tuple[int, str]]:
         """Возвращает вопросы теста (id, text)."""
@@ -355,6 +1378,37 @@ class Database:
             cursor.execute("SELECT id, text, image_path FROM options WHERE question_id = ?", (question_id,))
             return cursor.fetchall()
 
+    def get_test_snapshot(self, test_id: int) -> Optional[TestSnapshot]:
+        """Возвращает вопросы теста с вариантами ответа из кэша (None, если вопросов нет)."""
+        snapshot = self.test_cache.get(test_id)
+        if snapshot is not None:
+            return snapshot
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT o.question_id, o.id, o.text, o.image_path, o.is_correct
+                FROM options o
+                JOIN questions q ON q.id = o.question_id
+                WHERE q.test_id = ?
+                ORDER BY o.id
+            """, (test_id,))
+            options: dict = {}
+            for question_id, option_id, text, image_path, is_correct in cursor.fetchall():
+                options.setdefault(question_id, []).append(CachedOption(option_id, text, image_path, bool(is_correct)))
+            cursor.execute(
+                "SELECT id, text, file_path, type FROM questions WHERE test_id = ? ORDER BY id", (test_id,)
+            )
+            questions = tuple(
+                CachedQuestion(question_id, text, file_path, q_type, tuple(options.get(question_id, ())))
+                for question_id, text, file_path, q_type in cursor.fetchall()
+            )
+        if not questions:
+            return None
+        snapshot = TestSnapshot(test_id, snapshot_version(questions), questions)
+        self.test_cache.put(test_id, snapshot)
+        return snapshot
+
     def get_correct_option(self, option_id: int) -> bool:
         """Проверяет, является ли вариант ответа правильным."""
         with self.get_connection() as conn:
@@ -363,68 +1417,303 @@ class Database:
             result = cursor.fetchone()
             return result[0] if result else False
 
-    def get_correct_text(self, question_id: int) -> Optional[str]:
-        """Возвращает правильный текстовый ответ для вопроса."""
+    def get_answer_matcher(self, question_id: int) -> AnswerMatcher:
+        """Возвращает скомпилированную проверку ответа на текстовый вопрос (из кэша, если есть)."""
+        matcher = self.matcher_cache.get(question_id)
+        if matcher is None:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT answer, tolerance FROM question_accepted_answers WHERE question_id = ?",
+                    (question_id,)
+                )
+                matcher = AnswerMatcher(cursor.fetchall())
+            self.matcher_cache.put(question_id, matcher)
+        return matcher
+
+    def insert_user_answer(self, user_id: int, test_id: int, question_id: int, answer_id: Optional[int], text_answer: Optional[str], attempt_number: int,
+                           is_correct: bool = False) -> bool:
+        """
+        Добавляет ответ пользователя на вопрос теста вместе с оценкой.
+        Возвращает False, если в этой попытке на вопрос уже ответили (например, двойное нажатие).
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT correct_text FROM questions WHERE id = ?", (question_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            cursor.execute("""
+                INSERT OR IGNORE INTO user_answers (user_id, test_id, question_id, answer_id, text_answer, attempt_number, is_correct)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, test_id, question_id, answer_id, text_answer, attempt_number, is_correct))
+            conn.commit()
+            if cursor.rowcount == 0:
+                return False
+            logger.info("Добавлен ответ пользователя %s на вопрос %s", user_id, question_id,
+                        extra={"user_id": user_id, "test_id": test_id, "question_id": question_id})
+            return True
 
-    def insert_user_answer(self, user_id: int, test_id: int, question_id: int, answer_id: Optional[int], text_answer: Optional[str], attempt_number: int) -> None:
-        """Добавляет ответ пользователя на вопрос теста."""
+    def start_test_attempt(self, user_id: int, first_name: str, last_name: str, test_id: int) -> Optional[int]:
+        """
+        Резервирует попытку прохождения теста и возвращает её номер (None — попытки исчерпаны).
+        Проверка остатка и списание попытки выполняются одним запросом, поэтому два одновременных
+        нажатия не получат одну и ту же попытку и не превысят лимит.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO user_answers (user_id, test_id, question_id, answer_id, text_answer, attempt_number)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, test_id, question_id, answer_id, text_answer, attempt_number))
+                INSERT INTO user_results (user_id, first_name, last_name, test_id, best_score, total, attempts_left)
+                SELECT ?, ?, ?, id, 0, NULL, max_attempts - 1 FROM tests WHERE id = ? AND max_attempts > 0
+                ON CONFLICT (user_id, test_id) DO UPDATE SET attempts_left = attempts_left - 1
+                WHERE attempts_left > 0
+                RETURNING (SELECT max_attempts FROM tests WHERE id = test_id) - attempts_left
+            """, (user_id, first_name, last_name, test_id))
+            row = cursor.fetchone()
             conn.commit()
-            logger.info(f"Добавлен ответ пользователя {user_id} на вопрос {question_id}")
+        if row is None:
+            return None
+        logger.info("Пользователь %s начал попытку %s теста %s", user_id, row[0], test_id,
+                    extra={"user_id": user_id, "test_id": test_id, "attempt": row[0]})
+        return row[0]
 
-    def insert_user_result(self, user_id: int, first_name: str, last_name: str, test_id: int, best_score: int, total: int, attempts_left: int) -> None:
-        """Добавляет результат теста пользователя."""
+    def finish_test_attempt(self, user_id: int, first_name: str, last_name: str, test_id: int, score: int,
+                            total: int) -> int:
+        """
+        Сохраняет результат завершённой попытки одним запросом и возвращает лучший балл ученика.
+        Лучший балл только растёт, поэтому повторное завершение той же попытки ничего не портит.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO user_results (user_id, first_name, last_name, test_id, best_score, total, attempts_left)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, first_name, last_name, test_id, best_score, total, attempts_left))
+                SELECT ?, ?, ?, id, ?, ?, MAX(max_attempts - 1, 0) FROM tests WHERE id = ?
+                ON CONFLICT (user_id, test_id) DO UPDATE SET
+                    best_score = MAX(best_score, excluded.best_score),
+                    total = excluded.total,
+                    completed_at = CURRENT_TIMESTAMP
+                RETURNING best_score
+            """, (user_id, first_name, last_name, score, total, test_id))
+            row = cursor.fetchone()
             conn.commit()
-            logger.info(f"Добавлен результат теста {test_id} для пользователя {user_id}")
+        if row is None:
+            return score
+        logger.info("Сохранён результат теста %s для пользователя %s: %s/%s", test_id, user_id, score, total,
+                    extra={"user_id": user_id, "test_id": test_id, "score": score, "total": total})
+        self._update_leaderboard(user_id, test_id, row[0])
+        return row[0]
+
+    def _update_leaderboard(self, user_id: int, test_id: int, best_score: int) -> None:
+        """Переносит новый лучший результат в рейтинг класса ученика."""
+        student = self.get_student_cached(user_id)
+        if student is not None:
+            _, first_name, last_name, class_number, _, _ = student
+            self.leaderboards.update(class_number, test_id, user_id, first_name, last_name, best_score)
 
-    def update_user_result(self, user_id: int, test_id: int, best_score: int, total: int) -> None:
-        """Обновляет результат теста пользователя."""
+    def get_class_test_scores(self, class_number: int, test_id: int) -> List[Tuple[int, str, str, int]]:
+        """Возвращает лучшие результаты учеников класса по тесту: (telegram_id, имя, фамилия, балл)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                UPDATE user_results
-                SET best_score = ?, total = ?, completed_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND test_id = ?
-            """, (best_score, total, user_id, test_id))
+                SELECT ur.user_id, s.first_name, s.last_name, ur.best_score
+                FROM user_results ur
+                JOIN tests t ON t.id = ur.test_id
+                JOIN students s ON s.telegram_id = ur.user_id AND s.teacher_id = t.teacher_id
+                WHERE ur.test_id = ? AND s.class_number = ? AND ur.total IS NOT NULL
+            """, (test_id, class_number))
+            return cursor.fetchall()
+
+
+    def get_available_tests(self, teacher_id: int, user_id: int) -> List[Tuple[int, str, int]]:
+        """Возвращает тесты учителя, которые ученик ещё может пройти: (id, title, осталось попыток)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
             cursor.execute("""
-                            UPDATE user_results
-                            SET attempts_left = attempts_left - 1
-                            WHERE user_id = ? AND test_id = ? AND attempts_left > 0
-                        """, (user_id, test_id))
+                SELECT t.id, t.title, COALESCE(ur.attempts_left, t.max_attempts) AS attempts_left
+                FROM tests t
+                LEFT JOIN user_results ur ON ur.test_id = t.id AND ur.user_id = ?
+                WHERE t.teacher_id = ? AND t.archived_at IS NULL AND COALESCE(ur.attempts_left, t.max_attempts) > 0
+                ORDER BY t.id
+            """, (user_id, teacher_id))
+            return cursor.fetchall()
+
+    def claim_updates(self, keys: List[str], now: float, window: float) -> bool:
+        """
+        Отмечает обновление как принятое одной транзакцией. Возвращает False, если любой из ключей
+        уже встречался за последние window секунд (повторная доставка). Устаревшие ключи удаляет
+        prune_processed_updates (по таймеру в процессе-лидере), а не каждое обновление.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for key in keys:
+                # Старый ключ, который ещё не успели удалить, не считается повтором
+                cursor.execute("""
+                    INSERT INTO processed_updates (key, processed_at) VALUES (?, ?)
+                    ON CONFLICT (key) DO UPDATE SET processed_at = excluded.processed_at
+                    WHERE processed_updates.processed_at < ?
+                """, (key, now, now - window))
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return False
+            conn.commit()
+            return True
+
+    def prune_processed_updates(self, before: float) -> int:
+        """Удаляет ключи обновлений, принятых раньше before. Возвращает число удалённых."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM processed_updates WHERE processed_at < ?", (before,))
             conn.commit()
-            logger.info(f"Обновлён результат теста {test_id} для пользователя {user_id}")
+            return cursor.rowcount
 
+    def release_updates(self, keys: List[str]) -> None:
+        """Снимает отметку о принятом обновлении (его обработка не удалась, Telegram пришлёт его снова)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM processed_updates WHERE key = ?", [(key,) for key in keys])
+            conn.commit()
 
-    def get_user_result(self, user_id: int, test_id: int) -> Optional[Tuple[int]]:
-        """Возвращает результат пользователя для теста (attempts_left)."""
+    def add_media_group_message(self, chat_id: int, media_group_id: str, message_id: int, payload: str,
+                                now: float) -> None:
+        """Сохраняет сообщение альбома (JSON) до сборки альбома целиком."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT attempts_left FROM user_results WHERE user_id = ? AND test_id = ?", (user_id, test_id))
-            return cursor.fetchone()
+            cursor.execute("""
+                INSERT OR IGNORE INTO media_group_messages (chat_id, media_group_id, message_id, payload, received_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (chat_id, media_group_id, message_id, payload, now))
+            conn.commit()
 
-    def get_user_attempts(self, user_id: int, test_id: int) -> int:
-        """Возвращает количество попыток пользователя для теста."""
+    def get_media_group_last_seen(self, chat_id: int, media_group_id: str) -> Optional[float]:
+        """Возвращает время последнего сообщения альбома (None — альбом уже забран)."""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM user_results WHERE user_id = ? AND test_id = ?", (user_id, test_id))
+            cursor.execute(
+                "SELECT MAX(received_at) FROM media_group_messages WHERE chat_id = ? AND media_group_id = ?",
+                (chat_id, media_group_id)
+            )
             return cursor.fetchone()[0]
 
+    def claim_media_group(self, chat_id: int, media_group_id: str, expired_before: float) -> List[str]:
+        """
+        Забирает все сообщения альбома (JSON по порядку message_id) и удаляет их: альбом получает
+        только один воркер, остальным вернётся пустой список. Заодно удаляет брошенные альбомы.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                DELETE FROM media_group_messages WHERE chat_id = ? AND media_group_id = ?
+                RETURNING message_id, payload
+            """, (chat_id, media_group_id))
+            rows = cursor.fetchall()
+            cursor.execute("DELETE FROM media_group_messages WHERE received_at < ?", (expired_before,))
+            conn.commit()
+            return [payload for _, payload in sorted(rows)]
+
+    def get_fsm_record(self, key: str) -> Tuple[Optional[str], str]:
+        """Возвращает состояние FSM и его данные (JSON) по ключу хранилища."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT state, data FROM fsm_state WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            return (row[0], row[1]) if row else (None, "{}")
+
+    def set_fsm_state(self, key: str, state: Optional[str]) -> None:
+        """Сохраняет состояние FSM, не трогая данные. Пустая запись удаляется."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO fsm_state (key, state) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+            """, (key, state))
+            cursor.execute("DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+            conn.commit()
+
+    def set_fsm_data(self, key: str, data: str) -> None:
+        """Сохраняет данные FSM (JSON), не трогая состояние. Пустая запись удаляется."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO fsm_state (key, data) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            """, (key, data))
+            cursor.execute("DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+            conn.commit()
+
+    def get_data_versions(self) -> Dict[str, int]:
+        """Возвращает текущие версии областей данных (students, tasks, tests)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, version FROM data_versions")
+            return dict(cursor.fetchall())
+
+    def get_class_stats(self, teacher_id: int) -> List[Tuple[int, int]]:
+        """Возвращает классы учителя с числом учеников (class_number, student_count)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT class_number, student_count FROM classes WHERE teacher_id = ? ORDER BY class_number",
+                (teacher_id,)
+            )
+            return cursor.fetchall()
+
+    def get_test_stats(self, teacher_id: int) -> List[Tuple[int, str, int, int, Optional[float], Optional[int]]]:
+        """
+        Сводка по открытым тестам учителя: (id, title, max_attempts, учеников с результатом,
+        средний лучший балл, число вопросов).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT t.id, t.title, t.max_attempts, COUNT(ur.id), AVG(ur.best_score),
+                       (SELECT COUNT(*) FROM questions q WHERE q.test_id = t.id)
+                FROM tests t
+                LEFT JOIN user_results ur ON ur.test_id = t.id AND ur.total IS NOT NULL
+                WHERE t.teacher_id = ? AND t.archived_at IS NULL
+                GROUP BY t.id
+                ORDER BY t.id
+            """, (teacher_id,))
+            return cursor.fetchall()
+
+    def get_test_result_rows(self, test_id: int) -> List[Tuple[int, str, str, Optional[int], int, int, int, str]]:
+        """
+        Результаты учеников по тесту: (telegram_id, имя, фамилия, класс, лучший балл, из скольки,
+        осталось попыток, время последнего завершения).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT ur.user_id, COALESCE(s.first_name, ur.first_name), COALESCE(s.last_name, ur.last_name),
+                       s.class_number, ur.best_score, ur.total, ur.attempts_left, ur.completed_at
+                FROM user_results ur
+                LEFT JOIN students s ON s.telegram_id = ur.user_id
+                WHERE ur.test_id = ? AND ur.total IS NOT NULL
+                ORDER BY s.class_number, ur.best_score DESC, 3, 2
+            """, (test_id,))
+            return cursor.fetchall()
+
+    def get_question_stats(self, test_id: int) -> List[Tuple[int, str, str, int, int]]:
+        """
+        Статистика ответов по вопросам теста с учётом архивных сводок:
+        (question_id, текст, тип, ответов, верных).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT q.id, q.text, q.type,
+                       COALESCE(ua.answers, 0) + COALESCE(qs.answers_count, 0),
+                       COALESCE(ua.correct, 0) + COALESCE(qs.correct_count, 0)
+                FROM questions q
+                LEFT JOIN (
+                    SELECT question_id, COUNT(*) AS answers, SUM(is_correct) AS correct
+                    FROM user_answers
+                    WHERE test_id = ?
+                    GROUP BY question_id
+                ) ua ON ua.question_id = q.id
+                LEFT JOIN test_question_summaries qs ON qs.test_id = q.test_id AND qs.question_id = q.id
+                WHERE q.test_id = ?
+                ORDER BY q.id
+            """, (test_id, test_id))
+            return cursor.fetchall()
+
     def get_test_users(self, test_id: int) -> List[Tuple[int, str, str]]:
         """Возвращает пользователей, проходивших тест."""
         with self.get_connection() as conn:
@@ -455,8 +1744,7 @@ class Database:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT q.text, o.text, ua.text_answer,
-                    CASE WHEN o.is_correct = 1 OR LOWER(ua.text_answer) = LOWER(q.correct_text)
-                        THEN '✅' ELSE '❌' END as is_correct
+                    CASE WHEN ua.is_correct = 1 THEN '✅' ELSE '❌' END as is_correct
                 FROM user_answers ua
                 JOIN questions q ON ua.question_id = q.id
                 LEFT JOIN options o ON ua.answer_id = o.id
@@ -0,0 +1,109 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional, Tuple
+from db import Database
+from config import logger
+
+# Наибольшая пауза перед повтором не удавшейся отправки, секунд
+MAX_RETRY_DELAY = 3600.0
+
+
+class DeliveryScheduler:
+    """
+    Планировщик отложенной отправки заданий.
+
+    Отложенные отправки хранятся в таблице scheduled_deliveries (индекс по run_at).
+    Один фоновый поток спит до ближайшей отправки и выполняет все наступившие.
+    Сон ограничен poll_interval, чтобы замечать отправки, добавленные другими воркерами.
+    Не удавшаяся отправка остаётся в таблице и повторяется с растущей паузой.
+    На каждом проходе также выполняется reminders — рассылка напоминаний о сроках сдачи.
+    """
+
+    def __init__(self, db: Database, job: Callable[[int, int], None], poll_interval: float = 30.0,
+                 reminders: Optional[Callable[[], None]] = None):
+        self.db = db
+        self.job = job
+        self.reminders = reminders
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def schedule(self, task_id: int, class_numbers: Iterable[int], run_at: datetime) -> List[int]:
+        """Планирует отправку задания сразу нескольким классам и возвращает ID отправок."""
+        delivery_ids = self.db.insert_scheduled_deliveries(task_id, class_numbers, run_at)
+        self.wakeup()
+        return delivery_ids
+
+    def cancel(self, delivery_id: int, teacher_id: Optional[int] = None) -> bool:
+        """
+        Отменяет запланированную отправку (если указан teacher_id — только отправку задания этого учителя).
+        Возвращает False, если её уже нет.
+        """
+        cancelled = self.db.delete_scheduled_delivery(delivery_id, teacher_id)
+        self.wakeup()
+        return cancelled
+
+    def pending(self, teacher_id: int) -> List[Tuple[int, int, str, int, datetime]]:
+        """Возвращает ожидающие отправки заданий учителя (id, task_id, title, class_number, run_at)."""
+        return self.db.get_pending_deliveries(teacher_id)
+
+    def wakeup(self) -> None:
+        """Будит поток планировщика, чтобы он пересчитал время следующей отправки."""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Запускает фоновый поток планировщика."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="delivery-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Планировщик отправок запущен")
+
+    def shutdown(self) -> None:
+        """Останавливает поток планировщика."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info("Планировщик отправок остановлен")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self._run_due()
+                if self.reminders is not None:
+                    self.reminders()
+                timeout = self._seconds_until_next()
+            except Exception as e:
+                logger.error("Ошибка в планировщике отправок: %s", e)
+                timeout = self.poll_interval
+            self._wakeup.wait(timeout)
+
+    def _run_due(self) -> None:
+        for delivery_id, task_id, class_number, attempts in self.db.get_due_deliveries(datetime.now()):
+            if self._stop.is_set():
+                return
+            try:
+                self.job(task_id, class_number)
+            except Exception as e:
+                # Задание идемпотентно: отправку не удаляем, а повторяем с растущей паузой
+                delay = min(self.poll_interval * 2 ** attempts, MAX_RETRY_DELAY)
+                logger.error("Ошибка отправки %s (задание %s, класс %s), повтор через %.0f с: %s",
+                             delivery_id, task_id, class_number, delay, e)
+                self.db.retry_scheduled_delivery(delivery_id, datetime.now() + timedelta(seconds=delay))
+                continue
+            self.db.delete_scheduled_delivery(delivery_id)
+
+    def _seconds_until_next(self) -> float:
+        next_run = self.db.get_next_delivery_time()
+        if next_run is None:
+            return self.poll_interval
+        return min(max((next_run - datetime.now()).total_seconds(), 0.0), self.poll_interval)
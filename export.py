@@ -0,0 +1,31 @@
+import os
+import shutil
+from pathlib import Path
+from typing import List, Tuple
+from config import HOMEWORKS_DIR, logger
+
+
+def export_task_answers(task_title: str, answers: List[Tuple[str, str, str, str]]) -> Path:
+    """
+    Раскладывает ответы на задание по папкам учеников внутри HOMEWORKS_DIR
+    и возвращает путь к папке задания.
+    """
+    output_dir = HOMEWORKS_DIR / task_title
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    for answer_text, answer_file_path, first_name, last_name in answers:
+        student_dir = output_dir / f"{first_name}_{last_name}"
+        student_dir.mkdir(exist_ok=True)
+
+        if answer_text:
+            with open(student_dir / "answer.txt", "w", encoding="utf-8") as f:
+                f.write(answer_text)
+
+        if answer_file_path:
+            for i, file_path in enumerate(answer_file_path.split(";")):
+                if os.path.exists(file_path):
+                    ext = os.path.splitext(file_path)[1] or ".bin"
+                    shutil.copy(file_path, student_dir / f"file_{i}{ext}")
+
+    logger.info("Ответы на задание '%s' выгружены в %s", task_title, output_dir)
+    return output_dir
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, NamedTuple, Optional, Set, Union
+from aiogram import Bot
+from aiogram.types import InputFile
+from config import FILE_IO_WORKERS, FILE_IO_CHUNK_SIZE, FILE_IO_QUEUE_WARNING, logger
+
+
+class FileIOStats(NamedTuple):
+    workers: int
+    queued: int        # ждут свободного потока
+    running: int       # выполняются
+    completed: int
+    max_queued: int    # наибольшая очередь с момента запуска
+    avg_wait_ms: float  # среднее ожидание в очереди
+
+
+class FileIO:
+    """
+    Выделенный пул потоков для блокирующих файловых операций: скачивание вложений,
+    отправка файлов, выгрузка ответов, сохранение картинок тестов.
+
+    Число потоков ограничено, поэтому копирование большой выгрузки занимает не больше
+    workers потоков и не отнимает ни цикл событий, ни общий пул asyncio у остальных обновлений.
+    Пул не привязан к циклу событий: им пользуются и вебхук (новый цикл на каждое обновление),
+    и outbox в своём потоке.
+    """
+
+    def __init__(self, workers: int = 4, chunk_size: int = 65536, queue_warning: int = 32):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.queue_warning = queue_warning
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file-io")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._max_queued = 0
+        self._total_wait = 0.0
+        self._created_dirs: Set[str] = set()
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет func(*args) в файловом пуле и возвращает результат."""
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+            queued = self._queued
+            self._max_queued = max(self._max_queued, queued)
+        if queued == self.queue_warning:
+            logger.warning("Очередь файловых операций: %s задач ждут свободного потока", queued)
+        return await asyncio.wrap_future(self._executor.submit(self._call, submitted, func, *args))
+
+    def _call(self, submitted: float, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_wait += time.monotonic() - submitted
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def stats(self) -> FileIOStats:
+        with self._lock:
+            started = self._completed + self._running
+            avg_wait = self._total_wait / started * 1000 if started else 0.0
+            return FileIOStats(self.workers, self._queued, self._running, self._completed,
+                               self._max_queued, avg_wait)
+
+    async def makedirs(self, path: Union[str, Path]) -> None:
+        """Создаёт папку; уже созданные этим процессом папки повторно не проверяются."""
+        key = str(path)
+        if key in self._created_dirs:
+            return
+        await self.run(lambda: os.makedirs(path, exist_ok=True))
+        self._created_dirs.add(key)
+
+    async def save_stream(self, chunks: AsyncIterator[bytes], path: Union[str, Path]) -> None:
+        """Записывает поток байтов в файл по частям, не блокируя цикл событий."""
+        f = await self.run(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await self.run(f.write, chunk)
+        finally:
+            await self.run(f.close)
+
+    async def download(self, bot: Bot, telegram_path: str, path: Union[str, Path]) -> None:
+        """Скачивает файл с серверов Telegram потоком прямо на диск."""
+        url = bot.session.api.file_url(bot.token, telegram_path)
+        await self.save_stream(bot.session.stream_content(url=url, chunk_size=self.chunk_size), path)
+
+    def input_file(self, path: Union[str, Path], filename: Optional[str] = None) -> "PooledInputFile":
+        """Файл для отправки в Telegram, который читается через файловый пул."""
+        return PooledInputFile(self, path, filename)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class PooledInputFile(InputFile):
+    """Аналог FSInputFile, читающий файл порциями в файловом пуле вместо общего пула asyncio."""
+
+    def __init__(self, file_io: FileIO, path: Union[str, Path], filename: Optional[str] = None):
+        super().__init__(filename=filename or os.path.basename(path), chunk_size=file_io.chunk_size)
+        self.file_io = file_io
+        self.path = path
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        f = await self.file_io.run(open, self.path, "rb")
+        try:
+            while chunk := await self.file_io.run(f.read, self.chunk_size):
+                yield chunk
+        finally:
+            await self.file_io.run(f.close)
+
+
+# Общий пул процесса
+file_io = FileIO(FILE_IO_WORKERS, FILE_IO_CHUNK_SIZE, FILE_IO_QUEUE_WARNING)
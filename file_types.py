@@ -0,0 +1,7 @@
+# Без зависимостей: модуль импортируется из db (через similarity), которому не нужен aiogram
+PHOTO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def is_photo_path(file_path: str) -> bool:
+    """Проверяет по расширению, нужно ли отправлять файл как фото."""
+    return file_path.lower().endswith(PHOTO_EXTENSIONS)
@@ -0,0 +1,38 @@
+import json
+from typing import Any, Dict, Mapping, Optional
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from db import Database
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в рабочей базе (таблица fsm_state).
+
+    В режиме вебхука обновления одного пользователя обрабатывают разные воркеры uWSGI,
+    поэтому состояние диалога (регистрация, прохождение теста, сдача ответа, /search)
+    не может жить в памяти процесса. Данные хранятся в JSON; пустые записи удаляются.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True,
+                                             with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.db.set_fsm_state(self.key_builder.build(key), state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self.db.get_fsm_record(self.key_builder.build(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        self.db.set_fsm_data(self.key_builder.build(key), json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads(self.db.get_fsm_record(self.key_builder.build(key))[1])
+
+    async def close(self) -> None:
+        pass
@@ -1,30 +1,72 @@
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.filters import Command, CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
-from states import RegisterStates, ListStudentsStates
+from states import RegisterStates, ListStudentsStates, ImportStudentsStates
 from db import Database
-from utils import is_admin, send_message_with_buttons
-from config import logger
+from roster import MAX_ERRORS, open_roster, parse_roster
+from utils import send_message_with_buttons, is_admin as is_owner
+from file_io import file_io
+from config import logger, ARCHIVE_DB_NAME
+from datetime import datetime
 from keyboards import get_main_menu
+from typing import Optional
+import asyncio
+import csv
+import io
+import time
 
 router = Router()
 
 
+@router.message(CommandStart(deep_link=True))
+async def cmd_start_invite(message: Message, command: CommandObject, state: FSMContext, db: Database,
+                           student: Optional[tuple], is_admin: bool) -> None:
+    """Обработчик /start с кодом приглашения из импортированного списка учеников."""
+    if student:
+        await message.answer("Вы уже зарегистрированы.")
+        await message.answer("Выберите действие:", reply_markup=get_main_menu(is_admin))
+        return
+
+    student = db.redeem_invite(command.args, message.from_user.id)
+    if not student:
+        # Не приглашение — возможно, общая ссылка учителя для регистрации в его классах
+        teacher = db.get_teacher_by_join_code(command.args)
+        if teacher:
+            await state.update_data(teacher_id=teacher[0])
+            await message.answer(f"Регистрация у учителя {teacher[1]}.\nВведите ваше имя:")
+        elif db.get_default_teacher_id() is not None:
+            await message.answer("Код приглашения не найден или уже использован.\nВведите ваше имя для регистрации:")
+        else:
+            await message.answer("Код приглашения не найден или уже использован. Попросите у учителя новую ссылку.")
+            return
+        await state.set_state(RegisterStates.first_name)
+        return
+
+    await state.clear()
+    await message.answer(f"Добро пожаловать, {student[1]} {student[2]}! Вы зарегистрированы в {student[3]} классе.")
+    await message.answer("Выберите действие:", reply_markup=get_main_menu(is_admin))
+
+
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext, db: Database) -> None:
+async def cmd_start(message: Message, state: FSMContext, db: Database, student: Optional[tuple],
+                    is_admin: bool) -> None:
     """Обработчик команды /start. Приветствует пользователя и показывает главное меню."""
-    user_id = message.from_user.id
-    student = db.get_student(user_id)
-
+    if not student and is_admin:
+        await message.answer("Добро пожаловать!")
+        await message.answer("Выберите действие:", reply_markup=get_main_menu(is_admin))
+        return
     if not student:
+        # Без ссылки учителя регистрируем, только если учитель один
+        if db.get_default_teacher_id() is None:
+            await message.answer("Добро пожаловать! Чтобы зарегистрироваться, откройте ссылку, которую дал учитель.")
+            return
         await message.answer("Добро пожаловать! Для начала нужно зарегистрироваться.\nВведите ваше имя:")
         await state.set_state(RegisterStates.first_name)
         return
 
     await message.answer("Добро пожаловать обратно!")
-    admin_status = is_admin(user_id)
-    await message.answer("Выберите действие:", reply_markup=get_main_menu(admin_status))
+    await message.answer("Выберите действие:", reply_markup=get_main_menu(is_admin))
 
 
 @router.message(RegisterStates.first_name)
@@ -42,14 +84,20 @@ async def process_last_name(message: Message, state: FSMContext) -> None:
 
 
 @router.message(RegisterStates.class_number)
-async def process_class_number(message: Message, state: FSMContext, db: Database) -> None:
+async def process_class_number(message: Message, state: FSMContext, db: Database, is_admin: bool) -> None:
     try:
         class_number = int(message.text)
         if class_number <= 0:
             raise ValueError("Номер класса должен быть положительным числом.")
 
         data = await state.get_data()
+        teacher_id = data.get("teacher_id") or db.get_default_teacher_id()
+        if teacher_id is None:
+            await message.answer("Чтобы зарегистрироваться, откройте ссылку, которую дал учитель.")
+            await state.clear()
+            return
         db.insert_student(
+            teacher_id=teacher_id,
             first_name=data["first_name"],
             last_name=data["last_name"],
             class_number=class_number,
@@ -57,21 +105,173 @@ async def process_class_number(message: Message, state: FSMContext, db: Database
         )
 
         await message.answer("Регистрация успешно завершена!")
-        admin_status = is_admin(message.from_user.id)
-        await message.answer("Выберите действие:", reply_markup=get_main_menu(admin_status))
+        await message.answer("Выберите действие:", reply_markup=get_main_menu(is_admin))
         await state.clear()
     except ValueError as e:
         await message.answer(f"Ошибка: {e}. Попробуйте снова.")
-        logger.error(f"Ошибка регистрации (class_number): {e}, user_id: {message.from_user.id}")
+        logger.error("Ошибка регистрации (class_number): %s, user_id: %s", e, message.from_user.id)
+
+
+@router.message(Command("import_students"))
+async def import_students_start(message: Message, state: FSMContext, is_admin: bool) -> None:
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    await message.answer(
+        "Отправьте CSV-файл со списком учеников. Столбцы: имя, фамилия, класс и, по желанию, "
+        "telegram id или код приглашения. Для учеников без telegram id будут созданы ссылки-приглашения."
+    )
+    await state.set_state(ImportStudentsStates.file)
+
+
+@router.message(ImportStudentsStates.file, F.document)
+async def process_students_file(message: Message, state: FSMContext, bot: Bot, db: Database,
+                                teacher_id: Optional[int]) -> None:
+    started = time.perf_counter()
+    raw = await bot.download(message.document)
+    try:
+        rows, errors = parse_roster(open_roster(raw))
+    except (UnicodeDecodeError, csv.Error) as e:
+        logger.warning("Не удалось прочитать список учеников: %s", e)
+        await message.answer("Не удалось прочитать файл. Сохраните его как CSV в кодировке UTF-8 и отправьте снова.")
+        return
+
+    if errors:
+        await message.answer("Файл не загружен, исправьте ошибки и отправьте его снова:\n" + "\n".join(errors))
+        return
+    if not rows:
+        await message.answer("В файле нет ни одного ученика.")
+        return
+
+    added, invited, taken = db.import_students(teacher_id, rows)
+    if taken:
+        await message.answer(
+            "Файл не загружен: эти коды приглашений уже заняты, замените их и отправьте файл снова:\n"
+            + "\n".join(taken[:MAX_ERRORS])
+        )
+        return
+    logger.info("Импорт %s строк занял %.3f с", len(rows), time.perf_counter() - started)
+    await message.answer(
+        f"Импорт завершён. Добавлено учеников: {added}, пропущено уже зарегистрированных: "
+        f"{len(rows) - invited - added}, создано приглашений: {invited}."
+    )
+
+    if invited:
+        me = await bot.me()
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["Имя", "Фамилия", "Класс", "Код", "Ссылка"])
+        for row in rows:
+            if not row.telegram_id:
+                link = f"https://t.me/{me.username}?start={row.invite_code}"
+                writer.writerow([row.first_name, row.last_name, row.class_number, row.invite_code, link])
+        await message.answer_document(
+            BufferedInputFile(output.getvalue().encode("utf-8-sig"), filename="invites.csv"),
+            caption="Ссылки-приглашения для учеников"
+        )
+    await state.clear()
+
+
+@router.message(Command("archive"))
+async def cmd_archive(message: Message, command: CommandObject, db: Database, is_admin: bool,
+                      teacher_id: Optional[int]) -> None:
+    """Переносит в архив ответы по заданиям и тестам, закрытым до указанной даты (по умолчанию — до 1 сентября)."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    if command.args:
+        try:
+            cutoff = datetime.strptime(command.args.strip(), "%d.%m.%Y")
+        except ValueError:
+            await message.answer("Укажите дату в формате 'ДД.ММ.ГГГГ', например: /archive 01.09.2025")
+            return
+    else:
+        today = datetime.now()
+        cutoff = datetime(today.year if today.month >= 9 else today.year - 1, 9, 1)
+
+    # Архивация — редкая операция учителя, её код не нужен при старте воркера
+    from archive import Archiver
+
+    await message.answer(f"Архивирую задания и тесты, закрытые до {cutoff.strftime('%d.%m.%Y')}...")
+    report = await asyncio.to_thread(Archiver(db, ARCHIVE_DB_NAME).archive_before, cutoff, teacher_id)
+    await message.answer(
+        f"Готово. Заданий: {report.tasks} (ответов: {report.answers}), "
+        f"тестов: {report.tests} (ответов на вопросы: {report.user_answers}). "
+        f"Освобождено страниц базы: {report.freed_pages}."
+    )
+
+
+@router.message(Command("add_teacher"))
+async def cmd_add_teacher(message: Message, command: CommandObject, bot: Bot, db: Database) -> None:
+    """Добавляет учителя: /add_teacher telegram_id Имя. Доступно только владельцу бота."""
+    if not is_owner(message.from_user.id):
+        await message.answer("Эта функция доступна только владельцу бота.")
+        return
+
+    telegram_id, _, name = (command.args or "").strip().partition(" ")
+    if not telegram_id.isdigit() or not name.strip():
+        await message.answer("Формат: /add_teacher telegram_id Имя Отчество")
+        return
+
+    teacher_id, join_code = db.add_teacher(int(telegram_id), name.strip())
+    me = await bot.me()
+    await message.answer(
+        f"Учитель {name.strip()} добавлен (ID {teacher_id}).\n"
+        f"Ссылка для регистрации его учеников: https://t.me/{me.username}?start={join_code}"
+    )
+
+
+@router.message(Command("teacher_link"))
+async def cmd_teacher_link(message: Message, bot: Bot, db: Database, teacher_id: Optional[int]) -> None:
+    """Показывает учителю ссылку, по которой ученики регистрируются в его классах."""
+    if teacher_id is None:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    join_code = db.get_teacher(teacher_id)[3]
+    me = await bot.me()
+    await message.answer(f"Ссылка для регистрации учеников: https://t.me/{me.username}?start={join_code}")
+
+
+@router.message(Command("dashboard_token"))
+async def cmd_dashboard_token(message: Message, db: Database, teacher_id: Optional[int]) -> None:
+    """Выпускает учителю новый токен API панели; прежний токен перестаёт действовать."""
+    if teacher_id is None:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    token = db.reset_dashboard_token(teacher_id)
+    await message.answer(
+        f"Новый токен API панели (прежний больше не действует):\n{token}\n"
+        "Передавайте его в заголовке Authorization: Bearer <токен>."
+    )
+
+
+@router.message(Command("io_stats"))
+async def cmd_io_stats(message: Message, is_admin: bool) -> None:
+    """Показывает загрузку пула файловых операций этого воркера."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    stats = file_io.stats()
+    await message.answer(
+        f"Файловые операции: потоков {stats.workers}, выполняется {stats.running}, "
+        f"в очереди {stats.queued} (максимум {stats.max_queued}).\n"
+        f"Выполнено: {stats.completed}, среднее ожидание в очереди: {stats.avg_wait_ms:.1f} мс."
+    )
 
 
 @router.message(F.text == "📋 Список учеников")
-async def list_students_from_button(message: Message, state: FSMContext, db: Database, bot: Bot) -> None:
-    if not is_admin(message.from_user.id):
+async def list_students_from_button(message: Message, state: FSMContext, db: Database, bot: Bot,
+                                    is_admin: bool, teacher_id: Optional[int]) -> None:
+    if not is_admin:
         await message.answer("Эта функция доступна только учителю.")
         return
 
-    classes = db.get_unique_classes()
+    classes = db.get_unique_classes(teacher_id)
     if not classes:
         await message.answer("Нет зарегистрированных классов.")
         return
@@ -82,9 +282,10 @@ async def list_students_from_button(message: Message, state: FSMContext, db: Dat
 
 
 @router.callback_query(ListStudentsStates.class_number, F.data.startswith("list_class_"))
-async def process_class_selection_for_list(callback: CallbackQuery, state: FSMContext, db: Database) -> None:
+async def process_class_selection_for_list(callback: CallbackQuery, state: FSMContext, db: Database,
+                                           teacher_id: Optional[int]) -> None:
     class_number = int(callback.data.split("_")[2])
-    students = db.get_student_names_by_class(class_number)
+    students = db.get_student_names_by_class(teacher_id, class_number)
 
     if not students:
         await callback.message.answer(f"В классе {class_number} нет студентов.")
@@ -99,17 +300,17 @@ async def process_class_selection_for_list(callback: CallbackQuery, state: FSMCo
 
 @router.message(F.text == "❌ Отмена")
 @router.message(Command("cancel"))
-async def cmd_cancel(message: Message, state: FSMContext) -> None:
+async def cmd_cancel(message: Message, state: FSMContext, is_admin: bool) -> None:
     """Обработчик отмены любого действия и возврата в главное меню."""
     current_state = await state.get_state()
     if current_state is not None:
         await state.clear()
         await message.answer(
             "Действие отменено.",
-            reply_markup=get_main_menu(is_admin(message.from_user.id))
+            reply_markup=get_main_menu(is_admin)
         )
     else:
         await message.answer(
             "Нет активных действий для отмены.",
-            reply_markup=get_main_menu(is_admin(message.from_user.id))
+            reply_markup=get_main_menu(is_admin)
         )
\ No newline at end of file
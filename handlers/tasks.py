@@ -1,82 +1,57 @@
+import asyncio
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from states import NewTaskStates, SendTaskStates, AnswerStates, ShowAnswersStates
 from db import Database
-from utils import is_admin, send_file_message, send_message_with_buttons, download_document, download_photo, \
-    format_answer_message
-from config import logger, HOMEWORKS_DIR, BOT_TOKEN, DB_NAME
-from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from keyboards import get_task_selection_keyboard, get_class_selection_keyboard, get_unsent_tasks_keyboard, get_send_method_keyboard
-from typing import List
-import os
-import shutil
+from utils import send_message_with_buttons, download_document, download_photo, \
+    format_answer_message, snapshot_note
+from config import logger, HOMEWORKS_DIR, ARCHIVE_DB_NAME, REMINDER_LEAD_HOURS
+from datetime import datetime, timedelta
+from functools import partial
+from delivery import DeliveryScheduler
+from outbox import OutboxWorker
+from similarity import find_clusters
+from snapshot import ReportSnapshot
+from file_io import file_io
+from keyboards import get_task_selection_keyboard, get_class_selection_keyboard, get_unsent_tasks_keyboard, \
+    get_send_method_keyboard, get_pending_deliveries_keyboard, get_search_pages_keyboard
+from typing import List, Optional, Tuple
 
 router = Router()
 
+DEADLINE_FORMAT = "%d.%m.%Y %H:%M"
 
-async def scheduled_task_job(task_id: int, class_number: int) -> None:
+
+def send_scheduled_task(db: Database, outbox: OutboxWorker, task_id: int, class_number: int) -> None:
     """
-    Эта функция вызывается планировщиком. Она сама создает необходимые
-    объекты Bot и Database для выполнения задачи.
+    Ставит задание в outbox для всех студентов указанного класса и будит отправителей.
+    Вызывается и из хендлеров, и планировщиком отправок; повторный вызов не создаёт дублей.
     """
-    logger.info(f"Запускается запланированная задача: отправка задания {task_id} классу {class_number}")
-    bot = Bot(token=BOT_TOKEN)
-    db = Database(db_path=DB_NAME)
-
-    try:
-        task = db.get_task(task_id)
-        if not task:
-            logger.error(f"Запланированная задача не нашла задание {task_id}")
-            return
-
-        _, title, description, file_path = task
-        students = db.get_students_by_class(class_number)
-
-        for student in students:
-            try:
-                msg = f"Новое задание: {title}\nОписание: {description}"
-                if file_path:
-                    await send_file_message(bot, student[0], file_path, caption=msg)
-                else:
-                    await bot.send_message(student[0], msg)
-            except Exception as e:
-                logger.error(f"Ошибка отправки запланированного задания {task_id} студенту {student[0]}: {e}")
-
-        db.assign_task_to_class(task_id, class_number)
-        logger.info(f"Запланированное задание {task_id} успешно отправлено классу {class_number}")
-    finally:
-        # Важно закрыть сессию, созданную для этой задачи
-        await bot.session.close()
-
-async def send_scheduled_task(bot: Bot, task_id: int, class_number: int, db: Database) -> None:
-    """Отправляет задание всем студентам указанного класса."""
     task = db.get_task(task_id)
     if not task:
-        logger.error(f"Задание {task_id} не найдено для отправки по расписанию")
+        logger.error("Задание %s не найдено для отправки", task_id)
         return
 
-    id, title, description, file_path = task
-    students = db.get_students_by_class(class_number)
+    _, title, description, file_path = task
+    msg = f"Новое задание: {title}\nОписание: {description}"
+    db.enqueue_task_delivery(task_id, class_number, msg, file_path)
+    outbox.wakeup()
 
-    for student in students:
-        try:
-            msg = f"Новое задание: {title}\nОписание: {description}"
-            if file_path:
-                await send_file_message(bot, student[0], file_path, msg)
-            else:
-                await bot.send_message(chat_id=student[0], text=msg)
-        except Exception as e:
-            logger.error(f"Ошибка отправки задания {task_id} студенту {student[0]}: {e}")
 
-    db.assign_task_to_class(task_id, class_number)
-    logger.info(f"Задание {task_id} успешно отправлено классу {class_number}")
+def send_deadline_reminders(db: Database, outbox: OutboxWorker, lead: timedelta) -> None:
+    """
+    Ставит в outbox напоминания всем ученикам, не сдавшим задания со сроком в ближайшие lead.
+    Вызывается планировщиком отправок; один проход охватывает все задания и классы.
+    """
+    if db.enqueue_deadline_reminders(datetime.now(), lead):
+        outbox.wakeup()
 
 
 @router.message(F.text == "➕ Новое задание")
-async def new_task(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def new_task(message: Message, state: FSMContext, is_admin: bool):
+    if not is_admin:
         return
     await message.answer("Введите заголовок нового задания:")
     await state.set_state(NewTaskStates.title)
@@ -95,7 +70,7 @@ async def process_task_description(message: Message, state: FSMContext):
 
 
 @router.message(NewTaskStates.file)
-async def process_task_file(message: Message, state: FSMContext, bot: Bot, db: Database):
+async def process_task_file(message: Message, state: FSMContext, bot: Bot, db: Database, teacher_id: Optional[int]):
     file_path = None
     if message.document:
         file_path = await download_document(
@@ -107,6 +82,7 @@ async def process_task_file(message: Message, state: FSMContext, bot: Bot, db: D
 
     data = await state.get_data()
     task_id = db.insert_task(
+        teacher_id=teacher_id,
         title=data['title'],
         description=data['description'],
         file_path=file_path
@@ -116,11 +92,12 @@ async def process_task_file(message: Message, state: FSMContext, bot: Bot, db: D
 
 
 @router.message(F.text == "📤 Отправить задание")
-async def send_task_start(message: Message, state: FSMContext, db: Database):
-    if not is_admin(message.from_user.id):
+async def send_task_start(message: Message, state: FSMContext, db: Database, is_admin: bool,
+                          teacher_id: Optional[int]):
+    if not is_admin:
         return
 
-    tasks = db.get_tasks_not_sent_to_all()
+    tasks = db.get_tasks_not_sent_to_all(teacher_id)
     if not tasks:
         await message.answer("Все созданные задания уже отправлены всем классам, или заданий нет.")
         return
@@ -133,8 +110,12 @@ async def send_task_start(message: Message, state: FSMContext, db: Database):
 
 
 @router.callback_query(SendTaskStates.task_id, F.data.startswith("send_task_"))
-async def process_send_task_selection(callback: CallbackQuery, state: FSMContext, db: Database):
+async def process_send_task_selection(callback: CallbackQuery, state: FSMContext, db: Database,
+                                      teacher_id: Optional[int]):
     task_id = int(callback.data.split("_")[2])
+    if not db.get_task(task_id, teacher_id):
+        await callback.answer("Задание не найдено.", show_alert=True)
+        return
     await state.update_data(task_id=task_id)
 
     classes = db.get_classes_for_task(task_id)
@@ -145,7 +126,7 @@ async def process_send_task_selection(callback: CallbackQuery, state: FSMContext
 
     await callback.message.edit_text(
         "Выберите класс, которому нужно отправить это задание:",
-        reply_markup=get_class_selection_keyboard(classes, prefix="send_to_class_")
+        reply_markup=get_class_selection_keyboard(classes, prefix="send_to_class_", with_all=len(classes) > 1)
     )
     await state.set_state(SendTaskStates.class_number)
     await callback.answer()
@@ -164,9 +145,14 @@ async def process_task_selection_for_send(callback: CallbackQuery, state: FSMCon
 
 
 @router.callback_query(SendTaskStates.class_number, F.data.startswith("send_to_class_"))
-async def process_send_class_selection(callback: CallbackQuery, state: FSMContext):
-    class_number = int(callback.data.split("_")[3])
-    await state.update_data(class_number=class_number)
+async def process_send_class_selection(callback: CallbackQuery, state: FSMContext, db: Database):
+    selected = callback.data.split("_")[3]
+    if selected == "all":
+        data = await state.get_data()
+        class_numbers = db.get_classes_for_task(data['task_id'])
+    else:
+        class_numbers = [int(selected)]
+    await state.update_data(class_numbers=class_numbers)
 
     await callback.message.edit_text(
         "Как вы хотите отправить задание?",
@@ -177,15 +163,16 @@ async def process_send_class_selection(callback: CallbackQuery, state: FSMContex
 
 
 @router.callback_query(SendTaskStates.method)
-async def process_send_method(callback: CallbackQuery, state: FSMContext, bot: Bot, db: Database,
-                              scheduler: AsyncIOScheduler):
+async def process_send_method(callback: CallbackQuery, state: FSMContext, db: Database, outbox: OutboxWorker):
     data = await state.get_data()
     task_id = data['task_id']
-    class_number = data['class_number']
+    class_numbers = data['class_numbers']
 
     if callback.data == "send_now":
-        await send_scheduled_task(bot, task_id, class_number, db)
-        await callback.message.edit_text(f"Задание немедленно отправлено ученикам {class_number} класса.")
+        for class_number in class_numbers:
+            send_scheduled_task(db, outbox, task_id, class_number)
+        classes_text = ", ".join(map(str, class_numbers))
+        await callback.message.edit_text(f"Задание поставлено в очередь отправки ученикам классов: {classes_text}.")
         await state.clear()
     elif callback.data == "send_schedule":
         await callback.message.edit_text("Введите дату и время отправки в формате 'ДД.ММ.ГГГГ ЧЧ:ММ'")
@@ -195,8 +182,7 @@ async def process_send_method(callback: CallbackQuery, state: FSMContext, bot: B
 
 
 @router.message(SendTaskStates.schedule_time)
-async def process_schedule_time(message: Message, state: FSMContext, scheduler: AsyncIOScheduler, bot: Bot,
-                                db: Database):
+async def process_schedule_time(message: Message, state: FSMContext, scheduler: DeliveryScheduler):
     try:
         schedule_time = datetime.strptime(message.text, "%d.%m.%Y %H:%M")
         if schedule_time < datetime.now():
@@ -204,15 +190,7 @@ async def process_schedule_time(message: Message, state: FSMContext, scheduler:
             return
 
         data = await state.get_data()
-        task_id = data['task_id']
-        class_number = data['class_number']
-
-        scheduler.add_job(
-            scheduled_task_job,
-            "date",
-            run_date=schedule_time,
-            args=[task_id, class_number]  # <--- Только простые типы!
-        )
+        scheduler.schedule(data['task_id'], data['class_numbers'], schedule_time)
 
         await message.answer(f"Задание запланировано на {schedule_time.strftime('%d.%m.%Y %H:%M')}.")
         await state.clear()
@@ -220,17 +198,75 @@ async def process_schedule_time(message: Message, state: FSMContext, scheduler:
     except ValueError:
         await message.answer("Неверный формат даты. Пожалуйста, введите дату в формате 'ДД.ММ.ГГГГ ЧЧ:ММ'.")
 
+
+@router.message(F.text == "🗓 Запланированные отправки")
+async def list_scheduled_deliveries(message: Message, scheduler: DeliveryScheduler, is_admin: bool,
+                                    teacher_id: Optional[int]):
+    if not is_admin:
+        return
+
+    deliveries = scheduler.pending(teacher_id)
+    if not deliveries:
+        await message.answer("Нет запланированных отправок.")
+        return
+
+    await message.answer(
+        "Запланированные отправки (нажмите, чтобы отменить):",
+        reply_markup=get_pending_deliveries_keyboard(deliveries)
+    )
+
+
+@router.callback_query(F.data.startswith("cancel_delivery_"))
+async def cancel_scheduled_delivery(callback: CallbackQuery, scheduler: DeliveryScheduler, is_admin: bool,
+                                    teacher_id: Optional[int]):
+    if not is_admin:
+        await callback.answer()
+        return
+
+    delivery_id = int(callback.data.split("_")[2])
+    if scheduler.cancel(delivery_id, teacher_id):
+        await callback.answer("Отправка отменена.")
+    else:
+        await callback.answer("Эта отправка уже выполнена или отменена.")
+
+    deliveries = scheduler.pending(teacher_id)
+    if deliveries:
+        await callback.message.edit_reply_markup(reply_markup=get_pending_deliveries_keyboard(deliveries))
+    else:
+        await callback.message.edit_text("Нет запланированных отправок.")
+
+
 @router.message(F.text == "📚 Мои задания")
-async def my_tasks(message: Message, state: FSMContext, db: Database):
-    tasks = db.get_tasks_for_student_class(message.from_user.id)
+async def my_tasks(message: Message, state: FSMContext, db: Database, student: Optional[tuple]):
+    if not student:
+        await message.answer("Вы не зарегистрированы. Нажмите /start, чтобы зарегистрироваться.")
+        return
+
+    tasks = db.get_student_tasks(student[5], student[0], student[3])
     if not tasks:
         await message.answer("Для вашего класса нет назначенных заданий.")
         return
 
+    pending = []
+    submitted = []
+    for task_id, title, deadline, is_submitted in tasks:
+        if is_submitted:
+            submitted.append(title)
+        elif deadline:
+            pending.append((task_id, f"{title} (до {datetime.fromisoformat(deadline).strftime(DEADLINE_FORMAT)})"))
+        else:
+            pending.append((task_id, title))
+
+    if submitted:
+        await message.answer("✅ Сданные задания:\n" + "\n".join(submitted))
+    if not pending:
+        await message.answer("Все задания сданы.")
+        return
+
     await message.answer(
         "Выберите задание, на которое хотите ответить:",
         # Используем универсальную клавиатуру с префиксом для ответа
-        reply_markup=get_task_selection_keyboard(tasks, prefix="answer_task_")
+        reply_markup=get_task_selection_keyboard(pending, prefix="answer_task_")
     )
     await state.set_state(AnswerStates.task_id)
 
@@ -252,9 +288,9 @@ async def process_task_selection_for_answer(callback: CallbackQuery, state: FSMC
 
 
 @router.message(AnswerStates.waiting_for_more_files, F.text)
-async def handle_answer_text(message: Message, state: FSMContext, db: Database) -> None:
+async def handle_answer_text(message: Message, state: FSMContext, db: Database, student: Optional[tuple]) -> None:
     if message.text.lower() == "все":
-        await confirm_answer(message, state, db)
+        await confirm_answer(message, state, db, student)
         return
 
     await state.update_data(answer_text=message.text)
@@ -263,32 +299,44 @@ async def handle_answer_text(message: Message, state: FSMContext, db: Database)
     )
 
 
-@router.message(AnswerStates.waiting_for_more_files, F.document | F.photo)
-async def handle_answer_files(message: Message, state: FSMContext, bot: Bot) -> None:
+async def download_answer_file(bot: Bot, message: Message, suffix: str) -> Optional[str]:
+    """Скачивает документ или фото из сообщения ученика (None, если файла нет)."""
+    if message.document:
+        return await download_document(bot, message.document.file_id, message.document.file_name, HOMEWORKS_DIR,
+                                       suffix)
+    if message.photo:
+        return await download_photo(bot, message.photo[-1].file_id, HOMEWORKS_DIR, suffix)
+    return None
+
+
+@router.message(AnswerStates.waiting_for_more_files, F.document | F.photo, flags={"album": True})
+async def handle_answer_files(message: Message, state: FSMContext, bot: Bot,
+                              album: Optional[List[Message]] = None) -> None:
+    # Альбом приходит одним вызовом (MediaGroupMiddleware): файлы скачиваются параллельно,
+    # состояние записывается и ответ отправляется один раз
+    messages = album or [message]
     data = await state.get_data()
     files: List[str] = data.get("answer_files", [])
     user_id = message.from_user.id
     task_id = data["current_task_id"]
 
-    if message.document:
-        file_path = await download_document(bot, message.document.file_id, message.document.file_name, HOMEWORKS_DIR,
-                                            f"_answer_{user_id}_{task_id}_{len(files)}")
-    elif message.photo:
-        file_path = await download_photo(bot, message.photo[-1].file_id, HOMEWORKS_DIR,
-                                         f"_answer_{user_id}_{task_id}_{len(files)}")
-
-    files.append(file_path)
+    downloaded = await asyncio.gather(*(
+        download_answer_file(bot, item, f"_answer_{user_id}_{task_id}_{len(files) + i}")
+        for i, item in enumerate(messages)
+    ))
+    saved = [file_path for file_path in downloaded if file_path]
+    files = files + saved
     await state.update_data(answer_files=files)
 
+    saved_note = "Файл сохранён" if len(saved) == 1 else f"Сохранено файлов: {len(saved)}"
     await message.answer(
-        f"Файл сохранён. Всего файлов: {len(files)}\n"
+        f"{saved_note}. Всего файлов: {len(files)}\n"
         "Пришлите ещё файлы или напишите 'все', если это всё."
     )
 
 
-async def confirm_answer(message: Message, state: FSMContext, db: Database) -> None:
+async def confirm_answer(message: Message, state: FSMContext, db: Database, student: Optional[tuple]) -> None:
     data = await state.get_data()
-    user_id = message.from_user.id
     task_id = data["current_task_id"]
     answer_text = data.get("answer_text")
     answer_files = data.get("answer_files", [])
@@ -297,34 +345,35 @@ async def confirm_answer(message: Message, state: FSMContext, db: Database) -> N
         await message.answer("Ответ не может быть пустым. Пожалуйста, отправьте текст или файл.")
         return
 
-    student = db.get_student(user_id)
     if not student:
         await message.answer("Вы не зарегистрированы.")
         await state.clear()
         return
 
-    student_id = student[0]
-    if db.get_answers_by_task_and_student(student_id, task_id):
-        await message.answer("Вы уже отправили ответ на это задание.")
-        await state.clear()
-        return
-
-    db.insert_answer(
-        student_id=student_id,
+    # Вместе с ответом считаются хеши приложенных картинок — чтение файлов уходит в файловый пул.
+    # Повторная сдача отсекается в том же запросе, что и вставка
+    saved = await file_io.run(partial(
+        db.insert_answer,
+        student_id=student[0],
         task_id=task_id,
         answer_text=answer_text,
         answer_file_path=";".join(answer_files) if answer_files else None
-    )
+    ))
+    if not saved:
+        await message.answer("Вы уже отправили ответ на это задание.")
+        await state.clear()
+        return
 
     await message.answer(format_answer_message(answer_text, answer_files))
     await state.clear()
 
 
 @router.message(F.text == "📥 Скачать ответы учеников")
-async def show_answers_from_button(message: Message, state: FSMContext, db: Database):
-    if not is_admin(message.from_user.id):
+async def show_answers_from_button(message: Message, state: FSMContext, db: Database, is_admin: bool,
+                                   teacher_id: Optional[int]):
+    if not is_admin:
         return
-    tasks = db.get_all_tasks()
+    tasks = db.get_all_tasks(teacher_id)
     if not tasks:
         await message.answer("Еще не создано ни одного задания.")
         return
@@ -337,38 +386,261 @@ async def show_answers_from_button(message: Message, state: FSMContext, db: Data
 
 
 @router.callback_query(ShowAnswersStates.task_id, F.data.startswith("show_answers_"))
-async def process_task_selection_for_answers(callback: CallbackQuery, state: FSMContext, db: Database) -> None:
+async def process_task_selection_for_answers(callback: CallbackQuery, state: FSMContext, db: Database,
+                                             reports: ReportSnapshot, teacher_id: Optional[int]) -> None:
     task_id = int(callback.data.split("_")[2])
-    answers = db.get_answers_by_task(task_id)
+    task = db.get_task(task_id, teacher_id)
+    if not task:
+        await callback.answer("Задание не найдено.", show_alert=True)
+        return
+    # Выгрузка читает снимок базы, чтобы не мешать ученикам сдавать работы
+    report_db, as_of = reports.reader()
+    answers = report_db.get_answers_by_task(task_id)
+    if not answers:
+        # Ответы на закрытые задания прошлых лет лежат в архивной базе
+        from archive import Archiver
+        answers = Archiver(db, ARCHIVE_DB_NAME).get_archived_answers(task_id)
     if not answers:
         await callback.message.answer("Нет ответов на это задание.")
         await state.clear()
         await callback.answer()
         return
 
-    task = db.get_task(task_id)
-    task_title = task[1]
-    output_dir = HOMEWORKS_DIR / task_title
-    output_dir.mkdir(exist_ok=True)
-
-    for answer in answers:
-        answer_text, answer_file_path, first_name, last_name = answer
-        student_dir = output_dir / f"{first_name}_{last_name}"
-        student_dir.mkdir(exist_ok=True)
-
-        if answer_text:
-            with open(student_dir / "answer.txt", "w", encoding="utf-8") as f:
-                f.write(answer_text)
-
-        if answer_file_path:
-            for i, file_path in enumerate(answer_file_path.split(";")):
-                if os.path.exists(file_path):
-                    ext = os.path.splitext(file_path)[1] or ".bin"
-                    shutil.copy(file_path, student_dir / f"file_{i}{ext}")
-
-    await callback.message.answer(f"Все ответы сохранены в папке {output_dir}")
+    # Код выгрузки нужен только учителю — не загружаем его при старте воркера
+    from export import export_task_answers
+
+    # Копирование файлов может занять заметное время — выполняем его в файловом пуле
+    output_dir = await file_io.run(export_task_answers, task[1], answers)
+
+    await callback.message.answer(f"Все ответы сохранены в папке {output_dir}{snapshot_note(as_of)}")
     await state.clear()
     await callback.answer()
 
+MAX_SIMILAR_GROUPS = 20
+
+
+@router.message(F.text == "🕵 Похожие ответы")
+async def similar_answers_from_button(message: Message, db: Database, is_admin: bool,
+                                      teacher_id: Optional[int]) -> None:
+    if not is_admin:
+        return
+    tasks = db.get_all_tasks(teacher_id)
+    if not tasks:
+        await message.answer("Еще не создано ни одного задания.")
+        return
+
+    await message.answer(
+        "Выберите задание, чтобы найти подозрительно похожие ответы:",
+        reply_markup=get_task_selection_keyboard(tasks, prefix="similar_answers_")
+    )
+
+
+@router.callback_query(F.data.startswith("similar_answers_"))
+async def process_task_selection_for_similar(callback: CallbackQuery, db: Database, is_admin: bool,
+                                             teacher_id: Optional[int]) -> None:
+    if not is_admin:
+        await callback.answer()
+        return
+    task_id = int(callback.data.split("_")[2])
+    if not db.get_task(task_id, teacher_id):
+        await callback.answer("Задание не найдено.", show_alert=True)
+        return
+
+    # Сравниваются только пары из общих корзин LSH, поэтому отчёт строится почти за линейное время
+    clusters = find_clusters(db.get_similar_answer_candidates(task_id))
+    if not clusters:
+        await callback.message.answer("Похожих ответов не найдено.")
+        await callback.answer()
+        return
+
+    authors = db.get_answer_authors([answer_id for ids, _ in clusters for answer_id in ids])
+    lines = [f"🕵 Найдено групп похожих ответов: {len(clusters)}"]
+    for number, (answer_ids, score) in enumerate(clusters[:MAX_SIMILAR_GROUPS], start=1):
+        names = ", ".join(
+            f"{authors[answer_id][1]} {authors[answer_id][0]} ({authors[answer_id][2]} кл., #{answer_id})"
+            for answer_id in answer_ids
+        )
+        lines.append(f"\n{number}. Сходство до {score:.0%}: {names}")
+    if len(clusters) > MAX_SIMILAR_GROUPS:
+        lines.append(f"\n…и ещё {len(clusters) - MAX_SIMILAR_GROUPS}")
+    await callback.message.answer("\n".join(lines))
+    await callback.answer()
+
+
+SEARCH_PAGE_SIZE = 5
+
+
+def parse_search_args(args: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    Разбирает аргументы /search: слова для поиска и фильтры «класс:N», «задание:N».
+    Каждое слово экранируется для FTS5 и ищется по префиксу, чтобы находились
+    и другие формы слова («интеграл» → «интегралы», «интегралом»).
+    """
+    terms = []
+    task_id = class_number = None
+    for word in args.split():
+        key, _, value = word.partition(":")
+        if key.lower() == "класс" and value.isdigit():
+            class_number = int(value)
+        elif key.lower() == "задание" and value.isdigit():
+            task_id = int(value)
+        else:
+            terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms), task_id, class_number
+
+
+async def send_search_page(message: Message, db: Database, teacher_id: int, args: str, page: int,
+                           edit: bool = False) -> None:
+    """Показывает одну страницу результатов поиска по ответам учеников учителя."""
+    query, task_id, class_number = parse_search_args(args)
+    total, rows = db.search_answers(teacher_id, query, task_id, class_number,
+                                    limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE)
+    if not total:
+        await message.answer("Ничего не найдено.")
+        return
+
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    lines = [f"🔎 Найдено ответов: {total} (страница {page + 1} из {pages})"]
+    for answer_id, title, first_name, last_name, cls, fragment in rows:
+        lines.append(f"\n#{answer_id} {title} — {last_name} {first_name}, {cls} класс\n{fragment}")
+    text = "\n".join(lines)
+    keyboard = get_search_pages_keyboard(page, pages)
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext, db: Database,
+                     is_admin: bool, teacher_id: Optional[int]) -> None:
+    """Полнотекстовый поиск по ответам учеников: /search слова [класс:N] [задание:N]."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    args = (command.args or "").strip()
+    if not parse_search_args(args)[0]:
+        await message.answer(
+            "Укажите, что искать, например: /search интеграл класс:10\n"
+            "Можно ограничить поиск классом (класс:N) и заданием (задание:N)."
+        )
+        return
+
+    # Запрос храним в данных FSM: в callback_data он может не поместиться
+    await state.update_data(search_args=args)
+    await send_search_page(message, db, teacher_id, args, page=0)
+
+
+@router.callback_query(F.data.startswith("search_page_"))
+async def process_search_page(callback: CallbackQuery, state: FSMContext, db: Database, is_admin: bool,
+                              teacher_id: Optional[int]) -> None:
+    if not is_admin:
+        await callback.answer()
+        return
+    args = (await state.get_data()).get("search_args")
+    if not args:
+        await callback.answer("Поиск устарел, повторите команду /search.", show_alert=True)
+        return
+    page = int(callback.data.split("_")[2])
+    await send_search_page(callback.message, db, teacher_id, args, page, edit=True)
+    await callback.answer()
+
+
+
+MAX_MISSING_LINES = 100
+
+
+@router.message(Command("deadline"))
+async def cmd_deadline(message: Message, command: CommandObject, db: Database, is_admin: bool,
+                       teacher_id: Optional[int]) -> None:
+    """Срок сдачи задания: /deadline ID ДД.ММ.ГГГГ ЧЧ:ММ [класс] или /deadline ID нет [класс]."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    args = (command.args or "").split()
+    usage = ("Формат: /deadline ID_задания ДД.ММ.ГГГГ ЧЧ:ММ [класс]\n"
+             "Снять срок: /deadline ID_задания нет [класс]")
+    if len(args) < 2 or not args[0].isdigit():
+        await message.answer(usage)
+        return
+
+    task_id = int(args[0])
+    if not db.get_task(task_id, teacher_id):
+        await message.answer("Задание не найдено.")
+        return
+    if args[1].lower() == "нет":
+        deadline, rest = None, args[2:]
+    else:
+        try:
+            deadline = datetime.strptime(" ".join(args[1:3]), DEADLINE_FORMAT)
+        except ValueError:
+            await message.answer(usage)
+            return
+        if deadline < datetime.now():
+            await message.answer("Срок сдачи уже прошёл. Укажите время в будущем.")
+            return
+        rest = args[3:]
+    if rest and not rest[0].isdigit():
+        await message.answer(usage)
+        return
+    class_number = int(rest[0]) if rest else None
+
+    changed = db.set_task_deadline(task_id, deadline, class_number)
+    if not changed:
+        await message.answer("Это задание ещё не отправлено ни одному классу (или указанному классу).")
+    elif deadline is None:
+        await message.answer(f"Срок сдачи снят (классов: {changed}).")
+    else:
+        await message.answer(
+            f"Срок сдачи: {deadline.strftime(DEADLINE_FORMAT)} (классов: {changed}).\n"
+            f"Не сдавшим напомним за {REMINDER_LEAD_HOURS:g} ч до срока."
+        )
+
+
+@router.message(Command("missing"))
+async def cmd_missing(message: Message, command: CommandObject, db: Database, is_admin: bool,
+                      teacher_id: Optional[int]) -> None:
+    """Кто не сдал задания: /missing — сводка по открытым заданиям, /missing ID — список учеников."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    args = (command.args or "").strip()
+    if args.isdigit():
+        task = db.get_task(int(args), teacher_id)
+        if not task:
+            await message.answer("Задание не найдено.")
+            return
+        students = db.get_missing_submissions(task[0])
+        if not students:
+            await message.answer(f"Задание «{task[1]}» сдали все, кому оно отправлено.")
+            return
+        lines = [f"Не сдали задание «{task[1]}»: {len(students)}"]
+        current_class = None
+        for class_number, first_name, last_name in students[:MAX_MISSING_LINES]:
+            if class_number != current_class:
+                lines.append(f"\n{class_number} класс:")
+                current_class = class_number
+            lines.append(f"{last_name} {first_name}")
+        if len(students) > MAX_MISSING_LINES:
+            lines.append(f"…и ещё {len(students) - MAX_MISSING_LINES}")
+        await message.answer("\n".join(lines))
+        return
+
+    rows = [row for row in db.get_missing_submission_counts(teacher_id) if row[4]]
+    if not rows:
+        await message.answer("Все открытые задания сданы.")
+        return
+    lines = ["Не сдали (задание, класс: не сдали из учеников):"]
+    for task_id, title, class_number, deadline, missing, total in rows[:MAX_MISSING_LINES]:
+        due = f", срок {datetime.fromisoformat(deadline).strftime(DEADLINE_FORMAT)}" if deadline else ""
+        lines.append(f"#{task_id} {title}, {class_number} класс: {missing} из {total}{due}")
+    if len(rows) > MAX_MISSING_LINES:
+        lines.append(f"…и ещё {len(rows) - MAX_MISSING_LINES}")
+    lines.append("\nСписок учеников: /missing ID_задания")
+    await message.answer("\n".join(lines))
+
 # Для множественного выбора классов (в будущем): Добавьте в get_class_selection_keyboard кнопку "Добавить еще" и "Завершить", state.update_data(selected_classes=state.data.get('selected_classes', []) + [cls])
 # В хендлерах callback проверяйте data == 'class_finish', затем переходите к следующему состоянию.
\ No newline at end of file
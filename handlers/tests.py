@@ -1,80 +1,90 @@
+import asyncio
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, User
+from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from states import NewTestStates, TestStates
+from states import NewTestStates, TestStates, ImportTestStates
 from db import Database
-from utils import is_admin, send_file_message, send_message_with_buttons, download_photo, download_document
+from utils import send_file_message, send_message_with_buttons, download_photo, download_document, snapshot_note
 from config import logger, QUESTIONS_DIR, TESTS_DIR
+from matcher import parse_accepted_answers, AnswerFormatError
+from keyboards import get_class_selection_keyboard
+from leaderboard import Leaderboard
+from snapshot import ReportSnapshot
+from file_io import file_io
+from session_state import TestSession, TestSnapshot
 from typing import Optional, List, Tuple
 
 router = Router()
 
+MAX_REGRADE_LINES = 50
+LEADERBOARD_TOP = 10
 
-async def send_next_question(bot: Bot, message: Message, state: FSMContext, db: Database) -> None:
-    """Отправляет следующий вопрос теста или завершает тест."""
-    data = await state.get_data()
-    questions = data["questions"]
-    idx = data["current_index"]
-
-    if idx >= len(questions):
-        score = data["correct_answers"]
-        total = len(questions)
-        user_id = data["user_id"]
-        first_name = data["first_name"]
-        last_name = data["last_name"]
-        test_id = data["test_id"]
-        attempt_number = data["attempt_number"]
-
-        result = db.get_user_result(user_id, test_id)
-        if result:
-            attempts_left = result[0]
-            if attempts_left > 0:
-                db.update_user_result(user_id, test_id, max(score, result[0]), total)
-        else:
-            test = db.get_test(test_id)
-            if test:
-                db.insert_user_result(user_id, first_name, last_name, test_id, score, total, test[2] - 1)
 
-        await message.answer(f"✅ Тест завершен!\nВаш результат: {score}/{total}")
+def tests_owner(student: Optional[tuple], teacher_id: Optional[int]) -> Optional[int]:
+    """ID учителя, чьи тесты видит пользователь: учитель — свои, ученик — тесты своего учителя."""
+    if teacher_id is not None:
+        return teacher_id
+    return student[5] if student else None
+
+
+def owns_test(db: Database, teacher_id: Optional[int], test_id: int) -> bool:
+    """Проверяет, что тест принадлежит учителю (для кнопок с ID теста в callback_data)."""
+    return teacher_id is not None and db.get_test(test_id, teacher_id) is not None
+
+
+async def load_test_session(state: FSMContext, db: Database) -> Tuple[Optional[TestSession], Optional[TestSnapshot]]:
+    """Возвращает запись о прохождении теста и вопросы теста (None, если тест не идёт или изменился)."""
+    session = TestSession.from_data(await state.get_data())
+    if session is None:
+        return None, None
+    snapshot = db.get_test_snapshot(session.test_id)
+    if snapshot is None or snapshot.version != session.version:
+        return session, None
+    return session, snapshot
+
+
+async def send_next_question(bot: Bot, message: Message, state: FSMContext, db: Database, user: User) -> None:
+    """Отправляет следующий вопрос теста или завершает тест."""
+    session, snapshot = await load_test_session(state, db)
+    if snapshot is None:
+        await message.answer("Тест изменился или был удалён. Начните его заново.")
         await state.clear()
         return
 
-    question_id, text = questions[idx]
-    await state.update_data(current_question_id=question_id)
-    question = db.get_question(question_id)
-    if not question:
-        await message.answer("Ошибка: вопрос не найден")
+    total = len(snapshot.questions)
+    if session.cursor >= total:
+        score = session.score
+        db.finish_test_attempt(user.id, user.first_name, user.last_name or "", session.test_id, score, total)
+
+        await message.answer(f"✅ Тест завершен!\nВаш результат: {score}/{total}")
         await state.clear()
         return
 
-    q_text, q_file, q_type = question
-    await message.answer(f"Вопрос {idx + 1}/{len(questions)}:\n{q_text}")
+    question = snapshot.questions[session.cursor]
+    await message.answer(f"Вопрос {session.cursor + 1}/{total}:\n{question.text}")
 
-    if q_file:
-        await send_file_message(bot, message.chat.id, q_file)
+    if question.file_path:
+        await send_file_message(bot, message.chat.id, question.file_path)
 
-    if q_type == "choice":
-        options = db.get_options_by_question(question_id)
+    if question.type == "choice":
         buttons = []
-        for i, opt in enumerate(options, 1):
-            opt_id, opt_text, opt_image = opt
-            if opt_image:
-                await send_file_message(bot, message.chat.id, opt_image, caption=f"Вариант {i}")
-                buttons.append((str(i), f"opt_{opt_id}"))
+        for i, option in enumerate(question.options, 1):
+            if option.image_path:
+                await send_file_message(bot, message.chat.id, option.image_path, caption=f"Вариант {i}")
+                buttons.append((str(i), f"opt_{option.id}"))
             else:
-                buttons.append((opt_text, f"opt_{opt_id}"))
+                buttons.append((option.text, f"opt_{option.id}"))
 
         await send_message_with_buttons(bot, message.chat.id, "Выберите ответ:", buttons)
-        await state.set_state(TestStates.question)
     else:
         await message.answer("Введите ваш ответ текстом:")
-        await state.update_data(current_question_type="text")
-        await state.set_state(TestStates.question)
+    await state.set_state(TestStates.question)
 
 
 @router.message(F.text == "➕ Новый тест")
-async def new_test_from_button(message: Message, state: FSMContext) -> None:
-    if not is_admin(message.from_user.id):
+async def new_test_from_button(message: Message, state: FSMContext, is_admin: bool) -> None:
+    if not is_admin:
         await message.answer("Эта функция доступна только учителю.")
         return
 
@@ -82,6 +92,43 @@ async def new_test_from_button(message: Message, state: FSMContext) -> None:
     await state.set_state(NewTestStates.title)
 
 
+@router.message(Command("import_test"))
+async def import_test_start(message: Message, state: FSMContext, is_admin: bool) -> None:
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    await message.answer(
+        "Отправьте файл теста: JSON или YAML, либо ZIP-архив с test.json/test.yaml и картинками.\n"
+        "Формат: {\"title\": ..., \"max_attempts\": 2, \"questions\": [{\"text\": ..., \"type\": \"choice\", "
+        "\"file\": \"img/q1.png\", \"options\": [\"A\", {\"image\": \"img/b.png\"}], \"correct\": 1}, "
+        "{\"text\": ..., \"type\": \"text\", \"answer\": [\"3,5\", \"три с половиной\"], \"tolerance\": 0.01}]}"
+    )
+    await state.set_state(ImportTestStates.file)
+
+
+@router.message(ImportTestStates.file, F.document)
+async def process_test_file(message: Message, state: FSMContext, bot: Bot, db: Database,
+                            teacher_id: Optional[int]) -> None:
+    # Разбор файлов теста нужен только учителю — не загружаем его при старте воркера
+    from import_tests import TestImportError, load_test_file, save_test_files
+
+    raw = await bot.download(message.document)
+    try:
+        spec, files = load_test_file(message.document.file_name or "", raw.getvalue())
+    except TestImportError as e:
+        await message.answer(f"Тест не загружен:\n{e}")
+        return
+
+    await file_io.run(save_test_files, spec, files)
+    test_id = db.import_test(teacher_id, spec["title"], spec["max_attempts"], spec["questions"])
+    await message.answer(
+        f"Тест «{spec['title']}» создан (ID {test_id}): вопросов {len(spec['questions'])}, "
+        f"попыток {spec['max_attempts']}."
+    )
+    await state.clear()
+
+
 @router.message(NewTestStates.title)
 async def process_test_title(message: Message, state: FSMContext, db: Database) -> None:
     """Сохраняет название теста и запрашивает количество попыток."""
@@ -91,7 +138,7 @@ async def process_test_title(message: Message, state: FSMContext, db: Database)
 
 
 @router.message(NewTestStates.max_attempts)
-async def process_max_attempts(message: Message, state: FSMContext, db: Database) -> None:
+async def process_max_attempts(message: Message, state: FSMContext, db: Database, teacher_id: Optional[int]) -> None:
     """Сохраняет количество попыток и начинает создание первого вопроса."""
     try:
         attempts = int(message.text)
@@ -99,14 +146,14 @@ async def process_max_attempts(message: Message, state: FSMContext, db: Database
             raise ValueError("Количество попыток должно быть положительным.")
 
         data = await state.get_data()
-        test_id = db.insert_test(data["test_title"], attempts)
+        test_id = db.insert_test(teacher_id, data["test_title"], attempts)
         await state.update_data(test_id=test_id)
         await message.answer(
             f"Тест создан: {data['test_title']}\nМаксимум попыток: {attempts}\nВведите текст первого вопроса:")
         await state.set_state(NewTestStates.question_text)
     except ValueError as e:
         await message.answer(f"Ошибка: {e}. Введите число.")
-        logger.error(f"Ошибка в /new_test (max_attempts): {e}, user_id: {message.from_user.id}")
+        logger.error("Ошибка в /new_test (max_attempts): %s, user_id: %s", e, message.from_user.id)
 
 
 @router.message(NewTestStates.question_text)
@@ -159,15 +206,24 @@ async def process_question_type(message: Message, state: FSMContext, db: Databas
         await message.answer("Введите текст варианта 1 (или напишите 'фото'):")
         await state.set_state(NewTestStates.option_text)
     else:
-        await message.answer("Введите правильный текстовый ответ:")
+        await message.answer(
+            "Введите правильный текстовый ответ. Несколько вариантов разделяйте «|», "
+            "для числа можно указать погрешность: 3,14 ± 0,01"
+        )
         await state.set_state(NewTestStates.correct_text_answer)
 
 
 @router.message(NewTestStates.correct_text_answer)
 async def process_correct_text_answer(message: Message, state: FSMContext, db: Database) -> None:
-    """Сохраняет правильный текстовый ответ и запрашивает добавление нового вопроса."""
+    """Сохраняет правильные текстовые ответы и запрашивает добавление нового вопроса."""
+    try:
+        accepted = parse_accepted_answers(message.text)
+    except AnswerFormatError as e:
+        await message.answer(f"Ошибка: {e}. Введите ответ ещё раз.")
+        return
+
     data = await state.get_data()
-    db.update_question_correct_text(data["question_id"], message.text)
+    db.set_question_answers(data["question_id"], accepted)
     await message.answer("Вопрос сохранён. Добавить ещё вопрос? (да/нет)")
     await state.set_state(NewTestStates.add_more_question)
 
@@ -224,7 +280,7 @@ async def process_correct_option(message: Message, state: FSMContext, db: Databa
             raise ValueError("Номер должен быть от 1 до 4.")
     except ValueError:
         await message.answer("Введите число от 1 до 4.")
-        logger.error(f"Ошибка в /new_test (correct_option): неверный номер, user_id: {message.from_user.id}")
+        logger.error("Ошибка в /new_test (correct_option): неверный номер, user_id: %s", message.from_user.id)
         return
 
     data = await state.get_data()
@@ -255,20 +311,15 @@ async def process_add_more_question(message: Message, state: FSMContext) -> None
 
 
 @router.message(F.text == "📝 Пройти тест")
-async def test_from_button(message: Message, state: FSMContext, db: Database, bot: Bot) -> None:
+async def test_from_button(message: Message, state: FSMContext, db: Database, bot: Bot, student: Optional[tuple],
+                           teacher_id: Optional[int]) -> None:
+    owner = tests_owner(student, teacher_id)
+    if owner is None:
+        await message.answer("Вы не зарегистрированы. Нажмите /start, чтобы зарегистрироваться.")
+        return
+
     user_id = message.from_user.id
-    tests = db.get_tests()
-    available_tests: List[Tuple[int, str, int]] = []
-
-    for test in tests:
-        test_id, title, max_attempts = test
-        result = db.get_user_result(user_id, test_id)
-        if result:
-            attempts_left = result[0]
-            if attempts_left > 0:
-                available_tests.append((test_id, title, attempts_left))
-        else:
-            available_tests.append((test_id, title, max_attempts))
+    available_tests = db.get_available_tests(owner, user_id)
 
     if not available_tests:
         await message.answer("Нет доступных тестов или попытки исчерпаны.")
@@ -280,111 +331,118 @@ async def test_from_button(message: Message, state: FSMContext, db: Database, bo
 
 
 @router.callback_query(F.data.startswith("test_"))
-async def process_test_selection(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot) -> None:
+async def process_test_selection(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot,
+                                 student: Optional[tuple], teacher_id: Optional[int]) -> None:
     """Обрабатывает выбор теста и начинает его прохождение."""
     test_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
-    first_name = callback.from_user.first_name
-    last_name = callback.from_user.last_name or ""
 
-    test = db.get_test(test_id)
-    if not test:
+    if not owns_test(db, tests_owner(student, teacher_id), test_id):
         await callback.message.answer(f"Тест не найден.")
         await state.clear()
         return
 
-    attempt_number = db.get_user_attempts(user_id, test_id) + 1
-    if attempt_number > test[2]:
-        await callback.message.answer("У вас больше нет попыток.")
+    snapshot = db.get_test_snapshot(test_id)
+    if snapshot is None:
+        await callback.message.answer("В этом тесте нет вопросов.")
         await state.clear()
         return
 
-    questions = db.get_questions_by_test(test_id)
-    if not questions:
-        await callback.message.answer("В этом тесте нет вопросов.")
+    user = callback.from_user
+    attempt_number = db.start_test_attempt(user_id, user.first_name, user.last_name or "", test_id)
+    if attempt_number is None:
+        await callback.message.answer("У вас больше нет попыток.")
         await state.clear()
         return
 
-    await state.update_data(
-        test_id=test_id,
-        questions=questions,
-        current_index=0,
-        correct_answers=0,
-        user_id=user_id,
-        first_name=first_name,
-        last_name=last_name,
-        attempt_number=attempt_number
-    )
-    await send_next_question(bot, callback.message, state, db)
+    # В FSM хранится только компактная запись, вопросы берутся из общего кэша
+    await state.set_data(TestSession(test_id, snapshot.version, attempt_number).to_data())
+    await send_next_question(bot, callback.message, state, db, callback.from_user)
     await callback.answer()
 
 
 @router.message(TestStates.question)
 async def handle_text_answer(message: Message, state: FSMContext, db: Database, bot: Bot) -> None:
     """Обрабатывает текстовый ответ на вопрос теста."""
-    data = await state.get_data()
-    if "current_question_id" not in data:
+    session, snapshot = await load_test_session(state, db)
+    if session is None:
         await message.answer("Ошибка: вопрос не найден")
         await state.clear()
         return
+    if snapshot is None or session.cursor >= len(snapshot.questions):
+        await send_next_question(bot, message, state, db, message.from_user)
+        return
 
-    if data.get("current_question_type") == "text":
-        question_id = data["current_question_id"]
-        correct_text = db.get_correct_text(question_id)
-
-        user_answer = message.text.lower().strip()
-        if user_answer == correct_text:
-            await state.update_data(correct_answers=data["correct_answers"] + 1)
+    question = snapshot.questions[session.cursor]
+    if question.type != "text" or session.is_answered():
+        return
 
-        db.insert_user_answer(
-            user_id=data["user_id"],
-            test_id=data["test_id"],
-            question_id=question_id,
-            answer_id=None,
-            text_answer=user_answer,
-            attempt_number=data["attempt_number"]
-        )
+    user_answer = (message.text or "").strip()
+    is_correct = db.get_answer_matcher(question.id).match(user_answer)
+    if not db.insert_user_answer(
+        user_id=message.from_user.id,
+        test_id=session.test_id,
+        question_id=question.id,
+        answer_id=None,
+        text_answer=user_answer,
+        attempt_number=session.attempt_number,
+        is_correct=is_correct
+    ):
+        # Ответ на этот вопрос уже записан параллельным обновлением, оно и переходит дальше
+        return
 
-        await state.update_data(current_index=data["current_index"] + 1)
-        await send_next_question(bot, message, state, db)
+    session.record_answer(is_correct)
+    await state.update_data(session.to_data())
+    await send_next_question(bot, message, state, db, message.from_user)
 
 
 @router.callback_query(F.data.startswith("opt_"))
 async def process_answer(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot) -> None:
     """Обрабатывает выбор варианта ответа."""
-    data = await state.get_data()
-    if "current_question_id" not in data:
+    session, snapshot = await load_test_session(state, db)
+    if session is None:
         await callback.message.answer("Ошибка: вопрос не найден")
         await state.clear()
         return
+    if snapshot is None or session.cursor >= len(snapshot.questions):
+        await send_next_question(bot, callback.message, state, db, callback.from_user)
+        await callback.answer()
+        return
 
-    option_id = int(callback.data.split("_")[1])
-    is_correct = db.get_correct_option(option_id)
-
-    if is_correct:
-        await state.update_data(correct_answers=data["correct_answers"] + 1)
+    # Кнопка от предыдущего вопроса или повторное нажатие — ответ уже учтён
+    question = snapshot.questions[session.cursor]
+    option = question.option(int(callback.data.split("_")[1]))
+    if option is None or session.is_answered():
+        await callback.answer()
+        return
 
-    db.insert_user_answer(
-        user_id=data["user_id"],
-        test_id=data["test_id"],
-        question_id=data["current_question_id"],
-        answer_id=option_id,
+    if not db.insert_user_answer(
+        user_id=callback.from_user.id,
+        test_id=session.test_id,
+        question_id=question.id,
+        answer_id=option.id,
         text_answer=None,
-        attempt_number=data["attempt_number"]
-    )
+        attempt_number=session.attempt_number,
+        is_correct=option.is_correct
+    ):
+        # Параллельное нажатие успело записать ответ на этот вопрос — второй раз не засчитываем
+        await callback.answer()
+        return
 
-    await state.update_data(current_index=data["current_index"] + 1)
-    await send_next_question(bot, callback.message, state, db)
+    session.record_answer(option.is_correct)
+    await state.update_data(session.to_data())
+    await send_next_question(bot, callback.message, state, db, callback.from_user)
     await callback.answer()
 
 
 @router.message(F.text == "📊 Результаты тестов")
-async def test_results_from_button(message: Message, db: Database, bot: Bot) -> None:
-    if not is_admin(message.from_user.id):
+async def test_results_from_button(message: Message, db: Database, bot: Bot, is_admin: bool,
+                                   teacher_id: Optional[int]) -> None:
+    if not is_admin:
         await message.answer("Эта функция доступна только учителю.")
         return
 
-    tests = db.get_tests()
+    tests = db.get_tests(teacher_id)
     if not tests:
         await message.answer("Нет доступных тестов.")
         return
@@ -392,32 +450,155 @@ async def test_results_from_button(message: Message, db: Database, bot: Bot) ->
     buttons = [(test[1], f"results_{test[0]}") for test in tests]
     await send_message_with_buttons(bot, message.from_user.id, "Выберите тест для просмотра результатов:", buttons)
 
+def format_leaderboard(title: str, class_number: int, board: Leaderboard, user_id: Optional[int] = None) -> str:
+    """Текст рейтинга: первые места и, если передан user_id, место этого ученика."""
+    lines = [f"🏆 {title} — {class_number} класс"]
+    for place, first_name, last_name, score in board.top(LEADERBOARD_TOP):
+        lines.append(f"{place}. {last_name} {first_name} — {score}")
+    if user_id is not None:
+        rank = board.rank(user_id)
+        if rank is None:
+            lines.append("\nВы ещё не проходили этот тест.")
+        else:
+            lines.append(f"\nВаше место: {rank} из {len(board)}")
+    return "\n".join(lines)
+
+
+@router.message(F.text == "🏆 Рейтинг")
+async def leaderboard_from_button(message: Message, db: Database, bot: Bot, student: Optional[tuple],
+                                  teacher_id: Optional[int]) -> None:
+    owner = tests_owner(student, teacher_id)
+    if owner is None:
+        await message.answer("Вы не зарегистрированы. Нажмите /start, чтобы зарегистрироваться.")
+        return
+
+    tests = db.get_tests(owner)
+    if not tests:
+        await message.answer("Нет доступных тестов.")
+        return
+
+    buttons = [(test[1], f"rating_test_{test[0]}") for test in tests]
+    await send_message_with_buttons(bot, message.from_user.id, "Выберите тест:", buttons)
+
+
+@router.callback_query(F.data.startswith("rating_test_"))
+async def process_leaderboard_test(callback: CallbackQuery, db: Database, student: Optional[tuple],
+                                   is_admin: bool, teacher_id: Optional[int]) -> None:
+    test_id = int(callback.data.split("_")[2])
+    owner = tests_owner(student, teacher_id)
+    test = db.get_test(test_id, owner) if owner is not None else None
+    if not test:
+        await callback.answer("Тест не найден.", show_alert=True)
+        return
+
+    if is_admin:
+        # Учитель выбирает класс, ученик сразу видит рейтинг своего класса
+        await callback.message.answer(
+            "Выберите класс:",
+            reply_markup=get_class_selection_keyboard(db.get_unique_classes(teacher_id), prefix=f"rating_cls_{test_id}_")
+        )
+    elif student:
+        board = db.leaderboards.get(student[3], test_id)
+        await callback.message.answer(format_leaderboard(test[1], student[3], board, callback.from_user.id))
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("rating_cls_"))
+async def process_leaderboard_class(callback: CallbackQuery, db: Database, is_admin: bool,
+                                    teacher_id: Optional[int]) -> None:
+    if not is_admin:
+        await callback.answer()
+        return
+    parts = callback.data.split("_")
+    test_id, class_number = int(parts[2]), int(parts[3])
+    test = db.get_test(test_id, teacher_id)
+    board = db.leaderboards.get(class_number, test_id)
+    if not test or not len(board):
+        await callback.message.answer("В этом классе тест ещё никто не проходил.")
+    else:
+        await callback.message.answer(format_leaderboard(test[1], class_number, board))
+    await callback.answer()
+
+
+@router.message(Command("regrade"))
+async def regrade_start(message: Message, db: Database, bot: Bot, is_admin: bool,
+                        teacher_id: Optional[int]) -> None:
+    """Перепроверка теста после исправления ключа ответов."""
+    if not is_admin:
+        await message.answer("Эта функция доступна только учителю.")
+        return
+
+    tests = db.get_tests(teacher_id)
+    if not tests:
+        await message.answer("Нет доступных тестов.")
+        return
+
+    buttons = [(test[1], f"regrade_{test[0]}") for test in tests]
+    await send_message_with_buttons(bot, message.from_user.id, "Выберите тест для перепроверки:", buttons)
+
+
+@router.callback_query(F.data.startswith("regrade_"))
+async def process_regrade(callback: CallbackQuery, db: Database, is_admin: bool,
+                          teacher_id: Optional[int]) -> None:
+    test_id = int(callback.data.split("_")[1])
+    if not is_admin or not owns_test(db, teacher_id, test_id):
+        await callback.answer()
+        return
+
+    # Перепроверка — редкая операция учителя, её код не нужен при старте воркера
+    from regrade import regrade_test
+
+    report = await asyncio.to_thread(regrade_test, db, test_id)
+    lines = [
+        f"Перепроверено ответов: {report.answers} (оценка изменилась у {report.answers_changed}), "
+        f"завершённых попыток: {report.attempts}.",
+        f"Изменились результаты у {len(report.results_changed)} учеников."
+    ]
+    for first_name, last_name, old_score, new_score in report.results_changed[:MAX_REGRADE_LINES]:
+        lines.append(f"{last_name} {first_name}: {old_score} → {new_score}/{report.total}")
+    if len(report.results_changed) > MAX_REGRADE_LINES:
+        lines.append(f"…и ещё {len(report.results_changed) - MAX_REGRADE_LINES}")
+    await callback.message.answer("\n".join(lines))
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("results_"))
-async def process_test_results_selection(callback: CallbackQuery, db: Database, bot: Bot) -> None:
+async def process_test_results_selection(callback: CallbackQuery, bot: Bot, db: Database, reports: ReportSnapshot,
+                                         teacher_id: Optional[int]) -> None:
     """Показывает список студентов, проходивших тест."""
     test_id = int(callback.data.split("_")[1])
-    users = db.get_test_users(test_id)
+    if not owns_test(db, teacher_id, test_id):
+        await callback.answer()
+        return
+    # Отчёты по тестам читают снимок базы, чтобы не мешать идущим тестам
+    report_db, as_of = reports.reader()
+    users = report_db.get_test_users(test_id)
 
     if not users:
-        await callback.message.answer("Нет результатов для этого теста.")
+        await callback.message.answer(f"Нет результатов для этого теста.{snapshot_note(as_of)}")
         await callback.answer()
         return
 
     buttons = [(f"{user[1]} {user[2]}", f"user_results_{test_id}_{user[0]}") for user in users]
-    await send_message_with_buttons(bot, callback.from_user.id, "Выберите ученика:", buttons)
+    await send_message_with_buttons(bot, callback.from_user.id, f"Выберите ученика:{snapshot_note(as_of)}", buttons)
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("user_results_"))
-async def show_user_test_results(callback: CallbackQuery, db: Database, bot: Bot) -> None:
+async def show_user_test_results(callback: CallbackQuery, bot: Bot, db: Database, reports: ReportSnapshot,
+                                 teacher_id: Optional[int]) -> None:
     """Показывает попытки студента для теста."""
     parts = callback.data.split("_")
     test_id = int(parts[2])
     user_id = int(parts[3])
+    if not owns_test(db, teacher_id, test_id):
+        await callback.answer()
+        return
 
-    attempts = db.get_user_attempt_numbers(user_id, test_id)
+    report_db, as_of = reports.reader()
+    attempts = report_db.get_user_attempt_numbers(user_id, test_id)
     if not attempts:
-        await callback.message.answer("Нет результатов для этого пользователя.")
+        await callback.message.answer(f"Нет результатов для этого пользователя.{snapshot_note(as_of)}")
         await callback.answer()
         return
 
@@ -427,16 +608,21 @@ async def show_user_test_results(callback: CallbackQuery, db: Database, bot: Bot
 
 
 @router.callback_query(F.data.startswith("attempt_"))
-async def show_attempt_details(callback: CallbackQuery, db: Database) -> None:
+async def show_attempt_details(callback: CallbackQuery, db: Database, reports: ReportSnapshot,
+                               teacher_id: Optional[int]) -> None:
     """Показывает детали конкретной попытки."""
     parts = callback.data.split("_")
     test_id = int(parts[1])
     user_id = int(parts[2])
     attempt_number = int(parts[3])
+    if not owns_test(db, teacher_id, test_id):
+        await callback.answer()
+        return
 
-    answers = db.get_attempt_details(user_id, test_id, attempt_number)
+    report_db, as_of = reports.reader()
+    answers = report_db.get_attempt_details(user_id, test_id, attempt_number)
     if not answers:
-        await callback.message.answer("Нет данных об этой попытке.")
+        await callback.message.answer(f"Нет данных об этой попытке.{snapshot_note(as_of)}")
         await callback.answer()
         return
 
@@ -444,6 +630,6 @@ async def show_attempt_details(callback: CallbackQuery, db: Database) -> None:
         f"{i}. {answer[0]}\nОтвет: {answer[1] or answer[2]} {answer[3]}\n"
         for i, answer in enumerate(answers, 1)
     ]
-    await callback.message.answer("\n".join(result))
+    await callback.message.answer("\n".join(result) + snapshot_note(as_of))
     await callback.answer()
 
@@ -0,0 +1,215 @@
+import io
+import itertools
+import json
+import os
+import uuid
+import zipfile
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional, Tuple
+from config import QUESTIONS_DIR, TESTS_DIR
+from matcher import AnswerFormatError, normalize, parse_accepted_answers, parse_number
+
+try:
+    import yaml
+except ImportError:  # PyYAML необязателен: без него принимаются только JSON-файлы
+    yaml = None
+
+TEST_FILE_NAMES = ("test.json", "test.yaml", "test.yml")
+MAX_OPTIONS = 10
+
+
+class TestImportError(ValueError):
+    """Файл теста не удалось разобрать или он не прошёл проверку."""
+
+
+def load_test_file(file_name: str, data: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """
+    Разбирает загруженный файл теста (JSON, YAML или ZIP с test.json/test.yaml и картинками).
+    Возвращает проверенное описание теста и содержимое файлов, на которые оно ссылается.
+    """
+    name = file_name.lower()
+    files: Dict[str, bytes] = {}
+
+    if name.endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile:
+            raise TestImportError("файл не является ZIP-архивом")
+        with archive:
+            members = {PurePosixPath(info.filename).as_posix(): info for info in archive.infolist() if not info.is_dir()}
+            spec_name = next((n for n in TEST_FILE_NAMES if n in members), None)
+            if spec_name is None:
+                raise TestImportError(f"в архиве нет файла {' или '.join(TEST_FILE_NAMES)}")
+            spec = _parse(spec_name, archive.read(members[spec_name]))
+            for path in _referenced_files(spec):
+                if path not in members:
+                    raise TestImportError(f"в архиве нет файла {path}")
+                files[path] = archive.read(members[path])
+    else:
+        spec = _parse(name, data)
+        if _referenced_files(spec):
+            raise TestImportError("картинки можно загрузить только в ZIP-архиве вместе с описанием теста")
+
+    return spec, files
+
+
+def save_test_files(spec: Dict[str, Any], files: Dict[str, bytes]) -> None:
+    """
+    Сохраняет картинки из архива туда же, куда бот скачивает вложения вопросов и вариантов,
+    и подставляет в описание теста пути к сохранённым файлам.
+    """
+    batch = uuid.uuid4().hex[:8]
+    counter = itertools.count(1)
+    stored: Dict[Tuple[str, str], str] = {}
+
+    def store(path: str, dest_dir) -> str:
+        # Одна и та же картинка может встречаться в нескольких вопросах — сохраняем её один раз
+        key = (path, str(dest_dir))
+        if key not in stored:
+            os.makedirs(dest_dir, exist_ok=True)
+            file_path = dest_dir / f"import_{batch}_{next(counter)}_{PurePosixPath(path).name}"
+            with open(file_path, "wb") as f:
+                f.write(files[path])
+            stored[key] = str(file_path)
+        return stored[key]
+
+    for question in spec["questions"]:
+        if question["file"]:
+            question["file"] = store(question["file"], QUESTIONS_DIR)
+        for option in question["options"]:
+            if option["image"]:
+                option["image"] = store(option["image"], TESTS_DIR)
+
+
+def _parse(name: str, data: bytes) -> Dict[str, Any]:
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise TestImportError("файл теста должен быть в кодировке UTF-8")
+
+    if name.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise TestImportError("для YAML-файлов нужен пакет PyYAML, отправьте тест в JSON")
+        try:
+            raw = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise TestImportError(f"не удалось прочитать YAML: {e}")
+    elif name.endswith(".json"):
+        try:
+            raw = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise TestImportError(f"не удалось прочитать JSON: {e}")
+    else:
+        raise TestImportError("поддерживаются файлы .json, .yaml и .zip")
+    return _validate(raw)
+
+
+def _validate(raw: Any) -> Dict[str, Any]:
+    """Проверяет описание теста и приводит его к единому виду."""
+    if not isinstance(raw, dict):
+        raise TestImportError("описание теста должно быть объектом с полями title и questions")
+
+    errors: List[str] = []
+    title = str(raw.get("title") or "").strip()
+    if not title:
+        errors.append("не указано название теста (title)")
+
+    max_attempts = raw.get("max_attempts", 1)
+    if not isinstance(max_attempts, int) or max_attempts <= 0:
+        errors.append("max_attempts должно быть положительным целым числом")
+
+    questions = raw.get("questions")
+    if not isinstance(questions, list) or not questions:
+        errors.append("в тесте нет вопросов (questions)")
+        questions = []
+
+    result = []
+    for number, question in enumerate(questions, 1):
+        try:
+            result.append(_validate_question(question))
+        except TestImportError as e:
+            errors.append(f"вопрос {number}: {e}")
+
+    if errors:
+        raise TestImportError("\n".join(errors[:20]))
+    return {"title": title, "max_attempts": max_attempts, "questions": result}
+
+
+def _validate_question(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise TestImportError("вопрос должен быть объектом")
+
+    text = str(raw.get("text") or "").strip()
+    if not text:
+        raise TestImportError("нет текста вопроса (text)")
+
+    q_type = raw.get("type", "choice")
+    question = {"text": text, "type": q_type, "file": _file_path(raw.get("file")), "options": [], "answers": []}
+
+    if q_type == "text":
+        question["answers"] = _accepted_answers(raw)
+    elif q_type == "choice":
+        options = raw.get("options")
+        if not isinstance(options, list) or not 2 <= len(options) <= MAX_OPTIONS:
+            raise TestImportError(f"нужно от 2 до {MAX_OPTIONS} вариантов ответа (options)")
+        correct = raw.get("correct")
+        if not isinstance(correct, int) or not 1 <= correct <= len(options):
+            raise TestImportError(f"correct должно быть номером варианта от 1 до {len(options)}")
+        for index, option in enumerate(options, 1):
+            if isinstance(option, dict):
+                option_text = str(option.get("text") or "").strip() or None
+                image = _file_path(option.get("image"))
+            else:
+                option_text, image = str(option).strip() or None, None
+            if not option_text and not image:
+                raise TestImportError(f"вариант {index} пустой")
+            question["options"].append({"text": option_text, "image": image, "is_correct": index == correct})
+    else:
+        raise TestImportError("тип вопроса должен быть choice или text")
+
+    return question
+
+
+def _accepted_answers(raw: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """
+    Правильные ответы текстового вопроса: строка или список строк в поле answer
+    (в строке допустимы «|» и «±», как при вводе в боте) и общая погрешность tolerance для чисел.
+    """
+    answer = raw.get("answer")
+    items = answer if isinstance(answer, list) else [answer]
+    tolerance = raw.get("tolerance", 0)
+    if isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) or tolerance < 0:
+        raise TestImportError("tolerance должно быть неотрицательным числом")
+
+    accepted = []
+    try:
+        for item in items:
+            if item is None or not str(item).strip():
+                continue
+            for value, item_tolerance in parse_accepted_answers(str(item)):
+                if not item_tolerance and parse_number(normalize(value)) is not None:
+                    item_tolerance = float(tolerance)
+                accepted.append((value, item_tolerance))
+    except AnswerFormatError as e:
+        raise TestImportError(str(e))
+    if not accepted:
+        raise TestImportError("для текстового вопроса нужен правильный ответ (answer)")
+    return accepted
+
+
+def _file_path(value: Optional[Any]) -> Optional[str]:
+    if not value:
+        return None
+    path = PurePosixPath(str(value))
+    if path.is_absolute() or ".." in path.parts:
+        raise TestImportError(f"недопустимый путь к файлу: {value}")
+    return path.as_posix()
+
+
+def _referenced_files(spec: Dict[str, Any]) -> List[str]:
+    paths = []
+    for question in spec["questions"]:
+        if question["file"]:
+            paths.append(question["file"])
+        paths.extend(option["image"] for option in question["options"] if option["image"])
+    return paths
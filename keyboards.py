@@ -1,5 +1,6 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
+from datetime import datetime
 from typing import List, Tuple
 
 def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
@@ -13,7 +14,10 @@ def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
         KeyboardButton(text="📚 Мои задания"),
         KeyboardButton(text="📝 Пройти тест")
     )
-    builder.row(KeyboardButton(text="❌ Отмена"))
+    builder.row(
+        KeyboardButton(text="🏆 Рейтинг"),
+        KeyboardButton(text="❌ Отмена")
+    )
 
     # Кнопки, доступные только администратору
     if is_admin:
@@ -27,17 +31,23 @@ def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
             KeyboardButton(text="📊 Результаты тестов")
         )
         builder.row(
-            KeyboardButton(text="📥 Скачать ответы учеников")
+            KeyboardButton(text="📥 Скачать ответы учеников"),
+            KeyboardButton(text="🕵 Похожие ответы")
+        )
+        builder.row(
+            KeyboardButton(text="🗓 Запланированные отправки")
         )
 
     # Свойство resize_keyboard=True делает кнопки компактными
     return builder.as_markup(resize_keyboard=True)
 
-def get_class_selection_keyboard(classes: List[int], prefix: str = "class_") -> InlineKeyboardMarkup:
-    """Создает инлайн-клавиатуру для выбора класса."""
+def get_class_selection_keyboard(classes: List[int], prefix: str = "class_", with_all: bool = False) -> InlineKeyboardMarkup:
+    """Создает инлайн-клавиатуру для выбора класса (с кнопкой "Всем классам" при with_all)."""
     builder = InlineKeyboardBuilder()
     for cls in classes:
         builder.button(text=str(cls), callback_data=f"{prefix}{cls}")
+    if with_all:
+        builder.button(text="Всем классам", callback_data=f"{prefix}all")
     builder.adjust(2)
     return builder.as_markup()
 
@@ -63,4 +73,25 @@ def get_send_method_keyboard() -> InlineKeyboardMarkup:
     builder.button(text="Отправить сейчас", callback_data="send_now")
     builder.button(text="Запланировать", callback_data="send_schedule")
     builder.adjust(1)
+    return builder.as_markup()
+
+def get_pending_deliveries_keyboard(deliveries: List[Tuple[int, int, str, int, datetime]]) -> InlineKeyboardMarkup:
+    """Создает инлайн-клавиатуру со списком запланированных отправок для отмены."""
+    builder = InlineKeyboardBuilder()
+    for delivery_id, _, title, class_number, run_at in deliveries:
+        builder.button(
+            text=f"❌ {run_at.strftime('%d.%m.%Y %H:%M')} — {title} ({class_number} класс)",
+            callback_data=f"cancel_delivery_{delivery_id}"
+        )
+    builder.adjust(1)
+    return builder.as_markup()
+
+def get_search_pages_keyboard(page: int, pages: int) -> InlineKeyboardMarkup:
+    """Создает инлайн-клавиатуру для листания результатов поиска по ответам."""
+    builder = InlineKeyboardBuilder()
+    if page > 0:
+        builder.button(text="◀️ Назад", callback_data=f"search_page_{page - 1}")
+    if page + 1 < pages:
+        builder.button(text="Вперёд ▶️", callback_data=f"search_page_{page + 1}")
+    builder.adjust(2)
     return builder.as_markup()
\ No newline at end of file
@@ -0,0 +1,75 @@
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+from config import logger
+
+try:
+    import fcntl
+except ImportError:  # На Windows файловых блокировок fcntl нет — работаем в однопроцессном режиме
+    fcntl = None
+
+
+class LeaderElection:
+    """
+    Выбор лидера среди процессов-воркеров через файловую блокировку.
+
+    Лидер удерживает эксклюзивную блокировку lock-файла до конца жизни процесса.
+    Если процесс-лидер умирает, ОС снимает блокировку, и один из оставшихся
+    воркеров забирает лидерство при следующей попытке.
+    """
+
+    def __init__(self, lock_path: Path, on_elected: Callable[[], None],
+                 on_tick: Optional[Callable[[], None]] = None, interval: float = 15.0):
+        self.lock_path = lock_path
+        self.on_elected = on_elected
+        self.on_tick = on_tick
+        self.interval = interval
+        self.is_leader = False
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def try_acquire(self) -> bool:
+        """Пытается захватить блокировку без ожидания. Возвращает True, если процесс стал лидером."""
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+
+        lock_file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        self.is_leader = True
+        return True
+
+    def start(self) -> None:
+        """Запускает фоновый поток, который периодически пытается стать лидером."""
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает поток и освобождает блокировку."""
+        self._stop.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.is_leader:
+                    if self.try_acquire():
+                        logger.info("Процесс стал лидером (блокировка %s)", self.lock_path)
+                        self.on_elected()
+                elif self.on_tick:
+                    self.on_tick()
+            except Exception as e:
+                logger.error("Ошибка в цикле выбора лидера: %s", e)
+            self._stop.wait(self.interval)
@@ -0,0 +1,87 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Leaderboard:
+    """
+    Рейтинг одного класса по одному тесту.
+    Записи хранятся в отсортированном списке (-балл, фамилия, имя, user_id): место ученика
+    находится двоичным поиском, первые K мест — срезом. Одинаковый балл — одинаковое место.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str, int]] = ()):
+        self._entries: List[Tuple[int, str, str, int]] = []
+        self._by_user: Dict[int, Tuple[int, str, str, int]] = {}
+        for user_id, first_name, last_name, score in rows:
+            self._by_user[user_id] = (-score, last_name, first_name, user_id)
+        self._entries = sorted(self._by_user.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, user_id: int, first_name: str, last_name: str, score: int) -> None:
+        """Добавляет ученика или меняет его балл."""
+        old = self._by_user.get(user_id)
+        if old is not None:
+            del self._entries[bisect_left(self._entries, old)]
+        entry = (-score, last_name, first_name, user_id)
+        self._by_user[user_id] = entry
+        insort(self._entries, entry)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место ученика (с 1) или None, если он ещё не проходил тест."""
+        entry = self._by_user.get(user_id)
+        if entry is None:
+            return None
+        return bisect_left(self._entries, (entry[0],)) + 1
+
+    def top(self, k: int) -> List[Tuple[int, str, str, int]]:
+        """Первые k записей: (место, имя, фамилия, балл)."""
+        result = []
+        for index, (neg_score, last_name, first_name, _) in enumerate(self._entries[:k]):
+            place = index + 1
+            if index and result[-1][3] == -neg_score:
+                place = result[-1][0]
+            result.append((place, first_name, last_name, -neg_score))
+        return result
+
+
+class LeaderboardCache:
+    """
+    Рейтинги по (класс, тест), собранные в памяти процесса.
+    Рейтинг строится из базы при первом обращении и далее обновляется при сохранении результатов.
+    Через ttl секунд он строится заново — так видны результаты, записанные другими воркерами.
+    """
+
+    def __init__(self, loader: Callable[[int, int], List[Tuple[int, str, str, int]]], ttl: float):
+        self._loader = loader
+        self.ttl = ttl
+        self._boards: Dict[Tuple[int, int], Tuple[Leaderboard, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, class_number: int, test_id: int) -> Leaderboard:
+        key = (class_number, test_id)
+        with self._lock:
+            item = self._boards.get(key)
+            if item is not None and item[1] > time.monotonic():
+                return item[0]
+        board = Leaderboard(self._loader(class_number, test_id))
+        with self._lock:
+            self._boards[key] = (board, time.monotonic() + self.ttl)
+        return board
+
+    def update(self, class_number: int, test_id: int, user_id: int, first_name: str, last_name: str,
+               score: int) -> None:
+        """Обновляет уже построенный рейтинг; непостроенный соберётся из базы при первом запросе."""
+        with self._lock:
+            item = self._boards.get((class_number, test_id))
+            if item is not None:
+                item[0].update(user_id, first_name, last_name, score)
+
+    def invalidate_test(self, test_id: int) -> None:
+        """Сбрасывает рейтинги теста во всех классах (после массового пересчёта результатов)."""
+        with self._lock:
+            for key in [key for key in self._boards if key[1] == test_id]:
+                del self._boards[key]
@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+
+# Стандартные поля LogRecord: всё остальное пришло через extra и попадает в JSON отдельными полями
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "suppressed"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение, поля из extra и трассировка."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат с пометкой о пропущенных при выборке записях."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" (пропущено похожих записей: {record.suppressed})"
+        return text
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Выборка частых записей: с одного места вызова (файл и строка) пропускается не больше rate
+    записей за period секунд, остальные отбрасываются до постановки в очередь. Первая запись
+    следующего окна получает поле suppressed — сколько записей было отброшено.
+    Предупреждения и ошибки проходят всегда; rate <= 0 отключает выборку.
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self._lock = threading.Lock()
+        # (файл, строка) -> [начало окна, пропущено в окне, отброшено в окне]
+        self._windows: Dict[Tuple[str, int], List[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.period:
+                self._windows[key] = [record.created, 1, 0]
+                if window is not None and window[2]:
+                    record.suppressed = int(window[2])
+                return True
+            if window[1] < self.rate:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь как есть. Стандартный QueueHandler форматирует сообщение в вызывающем
+    потоке (то есть в цикле событий бота); здесь очередь не покидает процесс, поэтому подстановка
+    аргументов и сериализация в JSON выполняются в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", sample_rate: int = 20) -> QueueListener:
+    """
+    Настраивает корневой логгер: записи уходят в очередь и пишутся в stderr отдельным потоком.
+    fmt — "json" или "text"; sample_rate — сколько записей в секунду пропускать с одного
+    места вызова (ниже WARNING). Возвращает запущенный QueueListener (останавливается при выходе).
+    """
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(RateLimitFilter(sample_rate))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    listener = QueueListener(records, output)
+    listener.start()
+    # При выходе дописываем всё, что осталось в очереди
+    atexit.register(listener.stop)
+    return listener
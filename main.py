@@ -1,13 +1,22 @@
 import asyncio
+from datetime import timedelta
+from functools import partial
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from handlers.common import router as common_router
-from handlers.tasks import router as tasks_router
+from handlers.tasks import router as tasks_router, send_scheduled_task, send_deadline_reminders
 from handlers.tests import router as tests_router
 from db import Database
-from config import BOT_TOKEN, logger, DB_NAME
+from middlewares import AuthMiddleware, MediaGroupMiddleware, UpdateDedupMiddleware
+from delivery import DeliveryScheduler
+from outbox import OutboxWorker
+from snapshot import ReportSnapshot
+from dashboard import Dashboard, start_dashboard
+from file_io import file_io
+from config import BOT_TOKEN, logger, DELIVERY_POLL_INTERVAL, OUTBOX_WORKERS, OUTBOX_POLL_INTERVAL, \
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RATE_LIMIT, REPORT_SNAPSHOT_NAME, REPORT_SNAPSHOT_INTERVAL, REPORT_SNAPSHOT_PAGES, \
+    MEDIA_GROUP_LATENCY, REMINDER_LEAD_HOURS, DASHBOARD_TOKEN, DASHBOARD_HOST, DASHBOARD_PORT, DASHBOARD_CACHE_SIZE, \
+    UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_SIZE
 
 
 
@@ -20,18 +29,39 @@ async def main() -> None:
     # Инициализация базы данных
     db = Database()
 
-    # Инициализация планировщика
-    jobstores = {
-        'default': SQLAlchemyJobStore(url=f'sqlite:///{DB_NAME}')
-    }
-    scheduler = AsyncIOScheduler(jobstores=jobstores)
+    # Очередь исходящих сообщений и планировщик отложенных отправок
+    outbox = OutboxWorker(db, BOT_TOKEN, OUTBOX_WORKERS, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+                          rate_limit=OUTBOX_RATE_LIMIT)
+    outbox.start()
+    scheduler = DeliveryScheduler(db, partial(send_scheduled_task, db, outbox), DELIVERY_POLL_INTERVAL,
+                                  reminders=partial(send_deadline_reminders, db, outbox,
+                                                    timedelta(hours=REMINDER_LEAD_HOURS)))
     scheduler.start()
 
+    # Снимок базы для отчётов учителя
+    reports = ReportSnapshot(db, REPORT_SNAPSHOT_NAME, REPORT_SNAPSHOT_INTERVAL, REPORT_SNAPSHOT_PAGES)
+    reports.start()
+
+    # API панели учителя: учителя входят по своим токенам (/dashboard_token), поэтому запускается всегда
+    dashboard_runner = None
+    dashboard = Dashboard(db, DASHBOARD_TOKEN, DASHBOARD_CACHE_SIZE)
+    try:
+        dashboard_runner = await start_dashboard(dashboard, DASHBOARD_HOST, DASHBOARD_PORT)
+    except OSError as e:
+        logger.error("Не удалось запустить API панели учителя на %s:%s: %s", DASHBOARD_HOST, DASHBOARD_PORT, e)
+
     # Подключение роутеров
     dp.include_router(common_router)
     dp.include_router(tasks_router)
     dp.include_router(tests_router)
 
+    # Определение студента и прав учителя один раз на обновление
+    # Повторно доставленные обновления отбрасываются до хендлеров (polling — один процесс, хватает памяти)
+    dp.update.outer_middleware(UpdateDedupMiddleware(window=UPDATE_DEDUP_WINDOW, maxsize=UPDATE_DEDUP_SIZE))
+    dp.message.middleware(AuthMiddleware())
+    dp.message.middleware(MediaGroupMiddleware(MEDIA_GROUP_LATENCY))
+    dp.callback_query.middleware(AuthMiddleware())
+
     # Middleware для передачи Database и Scheduler в хендлеры
     async def on_startup(dispatcher: Dispatcher) -> None:
         """Выполняется при старте бота."""
@@ -39,7 +69,14 @@ async def main() -> None:
 
     async def on_shutdown(dispatcher: Dispatcher) -> None:
         """Выполняется при остановке бота."""
+        nonlocal dashboard_runner
+        if dashboard_runner is not None:
+            await dashboard_runner.cleanup()
+            dashboard_runner = None
         scheduler.shutdown()
+        outbox.shutdown()
+        reports.shutdown()
+        file_io.shutdown()
         await bot.session.close()
         await dp.storage.close()
         logger.info("Бот остановлен")
@@ -49,9 +86,9 @@ async def main() -> None:
 
     # Запуск бота
     try:
-        await dp.start_polling(bot, db=db, scheduler=scheduler)
+        await dp.start_polling(bot, db=db, scheduler=scheduler, outbox=outbox, reports=reports)
     except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {e}")
+        logger.error("Ошибка при запуске бота: %s", e)
     finally:
         await on_shutdown(dp)
 
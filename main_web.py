@@ -1,16 +1,24 @@
 import asyncio
-from flask import Flask, request, abort
+from datetime import timedelta
+from functools import partial
+from flask import Flask, Response, request, abort
 from aiogram import Bot, Dispatcher, types
-from aiogram.fsm.storage.memory import MemoryStorage
-
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 
 from handlers.common import router as common_router
-from handlers.tasks import router as tasks_router
+from handlers.tasks import router as tasks_router, send_scheduled_task, send_deadline_reminders
 from handlers.tests import router as tests_router
 from db import Database
-from config import BOT_TOKEN, DB_NAME, logger
+from fsm_storage import SQLiteStorage
+from middlewares import AuthMiddleware, MediaGroupMiddleware, UpdateDedupMiddleware
+from delivery import DeliveryScheduler
+from outbox import OutboxWorker
+from leader import LeaderElection
+from snapshot import ReportSnapshot
+from dashboard import Dashboard
+from config import BOT_TOKEN, SCHEDULER_LOCK_FILE, LEADER_POLL_INTERVAL, DELIVERY_POLL_INTERVAL, OUTBOX_WORKERS, \
+    OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS, OUTBOX_RATE_LIMIT, REPORT_SNAPSHOT_NAME, REPORT_SNAPSHOT_INTERVAL, \
+    REPORT_SNAPSHOT_PAGES, MEDIA_GROUP_LATENCY, REMINDER_LEAD_HOURS, DASHBOARD_TOKEN, DASHBOARD_CACHE_SIZE, \
+    UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_SIZE, logger
 
 # --- НАСТРОЙКИ ---
 WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
@@ -20,22 +28,49 @@ WEBHOOK_URL = f"https://{WEB_SERVER_HOST}{WEBHOOK_PATH}"
 
 # --- ИНИЦИАЛИЗАЦИЯ AIOGRAM ---
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
 db = Database()
+# Обновления одного пользователя приходят в разные воркеры — состояние диалогов храним в базе
+storage = SQLiteStorage(db)
+dp = Dispatcher(storage=storage)
+
+# Настраиваем очередь исходящих сообщений и планировщик
+outbox = OutboxWorker(db, BOT_TOKEN, OUTBOX_WORKERS, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+                      rate_limit=OUTBOX_RATE_LIMIT)
+scheduler = DeliveryScheduler(db, partial(send_scheduled_task, db, outbox), DELIVERY_POLL_INTERVAL,
+                              reminders=partial(send_deadline_reminders, db, outbox,
+                                                timedelta(hours=REMINDER_LEAD_HOURS)))
+reports = ReportSnapshot(db, REPORT_SNAPSHOT_NAME, REPORT_SNAPSHOT_INTERVAL, REPORT_SNAPSHOT_PAGES)
+dashboard = Dashboard(db, DASHBOARD_TOKEN, DASHBOARD_CACHE_SIZE)
+# Повтор вебхука может прийти в другой воркер — принятые update_id помним и в базе
+dedup = UpdateDedupMiddleware(db, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_SIZE)
+
+
+def start_background_jobs() -> None:
+    """Запускает фоновую отправку и обновление снимка для отчётов в процессе-лидере."""
+    outbox.start()
+    scheduler.start()
+    reports.start()
 
-# Настраиваем планировщик
-jobstores = {
-    'default': SQLAlchemyJobStore(url=f'sqlite:///{DB_NAME}')
-}
-scheduler = BackgroundScheduler(jobstores=jobstores)
+
+# Любой воркер может запланировать отправку или поставить сообщения в outbox (это просто
+# строки в базе), а отправляет их только один процесс — владелец файловой блокировки.
+# Он же периодически удаляет устаревшие ключи принятых обновлений.
+leader = LeaderElection(SCHEDULER_LOCK_FILE, start_background_jobs, on_tick=dedup.prune,
+                        interval=LEADER_POLL_INTERVAL)
 
 # Подключаем роутеры и передаем зависимости
 dp.include_router(common_router)
 dp.include_router(tasks_router)
 dp.include_router(tests_router)
+dp.update.outer_middleware(dedup)
+dp.message.middleware(AuthMiddleware())
+# Сообщения альбома тоже приходят в разные воркеры — собираем их через базу
+dp.message.middleware(MediaGroupMiddleware(MEDIA_GROUP_LATENCY, db))
+dp.callback_query.middleware(AuthMiddleware())
 dp["db"] = db
 dp["scheduler"] = scheduler
+dp["outbox"] = outbox
+dp["reports"] = reports
 
 # --- ИНИЦИАЛИЗАЦИЯ FLASK ---
 app = Flask(__name__)
@@ -56,22 +91,24 @@ def webhook():
         abort(403)
 
 
-# Функции для запуска/остановки планировщика
-@app.before_request
-def start_scheduler():
-    if not scheduler.running:
-        scheduler.start()
-        logger.info("Планировщик запущен.")
-
+@app.route('/api/<path:tail>', methods=['GET'])
+def dashboard_api(tail: str):
+    """
+    API панели учителя (только чтение, JSON). Доступ по токену учителя (/dashboard_token)
+    или по DASHBOARD_TOKEN владельца бота.
+    """
+    response = dashboard.respond(request.path, request.headers.get('Authorization'),
+                                 request.headers.get('If-None-Match'))
+    headers = {'Cache-Control': 'private, no-cache'}
+    if response.etag:
+        headers['ETag'] = response.etag
+    if response.status == 304:
+        return Response(status=304, headers=headers)
+    return Response(response.body, status=response.status, headers=headers,
+                    content_type='application/json; charset=utf-8')
 
-@app.teardown_request
-def shutdown_scheduler(exception=None):
-    # Этот обработчик нам не нужен, т.к. планировщик должен работать всегда
-    pass
 
-if not scheduler.running:
-    scheduler.start()
-    logger.info("Планировщик запущен в фоновом режиме.")
+leader.start()
 
 # --- ДЛЯ ЛОКАЛЬНОГО ТЕСТА ---
 # Этот блок больше не нужен для продакшена, но может быть полезен для отладки
@@ -83,9 +120,7 @@ if __name__ == '__main__':
 
 
     async def run_polling():
-        if not scheduler.running:
-            scheduler.start()
-        await dp.start_polling(bot, db=db, scheduler=scheduler)
+        await dp.start_polling(bot, db=db, scheduler=scheduler, outbox=outbox, reports=reports)
 
 
     asyncio.run(run_polling())
\ No newline at end of file
@@ -0,0 +1,90 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# Варианты правильного ответа при вводе учителем разделяются «|», погрешность — «±» или «+-»:
+# «3,5 | три с половиной», «3.14 ± 0.01»
+ANSWER_SEPARATOR = "|"
+_TOLERANCE_RE = re.compile(r"\s*(?:±|\+-|\+/-)\s*")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:e[-+]?\d+)?")
+
+
+class AnswerFormatError(ValueError):
+    """Правильный ответ записан в неверном формате."""
+
+
+def normalize(text: str) -> str:
+    """
+    Приводит ответ к каноническому виду: регистр, «ё» → «е», лишние пробелы,
+    десятичная запятая между цифрами → точка.
+    """
+    text = " ".join(text.lower().replace("ё", "е").split())
+    return re.sub(r"(?<=\d),(?=\d)", ".", text)
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Разбирает нормализованный ответ как число (пробелы-разделители разрядов допускаются)."""
+    compact = text.replace(" ", "")
+    if not _NUMBER_RE.fullmatch(compact):
+        return None
+    return float(compact)
+
+
+def parse_accepted_answers(raw: str) -> List[Tuple[str, float]]:
+    """
+    Разбирает строку учителя в список (ответ, погрешность).
+    Погрешность допустима только у числовых ответов.
+    """
+    accepted = []
+    for part in raw.split(ANSWER_SEPARATOR):
+        answer, *tolerance = _TOLERANCE_RE.split(part.strip())
+        answer = answer.strip()
+        if not answer:
+            continue
+        if not tolerance:
+            accepted.append((answer, 0.0))
+            continue
+        value = parse_number(normalize(tolerance[0]))
+        if len(tolerance) > 1 or value is None or value < 0:
+            raise AnswerFormatError(f"погрешность для «{answer}» должна быть неотрицательным числом")
+        if parse_number(normalize(answer)) is None:
+            raise AnswerFormatError(f"погрешность можно указать только для числового ответа, а «{answer}» — не число")
+        accepted.append((answer, value))
+    if not accepted:
+        raise AnswerFormatError("не указан ни один правильный ответ")
+    return accepted
+
+
+class AnswerMatcher:
+    """
+    Скомпилированная проверка текстового ответа на вопрос.
+    Строится один раз по списку принятых ответов; проверка — поиск в множестве
+    нормализованных строк и сравнение с несколькими числовыми интервалами.
+    """
+
+    __slots__ = ("exact", "ranges")
+
+    def __init__(self, accepted: Iterable[Tuple[str, float]]):
+        exact = set()
+        ranges = []
+        for answer, tolerance in accepted:
+            normalized = normalize(answer)
+            value = parse_number(normalized)
+            if value is None:
+                exact.add(normalized)
+            else:
+                # «3.5» и «3.50» — один и тот же ответ, поэтому числа сравниваем как числа
+                # Запас на погрешность двоичного представления: 3.14 ± 0.01 должно принять 3.13
+                slack = tolerance + 1e-9 * max(1.0, abs(value))
+                ranges.append((value - slack, value + slack))
+        self.exact = frozenset(exact)
+        self.ranges = tuple(ranges)
+
+    def match(self, text: str) -> bool:
+        normalized = normalize(text)
+        if normalized in self.exact:
+            return True
+        if self.ranges:
+            value = parse_number(normalized)
+            if value is not None:
+                return any(low <= value <= high for low, high in self.ranges)
+        return False
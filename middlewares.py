@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject, Update, User
+from cache import TTLCache
+from db import Database
+from config import logger
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """
+    Отбрасывает повторно доставленные обновления до того, как их увидит любой хендлер.
+    Telegram присылает обновление вебхука снова, если ответа не было вовремя, — без этой защиты
+    повторный callback записал бы второй ответ на вопрос теста и засчитал бы его дважды.
+
+    Ключи обновления (update_id и id callback-запроса) помнятся window секунд: в памяти процесса
+    (не больше maxsize ключей), а если передана db — ещё и в таблице processed_updates, общей для
+    всех воркеров вебхука. В базу записываются только обновления, повтор которых может что-то
+    записать дважды: нажатия кнопок, шаги диалогов (есть состояние FSM) и команды. Кнопки меню
+    без состояния только читают данные — для них хватает памяти процесса, и запись в базу
+    (глобальная блокировка SQLite) не нужна. Устаревшие ключи удаляет prune() по таймеру.
+    Если хендлер упал, ключи забываются: Telegram повторит обновление, и его нужно обработать.
+    Подключается к dp.update как outer middleware (после FSMContextMiddleware — нужен raw_state).
+    """
+
+    def __init__(self, db: Optional[Database] = None, window: float = 600.0, maxsize: int = 10000):
+        self.db = db
+        self.window = window
+        self._seen = TTLCache(maxsize, window)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        keys = [f"u{event.update_id}"]
+        if event.callback_query is not None:
+            keys.append(f"c{event.callback_query.id}")
+        shared = self.db is not None and self._has_side_effects(event, data)
+        if not self._claim(keys, shared):
+            logger.info("Повторная доставка обновления %s пропущена", event.update_id)
+            return UNHANDLED
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            self._release(keys, shared)
+            raise
+
+    def prune(self) -> None:
+        """Удаляет из базы ключи старше window (вызывается периодически в процессе-лидере)."""
+        if self.db is not None:
+            self.db.prune_processed_updates(time.time() - self.window)
+
+    @staticmethod
+    def _has_side_effects(event: Update, data: Dict[str, Any]) -> bool:
+        if event.callback_query is not None:
+            return True
+        message = event.message
+        if message is None:
+            return False
+        return data.get("raw_state") is not None or (message.text or "").startswith("/")
+
+    def _claim(self, keys: List[str], shared: bool) -> bool:
+        # Сначала память процесса: повтор обычно приходит в тот же воркер, и база не нужна
+        claimed = [key for key in keys if self._seen.add(key)]
+        if len(claimed) < len(keys):
+            for key in claimed:
+                self._seen.invalidate(key)
+            return False
+        if not shared:
+            return True
+        try:
+            return self.db.claim_updates(keys, time.time(), self.window)
+        except Exception:
+            # Обновление не принято (например, база заблокирована) — повтор Telegram нужно обработать
+            for key in keys:
+                self._seen.invalidate(key)
+            raise
+
+    def _release(self, keys: List[str], shared: bool) -> None:
+        for key in keys:
+            self._seen.invalidate(key)
+        if shared:
+            self.db.release_updates(keys)
+
+
+class AuthMiddleware(BaseMiddleware):
+    """
+    Один раз на обновление определяет, кто пишет боту, и передаёт хендлерам:
+    - student: запись студента из кэша (или None, если пользователь не зарегистрирован);
+    - teacher_id: ID учителя (или None, если пользователь не учитель);
+    - is_admin: является ли пользователь учителем.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        db: Database = data["db"]
+        if user is not None:
+            data["student"] = db.get_student_cached(user.id)
+            data["teacher_id"] = db.get_teacher_id_cached(user.id)
+        else:
+            data["student"] = None
+            data["teacher_id"] = None
+        data["is_admin"] = data["teacher_id"] is not None
+        return await handler(event, data)
+
+
+class MediaGroupMiddleware(BaseMiddleware):
+    """
+    Собирает сообщения одного альбома (media_group_id) и вызывает хендлер один раз на весь альбом.
+    Действует только на хендлеры с флагом album (flags={"album": True}); они получают
+    album — сообщения альбома по порядку (для одиночного сообщения album не передаётся).
+
+    Первое сообщение альбома ждёт, пока latency секунд не придёт ни одного нового, остальные
+    только складываются в буфер. Без db буфер живёт в памяти процесса (polling, один процесс).
+    В вебхуке сообщения одного альбома приходят в разные воркеры, поэтому с db они собираются
+    в таблице media_group_messages: каждое сообщение ждёт тишины latency секунд, а альбом
+    целиком забирает тот воркер, который успел первым; остальные завершают обработку.
+    """
+
+    # Сообщения альбома, который никто не забрал (воркер упал), удаляются через столько секунд
+    ABANDONED_AFTER = 3600.0
+
+    def __init__(self, latency: float = 0.5, db: Optional[Database] = None):
+        self.latency = latency
+        self.db = db
+        self._lock = threading.Lock()
+        # (chat_id, media_group_id) -> (сообщения, время последнего)
+        self._albums: Dict[Tuple[int, str], Tuple[List[Message], float]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or not event.media_group_id or not get_flag(data, "album"):
+            return await handler(event, data)
+        if self.db is not None:
+            return await self._collect_shared(handler, event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        with self._lock:
+            album = self._albums.get(key)
+            if album is not None:
+                album[0].append(event)
+                self._albums[key] = (album[0], time.monotonic())
+                return None
+            self._albums[key] = ([event], time.monotonic())
+
+        while True:
+            with self._lock:
+                messages, last_seen = self._albums[key]
+                wait = last_seen + self.latency - time.monotonic()
+                if wait <= 0:
+                    del self._albums[key]
+                    break
+            await asyncio.sleep(wait)
+
+        data["album"] = sorted(messages, key=lambda message: message.message_id)
+        return await handler(event, data)
+
+    async def _collect_shared(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat_id, media_group_id = event.chat.id, event.media_group_id
+        self.db.add_media_group_message(chat_id, media_group_id, event.message_id, event.model_dump_json(),
+                                        time.time())
+        while True:
+            last_seen = self.db.get_media_group_last_seen(chat_id, media_group_id)
+            if last_seen is None:
+                return None  # альбом уже забрал другой воркер
+            wait = last_seen + self.latency - time.time()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        payloads = self.db.claim_media_group(chat_id, media_group_id, time.time() - self.ABANDONED_AFTER)
+        if not payloads:
+            return None
+        bot = data.get("bot")
+        data["album"] = [Message.model_validate_json(payload, context={"bot": bot}) for payload in payloads]
+        return await handler(event, data)
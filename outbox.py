@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from db import Database
+from file_types import is_photo_path
+from file_io import file_io
+from config import logger
+
+
+class OutboxWorker:
+    """
+    Отправляет сообщения из таблицы outbox.
+
+    Сообщения ставятся в очередь в одной транзакции с бизнес-записью, поэтому после
+    перезапуска отправка продолжается ровно с того получателя, на котором остановилась.
+    Фоновый поток держит свой event loop и пул корутин-отправителей с общим
+    ограничением скорости; неудачные отправки повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, db: Database, token: str, workers: int = 4, poll_interval: float = 5.0,
+                 max_attempts: int = 5, retry_delay: float = 5.0, rate_limit: float = 25.0):
+        self.db = db
+        self.token = token
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rate_limit = rate_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._last_send = 0.0
+        # Сообщения в статусе 'sending', отметку о которых не удалось записать (например, база занята)
+        self._unsettled: Dict[int, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Запускает фоновый поток отправки."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="outbox", daemon=True)
+        self._thread.start()
+        logger.info("Отправка сообщений из outbox запущена")
+
+    def wakeup(self) -> None:
+        """Будит отправителей после постановки новых сообщений (из любого потока)."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    def shutdown(self) -> None:
+        """Останавливает отправку; недоотправленные сообщения останутся в очереди."""
+        self._stop.set()
+        self.wakeup()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        logger.info("Отправка сообщений из outbox остановлена")
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        bot = Bot(token=self.token)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        senders = [asyncio.create_task(self._sender(bot, queue)) for _ in range(self.workers)]
+
+        # Сообщения, которые умерший процесс успел взять в работу, возвращаем в очередь
+        try:
+            reset = self.db.reset_stale_outbox()
+            if reset:
+                logger.info("Возвращено в очередь недоотправленных сообщений: %s", reset)
+        except Exception as e:
+            logger.error("Не удалось вернуть в очередь недоотправленные сообщения: %s", e)
+
+        try:
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                self._release_unsettled()
+                try:
+                    batch = self.db.claim_outbox_batch(self.workers * 4)
+                except Exception as e:
+                    logger.error("Ошибка чтения outbox: %s", e)
+                    batch = []
+
+                for message in batch:
+                    await queue.put(message)
+                if batch:
+                    await queue.join()
+                    continue
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for sender in senders:
+                sender.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+            await bot.session.close()
+            self._loop = None
+
+    async def _sender(self, bot: Bot, queue: asyncio.Queue) -> None:
+        while True:
+            message = await queue.get()
+            try:
+                await self._deliver(bot, *message)
+            except Exception as e:
+                # Отправитель не должен завершаться: иначе очередь встанет до перезапуска.
+                # Строка остаётся в 'sending' и возвращается в очередь на следующем проходе.
+                logger.error("Ошибка обработки сообщения %s из outbox: %s", message[0], e)
+                self._unsettled[message[0]] = str(e)
+            finally:
+                queue.task_done()
+
+    def _release_unsettled(self) -> None:
+        """Возвращает в очередь сообщения, которые отправители не смогли отметить."""
+        for message_id, error in list(self._unsettled.items()):
+            try:
+                self.db.mark_outbox_retry(message_id, self.retry_delay, error, count_attempt=False)
+            except Exception as e:
+                logger.error("Не удалось вернуть сообщение %s в очередь outbox: %s", message_id, e)
+                return
+            del self._unsettled[message_id]
+
+    async def _deliver(self, bot: Bot, message_id: int, chat_id: int, text: str,
+                       file_path: Optional[str], attempts: int) -> None:
+        try:
+            await self._throttle()
+            if file_path and is_photo_path(file_path):
+                await bot.send_photo(chat_id=chat_id, photo=file_io.input_file(file_path), caption=text)
+            elif file_path:
+                await bot.send_document(chat_id=chat_id, document=file_io.input_file(file_path), caption=text)
+            else:
+                await bot.send_message(chat_id=chat_id, text=text)
+        except TelegramRetryAfter as e:
+            self.db.mark_outbox_retry(message_id, e.retry_after, str(e), count_attempt=False)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат не существует — повторять бессмысленно
+            self.db.mark_outbox_failed(message_id, str(e))
+            logger.error("Сообщение %s в чат %s не доставлено: %s", message_id, chat_id, e)
+        except Exception as e:
+            if attempts + 1 >= self.max_attempts:
+                self.db.mark_outbox_failed(message_id, str(e))
+                logger.error("Сообщение %s в чат %s не доставлено после %s попыток: %s", message_id, chat_id, attempts + 1, e)
+            else:
+                self.db.mark_outbox_retry(message_id, self.retry_delay * 2 ** attempts, str(e))
+        else:
+            self.db.mark_outbox_sent(message_id)
+
+    async def _throttle(self) -> None:
+        """Общий для всех отправителей лимит сообщений в секунду (ограничение Telegram ~30/с)."""
+        async with self._send_lock:
+            delay = self._last_send + 1 / self.rate_limit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_send = time.monotonic()
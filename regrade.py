@@ -0,0 +1,122 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from db import Database
+from matcher import AnswerMatcher
+from config import logger
+
+
+class RegradeReport(NamedTuple):
+    answers: int          # всего проверено ответов на вопросы
+    answers_changed: int  # у скольких изменилась оценка
+    attempts: int         # всего завершённых попыток
+    results_changed: List[Tuple[str, str, int, int]]  # (имя, фамилия, было, стало)
+    total: int            # вопросов в тесте
+
+
+def regrade_test(db: Database, test_id: int) -> RegradeReport:
+    """
+    Перепроверяет все ответы на тест по текущему ключу и пересчитывает лучшие результаты.
+
+    Работает несколькими запросами над множествами строк в одной транзакции: оценки
+    текстовых ответов считает SQL-функция answer_matches, вызывающая скомпилированные
+    проверки вопросов теста, варианты ответа сверяются с options.is_correct.
+    Лучший результат — максимум правильных ответов по завершённым попыткам ученика (с ответами
+    на все вопросы); начатые и брошенные попытки результат не меняют.
+    """
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Ключ только что изменили — проверки строим заново, а не берём из кэша
+            cursor.execute("""
+                SELECT qa.question_id, qa.answer, qa.tolerance
+                FROM question_accepted_answers qa
+                JOIN questions q ON q.id = qa.question_id
+                WHERE q.test_id = ?
+            """, (test_id,))
+            accepted: Dict[int, list] = {}
+            for question_id, answer, tolerance in cursor.fetchall():
+                accepted.setdefault(question_id, []).append((answer, tolerance))
+            matchers = {question_id: AnswerMatcher(answers) for question_id, answers in accepted.items()}
+
+            def answer_matches(question_id: int, text: Optional[str]) -> int:
+                matcher = matchers.get(question_id)
+                return int(matcher is not None and text is not None and matcher.match(text))
+
+            conn.create_function("answer_matches", 2, answer_matches, deterministic=True)
+
+            cursor.execute("DROP TABLE IF EXISTS temp.regrade_answers")
+            # Первичные ключи во временных таблицах — чтобы коррелированные подзапросы шли по индексу
+            cursor.execute("CREATE TEMP TABLE regrade_answers (id INTEGER PRIMARY KEY, is_correct INTEGER NOT NULL)")
+            cursor.execute("""
+                INSERT INTO temp.regrade_answers (id, is_correct)
+                SELECT ua.id,
+                       CASE WHEN ua.answer_id IS NOT NULL THEN COALESCE(o.is_correct, 0)
+                            ELSE answer_matches(ua.question_id, ua.text_answer) END
+                FROM user_answers ua
+                LEFT JOIN options o ON o.id = ua.answer_id
+                WHERE ua.test_id = ?
+            """, (test_id,))
+            answers = cursor.execute("SELECT COUNT(*) FROM temp.regrade_answers").fetchone()[0]
+            cursor.execute("""
+                UPDATE user_answers
+                SET is_correct = (SELECT r.is_correct FROM temp.regrade_answers r WHERE r.id = user_answers.id)
+                WHERE id IN (
+                    SELECT r.id FROM temp.regrade_answers r
+                    JOIN user_answers ua ON ua.id = r.id
+                    WHERE ua.is_correct != r.is_correct
+                )
+            """)
+            answers_changed = cursor.rowcount
+
+            total = cursor.execute("SELECT COUNT(*) FROM questions WHERE test_id = ?", (test_id,)).fetchone()[0]
+            cursor.execute("DROP TABLE IF EXISTS temp.regrade_scores")
+            cursor.execute("""
+                CREATE TEMP TABLE regrade_scores (
+                    user_id INTEGER PRIMARY KEY, best_score INTEGER NOT NULL, attempts INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("""
+                INSERT INTO temp.regrade_scores (user_id, best_score, attempts)
+                SELECT user_id, MAX(score), COUNT(*)
+                FROM (
+                    SELECT user_id, attempt_number, SUM(is_correct) AS score
+                    FROM user_answers
+                    WHERE test_id = ?
+                    GROUP BY user_id, attempt_number
+                    HAVING COUNT(DISTINCT question_id) >= ?
+                )
+                GROUP BY user_id
+            """, (test_id, total))
+            attempts = cursor.execute("SELECT COALESCE(SUM(attempts), 0) FROM temp.regrade_scores").fetchone()[0]
+
+            cursor.execute("""
+                SELECT ur.first_name, ur.last_name, ur.best_score, s.best_score
+                FROM user_results ur
+                JOIN temp.regrade_scores s ON s.user_id = ur.user_id
+                WHERE ur.test_id = ? AND ur.total IS NOT NULL AND ur.best_score != s.best_score
+                ORDER BY ur.last_name, ur.first_name
+            """, (test_id,))
+            results_changed = cursor.fetchall()
+            cursor.execute("""
+                UPDATE user_results
+                SET best_score = (SELECT s.best_score FROM temp.regrade_scores s WHERE s.user_id = user_results.user_id),
+                    total = ?
+                WHERE test_id = ? AND total IS NOT NULL AND user_id IN (SELECT user_id FROM temp.regrade_scores)
+            """, (total, test_id))
+
+            cursor.execute("DROP TABLE temp.regrade_answers")
+            cursor.execute("DROP TABLE temp.regrade_scores")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    db.matcher_cache.clear()
+    db.leaderboards.invalidate_test(test_id)
+    db.test_cache.invalidate(test_id)
+    report = RegradeReport(answers, answers_changed, attempts, results_changed, total)
+    logger.info(
+        "Перепроверка теста %s: ответов %s, изменено %s, попыток %s, изменено результатов %s",
+        test_id, answers, answers_changed, attempts, len(results_changed)
+    )
+    return report
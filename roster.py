@@ -0,0 +1,108 @@
+import codecs
+import csv
+import io
+import re
+import secrets
+from typing import IO, Iterable, List, NamedTuple, Optional, Tuple
+
+# Код приглашения передаётся в deep link /start, поэтому только символы, разрешённые Telegram
+INVITE_CODE_RE = re.compile(r"^[A-Za-z0-9_-]{4,64}$")
+MAX_ERRORS = 20
+
+
+class RosterRow(NamedTuple):
+    """Строка списка учеников: telegram_id задан либо он, либо код приглашения."""
+    first_name: str
+    last_name: str
+    class_number: int
+    telegram_id: Optional[int]
+    invite_code: Optional[str]
+
+
+def generate_invite_code() -> str:
+    """Создаёт случайный код приглашения для deep link."""
+    return secrets.token_hex(6)
+
+
+def generate_join_code() -> str:
+    """Создаёт код ссылки учителя, по которой ученики регистрируются в его классах."""
+    return "join_" + secrets.token_hex(6)
+
+
+def open_roster(raw: IO[bytes]) -> IO[str]:
+    """Открывает загруженный CSV как текст: UTF-8 (в т.ч. с BOM), иначе cp1251 из Excel."""
+    head = raw.read(4096)
+    raw.seek(0)
+    try:
+        # Граница 4096 байт может разрезать многобайтовый символ — незаконченный хвост не ошибка
+        codecs.getincrementaldecoder("utf-8-sig")().decode(head, final=len(head) < 4096)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "cp1251"
+    return io.TextIOWrapper(raw, encoding=encoding, newline="")
+
+
+def parse_roster(lines: Iterable[str]) -> Tuple[List[RosterRow], List[str]]:
+    """
+    Разбирает CSV за один проход: имя, фамилия, класс и необязательный telegram id или код приглашения.
+    Разделитель (запятая или точка с запятой) определяется по первой строке, строка заголовка пропускается.
+    Возвращает корректные строки и список ошибок с номерами строк.
+    """
+    rows: List[RosterRow] = []
+    errors: List[str] = []
+    seen_ids, seen_codes = set(), set()
+    lines = iter(lines)
+
+    first_line = next(lines, "")
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+
+    def all_lines():
+        yield first_line
+        yield from lines
+
+    for line_number, record in enumerate(csv.reader(all_lines(), delimiter=delimiter), 1):
+        record = [field.strip() for field in record]
+        if not any(record):
+            continue
+        if len(errors) >= MAX_ERRORS:
+            break
+        if len(record) < 3:
+            errors.append(f"строка {line_number}: нужно минимум 3 поля (имя, фамилия, класс)")
+            continue
+
+        first_name, last_name, class_field = record[:3]
+        extra = record[3] if len(record) > 3 else ""
+
+        if not class_field.isdigit():
+            if line_number == 1:
+                continue  # заголовок
+            errors.append(f"строка {line_number}: номер класса должен быть числом, а не «{class_field}»")
+            continue
+        class_number = int(class_field)
+        if class_number <= 0:
+            errors.append(f"строка {line_number}: номер класса должен быть положительным")
+            continue
+        if not first_name or not last_name:
+            errors.append(f"строка {line_number}: не указаны имя или фамилия")
+            continue
+
+        telegram_id, invite_code = None, None
+        if extra.isdigit():
+            telegram_id = int(extra)
+            if telegram_id in seen_ids:
+                errors.append(f"строка {line_number}: telegram id {telegram_id} повторяется")
+                continue
+            seen_ids.add(telegram_id)
+        else:
+            invite_code = extra or generate_invite_code()
+            if not INVITE_CODE_RE.match(invite_code):
+                errors.append(f"строка {line_number}: код приглашения может содержать только латиницу, цифры, _ и -")
+                continue
+            if invite_code in seen_codes:
+                errors.append(f"строка {line_number}: код приглашения {invite_code} повторяется")
+                continue
+            seen_codes.add(invite_code)
+
+        rows.append(RosterRow(first_name, last_name, class_number, telegram_id, invite_code))
+
+    return rows, errors
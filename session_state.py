@@ -0,0 +1,78 @@
+import zlib
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+
+class CachedOption(NamedTuple):
+    id: int
+    text: Optional[str]
+    image_path: Optional[str]
+    is_correct: bool
+
+
+class CachedQuestion(NamedTuple):
+    id: int
+    text: str
+    file_path: Optional[str]
+    type: str
+    options: Tuple[CachedOption, ...]
+
+    def option(self, option_id: int) -> Optional[CachedOption]:
+        return next((option for option in self.options if option.id == option_id), None)
+
+
+class TestSnapshot(NamedTuple):
+    """Вопросы теста с вариантами ответа — одна копия на процесс для всех проходящих тест."""
+    test_id: int
+    version: int
+    questions: Tuple[CachedQuestion, ...]
+
+
+def snapshot_version(questions: Tuple[CachedQuestion, ...]) -> int:
+    """
+    Версия набора вопросов: контрольная сумма id вопросов и вариантов.
+    Одинакова во всех воркерах и меняется, если в тест добавили вопрос или вариант.
+    """
+    ids = ",".join(f"{q.id}:{'.'.join(str(o.id) for o in q.options)}" for q in questions)
+    return zlib.crc32(ids.encode())
+
+
+class TestSession:
+    """
+    Компактная запись о прохождении теста, которая хранится в данных FSM:
+    [test_id, версия вопросов, номер текущего вопроса, баллы, номер попытки, битовая маска отвеченных].
+    Сами вопросы берутся из общего кэша (Database.get_test_snapshot).
+    """
+
+    KEY = "test_session"
+    __slots__ = ("test_id", "version", "cursor", "score", "attempt_number", "answered")
+
+    def __init__(self, test_id: int, version: int, attempt_number: int, cursor: int = 0, score: int = 0,
+                 answered: int = 0):
+        self.test_id = test_id
+        self.version = version
+        self.cursor = cursor
+        self.score = score
+        self.attempt_number = attempt_number
+        self.answered = answered
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> Optional["TestSession"]:
+        record = data.get(cls.KEY)
+        if record is None:
+            return None
+        # Записи из пяти полей сохранены до появления маски отвеченных вопросов
+        test_id, version, cursor, score, attempt_number, *rest = record
+        return cls(test_id, version, attempt_number, cursor, score, rest[0] if rest else 0)
+
+    def to_data(self) -> Dict[str, Any]:
+        return {self.KEY: [self.test_id, self.version, self.cursor, self.score, self.attempt_number, self.answered]}
+
+    def is_answered(self) -> bool:
+        """Отвечен ли уже текущий вопрос."""
+        return bool(self.answered >> self.cursor & 1)
+
+    def record_answer(self, is_correct: bool) -> None:
+        """Учитывает ответ на текущий вопрос и переходит к следующему."""
+        self.answered |= 1 << self.cursor
+        self.score += int(is_correct)
+        self.cursor += 1
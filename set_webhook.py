@@ -7,9 +7,9 @@ async def set_webhook():
     bot = Bot(token=BOT_TOKEN)
     try:
         await bot.set_webhook(WEBHOOK_URL)
-        logger.info(f"Вебхук успешно установлен на: {WEBHOOK_URL}")
+        logger.info("Вебхук успешно установлен на: %s", WEBHOOK_URL)
     except Exception as e:
-        logger.error(f"Ошибка при установке вебхука: {e}")
+        logger.error("Ошибка при установке вебхука: %s", e)
     finally:
         await bot.session.close()
 
@@ -0,0 +1,155 @@
+import hashlib
+import random
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from file_types import is_photo_path
+
+# MinHash: 64 хеш-функции, разбитые на 16 полос по 4 значения.
+# При сходстве (Жаккар) 0.7 пара попадает в общую корзину с вероятностью ~99%,
+# при сходстве 0.3 — лишь ~12%, поэтому сравниваются почти только похожие ответы.
+NUM_PERM = 64
+TEXT_BANDS = 16
+TEXT_ROWS = NUM_PERM // TEXT_BANDS
+TEXT_THRESHOLD = 0.7
+SHINGLE_SIZE = 5
+# Короткие ответы («42», «да») совпадают у всех честно — их не сравниваем
+MIN_TEXT_LENGTH = 30
+
+# dHash изображений: 64 бита, 8 полос по 8 бит. Если хеши отличаются не более чем
+# в 7 битах, хотя бы одна полоса совпадёт целиком (принцип Дирихле), поэтому каждая пара
+# в пределах IMAGE_MAX_DISTANCE гарантированно попадёт в кандидаты.
+IMAGE_BANDS = 8
+IMAGE_MAX_DISTANCE = 6
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20240901)  # фиксированное зерно: подписи хранятся в базе
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+KIND_TEXT = "text"
+KIND_IMAGE = "image"
+
+
+class Fingerprint(NamedTuple):
+    kind: str
+    signature: bytes
+    buckets: List[int]  # номер корзины для каждой полосы LSH
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", text))
+
+
+def _bucket(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+
+def text_fingerprint(text: Optional[str]) -> Optional[Fingerprint]:
+    """MinHash-подпись текста по символьным 5-граммам (None для слишком коротких ответов)."""
+    normalized = _normalize(text or "")
+    if len(normalized) < MIN_TEXT_LENGTH:
+        return None
+
+    shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "big") for s in shingles]
+    signature = [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS]
+
+    packed = struct.pack(f">{NUM_PERM}I", *signature)
+    band_size = TEXT_ROWS * 4
+    buckets = [_bucket(bytes([band]) + packed[band * band_size:(band + 1) * band_size]) for band in range(TEXT_BANDS)]
+    return Fingerprint(KIND_TEXT, packed, buckets)
+
+
+def image_fingerprint(path: str) -> Optional[Fingerprint]:
+    """Разностный перцептивный хеш (dHash) изображения. Требует Pillow; без него возвращает None."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(path) as image:
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except (OSError, ValueError):
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+
+    packed = value.to_bytes(8, "big")
+    return Fingerprint(KIND_IMAGE, packed, image_buckets(packed))
+
+
+def image_buckets(packed: bytes) -> List[int]:
+    """Корзины LSH для dHash изображения (по одной на полосу)."""
+    band_size = 8 // IMAGE_BANDS
+    return [_bucket(bytes([band]) + packed[band * band_size:(band + 1) * band_size]) for band in range(IMAGE_BANDS)]
+
+
+def fingerprint_answer(answer_text: Optional[str], answer_file_path: Optional[str]) -> List[Fingerprint]:
+    """Собирает отпечатки ответа: текст целиком и каждое приложенное изображение."""
+    fingerprints = []
+    text = text_fingerprint(answer_text)
+    if text:
+        fingerprints.append(text)
+    for path in (answer_file_path or "").split(";"):
+        if path and is_photo_path(path) and Path(path).exists():
+            image = image_fingerprint(path)
+            if image:
+                fingerprints.append(image)
+    return fingerprints
+
+
+def similarity(kind: str, first: bytes, second: bytes) -> float:
+    """Оценка сходства двух подписей от 0 до 1."""
+    if kind == KIND_TEXT:
+        a = struct.unpack(f">{NUM_PERM}I", first)
+        b = struct.unpack(f">{NUM_PERM}I", second)
+        return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+    distance = bin(int.from_bytes(first, "big") ^ int.from_bytes(second, "big")).count("1")
+    return 1 - distance / 64
+
+
+def is_similar(kind: str, first: bytes, second: bytes) -> bool:
+    if kind == KIND_TEXT:
+        return similarity(kind, first, second) >= TEXT_THRESHOLD
+    return similarity(kind, first, second) >= 1 - IMAGE_MAX_DISTANCE / 64
+
+
+def find_clusters(candidates: Iterable[Tuple[int, int, str, bytes, bytes]]) -> List[Tuple[List[int], float]]:
+    """
+    Проверяет пары-кандидаты из корзин LSH и объединяет похожие ответы в группы.
+    candidates — (answer_id, answer_id, вид, подпись, подпись).
+    Возвращает [(id ответов группы, наибольшее сходство в группе)], самые похожие первыми.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    best: Dict[int, float] = {}
+    for first_id, second_id, kind, first, second in candidates:
+        if not is_similar(kind, first, second):
+            continue
+        score = similarity(kind, first, second)
+        root_a, root_b = find(first_id), find(second_id)
+        if root_a != root_b:
+            parent[root_b] = root_a
+        root = find(first_id)
+        best[root] = max(best.get(root_a, 0), best.get(root_b, 0), score)
+
+    groups: Dict[int, List[int]] = {}
+    for answer_id in parent:
+        groups.setdefault(find(answer_id), []).append(answer_id)
+    clusters = [(sorted(ids), best.get(root, 0)) for root, ids in groups.items() if len(ids) > 1]
+    return sorted(clusters, key=lambda cluster: -cluster[1])
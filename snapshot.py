@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from db import Database
+from config import DB_BUSY_TIMEOUT, logger
+
+
+class SnapshotDatabase(Database):
+    """
+    Копия базы только для чтения, на которой выполняются отчёты учителя.
+    Схему не проверяет и не изменяет: снимок перезаписывается целиком.
+    """
+
+    def __init__(self, db_path: Path, taken_at: datetime):
+        self.db_path = db_path
+        self.taken_at = taken_at
+
+    def get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=DB_BUSY_TIMEOUT)
+
+
+class ReportSnapshot:
+    """
+    Снимок рабочей базы для тяжёлых отчётов (выгрузка ответов, результаты тестов).
+
+    Процесс-лидер раз в interval секунд копирует базу через backup API SQLite порциями
+    по pages страниц с паузами, так что запись учеников не ждёт копирования. Копия пишется
+    во временный файл и атомарно подменяет прежний снимок; время снимка — mtime файла.
+    Читать снимок может любой воркер. Если снимка нет или он старше max_age (лидер
+    остановился), отчёты читают рабочую базу.
+    """
+
+    def __init__(self, db: Database, snapshot_path: Path, interval: float = 300.0, pages: int = 256,
+                 step_sleep: float = 0.05, max_age: Optional[float] = None):
+        self.db = db
+        self.snapshot_path = Path(snapshot_path)
+        self.interval = interval
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.max_age = max_age if max_age is not None else interval * 3
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def reader(self) -> Tuple[Database, Optional[datetime]]:
+        """Возвращает базу для отчётов и время снимка (None — данные из рабочей базы)."""
+        try:
+            mtime = self.snapshot_path.stat().st_mtime
+        except OSError:
+            return self.db, None
+        if time.time() - mtime > self.max_age:
+            return self.db, None
+        taken_at = datetime.fromtimestamp(mtime)
+        return SnapshotDatabase(self.snapshot_path, taken_at), taken_at
+
+    def take(self) -> None:
+        """Делает снимок рабочей базы."""
+        started = time.time()
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        source = self.db.get_connection()
+        target = sqlite3.connect(tmp_path)
+        try:
+            # Открытая читающая транзакция фиксирует версию базы на время копирования: в режиме WAL
+            # она не мешает записи, а копирование не начинается заново после каждого чужого коммита
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=self.pages, sleep=self.step_sleep)
+        finally:
+            target.close()
+            source.close()
+        # Время снимка — начало копирования: всё, что записано позже, в него может не попасть
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, self.snapshot_path)
+        logger.info("Снимок базы для отчётов обновлён за %.1f с", time.time() - started)
+
+    def start(self) -> None:
+        """Запускает фоновое обновление снимка."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-snapshot", daemon=True)
+        self._thread.start()
+        logger.info("Обновление снимка для отчётов запущено")
+
+    def shutdown(self) -> None:
+        """Останавливает фоновое обновление снимка."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info("Обновление снимка для отчётов остановлено")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.take()
+            except Exception as e:
+                logger.error("Ошибка при создании снимка базы: %s", e)
+            self._stop.wait(self.interval)
@@ -6,6 +6,10 @@ class RegisterStates(StatesGroup):
     last_name = State()   # Ввод фамилии
     class_number = State()  # Ввод номера класса
 
+class ImportStudentsStates(StatesGroup):
+    """Состояния для импорта списка учеников из CSV."""
+    file = State()  # Ожидание CSV-файла
+
 class NewTaskStates(StatesGroup):
     """Состояния для создания нового задания."""
     title = State()         # Ввод заголовка
@@ -37,6 +41,10 @@ class NewTestStates(StatesGroup):
     correct_text_answer = State()  # Ввод правильного текстового ответа
     add_more_question = State()   # Решение о добавлении ещё вопроса
 
+class ImportTestStates(StatesGroup):
+    """Состояния для импорта теста из файла."""
+    file = State()  # Ожидание файла теста (JSON, YAML или ZIP)
+
 class TestStates(StatesGroup):
     """Состояния для прохождения теста."""
     select_test = State()  # Выбор теста
@@ -1,18 +1,19 @@
 from aiogram import Bot
-from aiogram.types import FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import logger, ADMIN_ID
+from file_io import file_io
 from pathlib import Path
+from datetime import datetime
 from typing import Optional, List, Tuple
-import os
+from file_types import is_photo_path
 
 async def download_file(bot: Bot, file_id: str, dest_dir: Path, file_name: str) -> str:
-    """Скачивает файл из Telegram и возвращает путь к нему."""
+    """Скачивает файл из Telegram и возвращает путь к нему (запись на диск — в файловом пуле)."""
     file = await bot.get_file(file_id)
-    os.makedirs(dest_dir, exist_ok=True)
+    await file_io.makedirs(dest_dir)
     file_path = dest_dir / file_name
-    await bot.download_file(file.file_path, file_path)
-    logger.info(f"Скачан файл: {file_path}")
+    await file_io.download(bot, file.file_path, file_path)
+    logger.info("Скачан файл: %s", file_path)
     return str(file_path)
 
 async def download_photo(bot: Bot, photo_id: str, dest_dir: Path, suffix: str = "") -> str:
@@ -28,13 +29,13 @@ async def download_document(bot: Bot, document_id: str, document_name: str, dest
 async def send_file_message(bot: Bot, chat_id: int, file_path: str, caption: Optional[str] = None) -> None:
     """Отправляет файл (фото или документ) с подписью."""
     try:
-        if file_path.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-            await bot.send_photo(chat_id=chat_id, photo=FSInputFile(file_path), caption=caption)
+        if is_photo_path(file_path):
+            await bot.send_photo(chat_id=chat_id, photo=file_io.input_file(file_path), caption=caption)
         else:
-            await bot.send_document(chat_id=chat_id, document=FSInputFile(file_path), caption=caption)
-        logger.info(f"Отправлен файл {file_path} в чат {chat_id}")
+            await bot.send_document(chat_id=chat_id, document=file_io.input_file(file_path), caption=caption)
+        logger.info("Отправлен файл %s в чат %s", file_path, chat_id, extra={"chat_id": chat_id})
     except Exception as e:
-        logger.error(f"Ошибка отправки файла {file_path} в чат {chat_id}: {e}")
+        logger.error("Ошибка отправки файла %s в чат %s: %s", file_path, chat_id, e)
         await bot.send_message(chat_id=chat_id, text=f"Ошибка загрузки файла: {e}")
 
 async def send_message_with_buttons(bot: Bot, chat_id: int, text: str, buttons: List[Tuple[str, str]]) -> None:
@@ -44,7 +45,13 @@ async def send_message_with_buttons(bot: Bot, chat_id: int, text: str, buttons:
         keyboard.button(text=button_text, callback_data=callback_data)
     keyboard.adjust(2)
     await bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard.as_markup())
-    logger.info(f"Отправлено сообщение с кнопками в чат {chat_id}")
+    logger.info("Отправлено сообщение с кнопками в чат %s", chat_id)
+
+def snapshot_note(as_of: Optional[datetime]) -> str:
+    """Подпись к отчёту, построенному по снимку базы (пустая, если данные из рабочей базы)."""
+    if as_of is None:
+        return ""
+    return f"\n\n🕒 Данные на {as_of.strftime('%d.%m.%Y %H:%M')}"
 
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором."""